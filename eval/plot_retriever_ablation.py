@@ -34,7 +34,7 @@ from_local = args.from_local
 # depth = args.depth
 # size = args.size
 # get evaluation data from the specified output directory and method subdirectory
-df = get_evaluation_data(output_dir, method, dataset, from_local)
+df = get_evaluation_data(output_dir, method, dataset, from_local, include_interactions=True)
 # # filter by depth and size
 # df = df[(df['_depth'] == depth) & (df['_size'] == size)]
 
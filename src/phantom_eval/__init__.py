@@ -34,6 +34,12 @@ def get_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         "--react_max_steps", type=int, default=50, help="Maximum number of steps for the ReAct/Act agent"
     )
+    parser.add_argument(
+        "--react_merge_thought_action",
+        action="store_true",
+        help="Flag for the ReAct agent to generate the thought and action of each step in one LLM call, "
+        "which stops at 'Observation'",
+    )
     parser.add_argument(
         "--sc_num_votes",
         type=int,
@@ -66,7 +72,25 @@ def get_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="Whether to convert LLM output to Prolog queries and execute them. "
         "NOTE: Only implemented for n-shot agents. "
-        "NOTE: Can only evaluate one split at a time due to Prolog database limitations",
+        "NOTE: Each split gets its own Prolog worker processes, so several splits can be evaluated",
+    )
+    parser.add_argument(
+        "--prolog_num_workers",
+        type=int,
+        default=4,
+        help="Number of worker processes that execute Prolog queries concurrently",
+    )
+    parser.add_argument(
+        "--prolog_timeout",
+        type=float,
+        default=10.0,
+        help="Seconds after which a Prolog query is killed",
+    )
+    parser.add_argument(
+        "--prolog_inference_limit",
+        type=int,
+        default=10_000_000,
+        help="Maximum number of logical inferences per Prolog query",
     )
 
     # LLM inference params
@@ -119,6 +143,47 @@ def get_parser() -> argparse.ArgumentParser:
         "To determine your usage tier, you can check on the console page of your specific LLM provider. "
         "See README.md for links to the console pages.",
     )
+    parser.add_argument(
+        "--inf_max_concurrency",
+        type=int,
+        default=32,
+        help="Maximum number of concurrent API calls, with or without rate limits. "
+        "The number of concurrent calls starts at 4 and adapts to the provider's throttling "
+        "up to this value.",
+    )
+    parser.add_argument(
+        "--inf_rate_limit_utilization",
+        type=float,
+        default=1.0,
+        help="Fraction of the rate limits to use when enforcing them, e.g. 0.95 to leave some headroom",
+    )
+    parser.add_argument(
+        "--inf_rate_limit_state_fpath",
+        type=str,
+        default=None,
+        help="Path to a file that tracks the rate limits, to share them across several evaluation "
+        "processes that use the same API key and model. If None, each process tracks its own rate limits",
+    )
+    parser.add_argument(
+        "--inf_cache_path",
+        type=str,
+        default=None,
+        help="Path to a SQLite database that caches the LLM responses across runs, "
+        "keyed on the model, the prompt and the inference generation config (including the seed). "
+        "If None, responses are not cached",
+    )
+    parser.add_argument(
+        "--inf_cache_max_size_mb",
+        type=float,
+        default=1024,
+        help="Maximum size of the LLM response cache in MB, the least recently used responses are evicted",
+    )
+    parser.add_argument(
+        "--inf_cache_nonzero_temperature",
+        action="store_true",
+        help="Flag to also cache responses sampled with a nonzero temperature. "
+        "NOTE: self-consistency methods would then get the same response for each vote",
+    )
     parser.add_argument(
         "--inf_llms_rpm_tpm_config_fpath",
         type=str,
@@ -129,7 +194,8 @@ def get_parser() -> argparse.ArgumentParser:
         "--inf_vllm_offline",
         action="store_true",
         help="Flag to use vLLM (batched) offline inference, "
-        "which can be substantially faster than using the server when supported by the method",
+        "which can be substantially faster than using the server. "
+        "For multi-turn methods like react, the steps of all questions are generated in one batch",
     )
 
     # Dataset params
@@ -176,6 +242,17 @@ def get_parser() -> argparse.ArgumentParser:
     )
     # Saving params
     parser.add_argument("--output_dir", "-od", default="out", help="Path to read/write the outputs")
+    parser.add_argument(
+        "--pred_format",
+        type=str.lower,
+        default="json",
+        choices=["json", "parquet"],
+        help="Format of the saved predictions. "
+        "'json' saves one JSON file per batch to {output_dir}/preds/{method}/, "
+        "'parquet' appends to a Parquet dataset at {output_dir}/preds_parquet/{method}/ "
+        "partitioned by model, split and seed, with the agent interactions saved separately "
+        "(see phantom_eval.pred_store)",
+    )
     parser.add_argument(
         "--log_level",
         default="INFO",
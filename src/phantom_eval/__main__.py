@@ -3,20 +3,21 @@ import asyncio
 import json
 import logging
 import math
+import os
 import tempfile
-from copy import deepcopy
+from collections.abc import Awaitable
 from pathlib import Path
 
 import pandas as pd
 
-from phantom_wiki.facts.database import Database
-
 from . import constants, get_parser
 from ._types import Conversation, LLMChatResponse
 from .agents import get_agent
 from .agents.common import Agent
 from .llm import InferenceGenerationConfig, LLMChat, get_llm
-from .prolog_utils import get_prolog_results
+from .llm.response_cache import CachedLLMChat, LLMResponseCache
+from .pred_store import get_pred_parquet_path, write_preds_parquet
+from .prolog_utils import PrologQueryPool, aget_prolog_results
 from .prompts import (
     ACT_EXAMPLES,
     COT_EXAMPLES,
@@ -38,8 +39,7 @@ def get_model_kwargs(args: argparse.Namespace) -> dict:
             model_kwargs = dict(
                 max_model_len=args.inf_vllm_max_model_len,
                 tensor_parallel_size=args.inf_vllm_tensor_parallel_size,
-                use_api=not args.inf_vllm_offline
-                or args.method in ["react", "act", "react->cot-sc", "cot-sc->react"],
+                use_api=not args.inf_vllm_offline,
                 lora_path=args.inf_vllm_lora_path,
                 port=args.inf_vllm_port,
             )
@@ -48,10 +48,24 @@ def get_model_kwargs(args: argparse.Namespace) -> dict:
                 usage_tier=args.inf_usage_tier,
                 enforce_rate_limits=not args.inf_relax_rate_limits,
                 llms_rpm_tpm_config_fpath=args.inf_llms_rpm_tpm_config_fpath,
+                max_concurrency=args.inf_max_concurrency,
+                rate_limit_utilization=args.inf_rate_limit_utilization,
+                rate_limit_state_fpath=args.inf_rate_limit_state_fpath,
             )
     return model_kwargs
 
 
+def get_model_id(args: argparse.Namespace) -> str:
+    """Get the identity of the model in the response cache, e.g. 'vllm:meta-llama/Llama-3.1-8B-Instruct'
+
+    The LoRA adapter is part of the identity, so that it does not share cached responses with the base model.
+    """
+    model_id = f"{args.server}:{args.model_name}"
+    if args.server == "vllm" and args.inf_vllm_lora_path:
+        model_id += f":lora_path={args.inf_vllm_lora_path}"
+    return model_id
+
+
 def get_agent_kwargs(args: argparse.Namespace) -> dict:
     match args.method:
         case "zeroshot":
@@ -113,6 +127,7 @@ def get_agent_kwargs(args: argparse.Namespace) -> dict:
             agent_kwargs = dict(
                 max_steps=args.react_max_steps,
                 react_examples=REACT_EXAMPLES,
+                merge_thought_action=args.react_merge_thought_action,
             )
         case "act":
             agent_kwargs = dict(
@@ -124,6 +139,7 @@ def get_agent_kwargs(args: argparse.Namespace) -> dict:
             agent_kwargs = dict(
                 max_steps=args.react_max_steps,
                 react_examples=REACT_EXAMPLES,
+                merge_thought_action=args.react_merge_thought_action,
                 cot_llm_prompt=get_llm_prompt("cot-sc", args.model_name),
                 cot_examples=COT_EXAMPLES,
                 num_votes=args.sc_num_votes,
@@ -142,6 +158,7 @@ def get_agent_kwargs(args: argparse.Namespace) -> dict:
                 react_llm_prompt=get_llm_prompt("react", args.model_name),
                 max_steps=args.react_max_steps,
                 react_examples=REACT_EXAMPLES,
+                merge_thought_action=args.react_merge_thought_action,
             )
         case _:
             agent_kwargs = dict()
@@ -152,6 +169,14 @@ async def main(args: argparse.Namespace) -> None:
     logger.info(f"Loading LLM='{args.model_name}'")
     model_kwargs = get_model_kwargs(args)
     llm_chat: LLMChat = get_llm(args.server, args.model_name, model_kwargs=model_kwargs)
+    if args.inf_cache_path is not None:
+        cache = LLMResponseCache(args.inf_cache_path, max_size_mb=args.inf_cache_max_size_mb)
+        llm_chat = CachedLLMChat(
+            llm_chat,
+            cache,
+            cache_nonzero_temperature=args.inf_cache_nonzero_temperature,
+            model_id=get_model_id(args),
+        )
     llm_prompt: LLMPrompt = get_llm_prompt(args.method, args.model_name)
     default_inf_gen_config = InferenceGenerationConfig(
         max_tokens=args.inf_max_tokens,
@@ -163,6 +188,8 @@ async def main(args: argparse.Namespace) -> None:
         wait_seconds=args.inf_wait_seconds,
     )
 
+    # Splits whose Prolog queries are still being executed
+    finishing_splits: list[asyncio.Task] = []
     for seed in args.inf_seed_list:
         logger.info(f"Running inference for method='{args.method}' with {seed=}")
         for split in args.split_list:
@@ -185,22 +212,26 @@ async def main(args: argparse.Namespace) -> None:
                 agent_kwargs=agent_kwargs,
             )
 
+            # Batches whose predictions are saved once their Prolog queries have been executed
+            pending_saves: list[asyncio.Task] = []
             if args.prolog_query:
                 logger.info("Loading Prolog database")
-                # Create temporary file and load database from disk
-                with tempfile.NamedTemporaryFile(mode="w", suffix=".pl") as tmp:
-                    content = dataset["database"]["content"]
-                    tmp.write("\n".join(content))
-                    tmp.flush()
-                    db = Database.from_disk(tmp.name)
+                # Write the database to a temporary file, which the query workers load from disk
+                db_dir = tempfile.TemporaryDirectory()
+                db_path = os.path.join(db_dir.name, "database.pl")
+                with open(db_path, "w") as f:
+                    f.write("\n".join(dataset["database"]["content"]))
+                prolog_pool = PrologQueryPool(
+                    db_path,
+                    num_workers=args.prolog_num_workers,
+                    timeout=args.prolog_timeout,
+                    inference_limit=args.prolog_inference_limit,
+                )
+                await prolog_pool.start()
 
             num_df_qa_pairs = len(df_qa_pairs)
-            if args.inf_vllm_offline and args.method not in [
-                "react",
-                "act",
-                "react->cot-sc",
-                "cot-sc->react",
-            ]:
+            if args.inf_vllm_offline:
+                # NOTE: the steps of the react-based agents are batched as well, see `VLLMChat`
                 batch_size = num_df_qa_pairs
             else:
                 if args.batch_number is not None:
@@ -224,7 +255,17 @@ async def main(args: argparse.Namespace) -> None:
                     + f"__bn={batch_number}"
                     + f"__seed={seed}"
                 )
-                pred_path = Path(args.output_dir) / "preds" / args.method / f"{run_name}.json"
+                if args.pred_format == "parquet":
+                    pred_path = get_pred_parquet_path(
+                        args.output_dir,
+                        args.method,
+                        args.model_name,
+                        split,
+                        seed,
+                        f"bs={batch_size}__bn={batch_number}" + lora_run_name,
+                    )
+                else:
+                    pred_path = Path(args.output_dir) / "preds" / args.method / f"{run_name}.json"
 
                 # Skip if the batch number is not the one specified
                 if (args.batch_number is not None) and (batch_number != args.batch_number):
@@ -275,7 +316,8 @@ async def main(args: argparse.Namespace) -> None:
                         # Run all agents in parallel using asyncio.gather
                         responses: list[LLMChatResponse] = []
                         inf_gen_config = default_inf_gen_config.model_copy(update=dict(seed=seed), deep=True)
-                        agents = [deepcopy(agent) for _ in range(batch_size)]
+                        # The agents share the text corpus and indices, and only have their own conversation
+                        agents = [agent.new_episode() for _ in range(batch_size)]
                         responses = await asyncio.gather(
                             *[
                                 agent.run(
@@ -289,13 +331,9 @@ async def main(args: argparse.Namespace) -> None:
                         agent_interactions: list[Conversation] = [
                             agent.agent_interactions for agent in agents
                         ]
-
-                # Process Prolog queries if needed
-                prolog_results = []
-                if args.prolog_query:
-                    prolog_results = get_prolog_results(
-                        responses, db, logger, args.log_level.upper() == "DEBUG"
-                    )
+                if hasattr(llm_chat, "log_throughput"):
+                    # Report the achieved RPM/TPM so far, to tune the rate limits config file
+                    llm_chat.log_throughput()
 
                 # Log the final answers for the batch
                 pred_path.parent.mkdir(parents=True, exist_ok=True)
@@ -307,7 +345,7 @@ async def main(args: argparse.Namespace) -> None:
                 for kw in unsaveable_agent_kwargs:
                     agent_kwargs_to_save.pop(kw, None)
 
-                save_preds(
+                save_args = (
                     pred_path,
                     split,
                     inf_gen_config,
@@ -317,9 +355,47 @@ async def main(args: argparse.Namespace) -> None:
                     batch_number,
                     batch_df_qa_pairs,
                     responses,
-                    prolog_results=prolog_results if args.prolog_query else None,
-                    interactions=agent_interactions if not args.ignore_agent_interactions else [],
                 )
+                interactions = agent_interactions if not args.ignore_agent_interactions else []
+                if args.prolog_query:
+                    # Execute the Prolog queries in the background, so that they overlap with
+                    # the inference for the next batch
+                    prolog_results = aget_prolog_results(
+                        responses, prolog_pool, logger, args.log_level.upper() == "DEBUG"
+                    )
+                    pending_saves.append(
+                        asyncio.create_task(
+                            save_preds_after_prolog(
+                                *save_args, prolog_results=prolog_results, interactions=interactions
+                            )
+                        )
+                    )
+                else:
+                    save_preds(*save_args, interactions=interactions)
+
+            if args.prolog_query:
+                # Let the remaining Prolog queries of this split overlap with the next split
+                finishing_splits.append(
+                    asyncio.create_task(finish_split_after_prolog(pending_saves, prolog_pool, db_dir))
+                )
+
+    await asyncio.gather(*finishing_splits)
+
+
+async def finish_split_after_prolog(
+    pending_saves: list[asyncio.Task], prolog_pool: PrologQueryPool, db_dir: tempfile.TemporaryDirectory
+) -> None:
+    """Waits for the batches of a split to be saved, then stops its Prolog workers."""
+    try:
+        await asyncio.gather(*pending_saves)
+    finally:
+        await prolog_pool.close()
+        db_dir.cleanup()
+
+
+async def save_preds_after_prolog(*args, prolog_results: Awaitable[list[dict]], **kwargs) -> None:
+    """Waits for the Prolog results of a batch, then saves its predictions (see `save_preds`)."""
+    save_preds(*args, prolog_results=await prolog_results, **kwargs)
 
 
 def save_preds(
@@ -373,20 +449,18 @@ def save_preds(
             "usage": responses[i].usage,
         }
 
-    with open(pred_path, "w") as f:
-        json.dump(preds, f, indent=4)
-        f.flush()
+    if args.pred_format == "parquet":
+        write_preds_parquet(preds, pred_path)
+    else:
+        with open(pred_path, "w") as f:
+            json.dump(preds, f, indent=4)
+            f.flush()
 
 
 if __name__ == "__main__":
     parser = get_parser()
     args = parser.parse_args()
     setup_logging(args.log_level)
-    if args.prolog_query:
-        assert len(args.split_list) == 1, (
-            "When prolog_query is true, we can only evaluate one split at a time since only one Prolog "
-            "database can be in memory at any given time due to limitations with pyswip"
-        )
     if args.method in ["zeroshot-rag", "fewshot-rag", "cot-rag"]:
         if args.retrieval_method in ["bm25", "dense"]:
             assert (
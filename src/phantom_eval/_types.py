@@ -11,6 +11,9 @@ from pydantic import BaseModel, Field
 class ContentTextMessage(BaseModel):
     type: str = "text"
     text: str
+    # Whether the conversation up to and including this text is a prefix shared by many conversations,
+    # e.g. the evidence in the prompt, which LLM providers should cache
+    cache_control: bool = False
 
 
 class Message(BaseModel):
@@ -5,6 +5,7 @@ This module provides common agent components for phantom_eval including:
 - `SCMixin` for self-consistency voting across multiple predictions
 - `CustomEmbeddings` wrapper for model embeddings via local OpenAI API
 - `RAGMixin` for retrieval-augmented generation
+- `CorpusIndex` for the article lookups and searches of agentic methods
 - Utility functions for evidence retrieval and Reasoning LLM names
 
 The agents derived from `Agent` class can run evaluations on single question at a time or batches
@@ -12,7 +13,11 @@ using different LLM prompts and chat interfaces.
 """
 
 import abc
+import bisect
+import copy
+import itertools
 import logging
+import re
 import subprocess
 from collections import Counter
 from pprint import pformat
@@ -23,7 +28,7 @@ from flashrag.retriever import BM25Retriever, DenseRetriever
 from langchain_community.vectorstores import FAISS
 from langchain_core.embeddings import Embeddings
 
-from phantom_eval._types import Conversation, LLMChatResponse
+from phantom_eval._types import ContentTextMessage, Conversation, LLMChatResponse, Message
 from phantom_eval.gpu_utils import get_gpu_count
 from phantom_eval.llm import InferenceGenerationConfig, LLMChat, aggregate_usage
 from phantom_eval.prompts import LLMPrompt
@@ -38,8 +43,13 @@ class Agent(abc.ABC):
     using the specified `LLMPrompt` and `LLMChat` objects.
 
     The agent can be run on a single question or on a batch of questions.
+    To run the agent on several questions concurrently, create an agent per question with `new_episode`.
     """
 
+    # Attributes that are not modified while running the agent, so copies of the agent share them
+    # instead of copying them for every question
+    shared_attributes: tuple[str, ...] = ("text_corpus", "llm_prompt")
+
     def __init__(self, text_corpus: pd.DataFrame, llm_prompt: LLMPrompt):
         """
         Args:
@@ -91,6 +101,53 @@ class Agent(abc.ABC):
         The prompt may depend on the agent's internal state.
         """
 
+    def __deepcopy__(self, memo: dict) -> "Agent":
+        """
+        Deep copy the agent, except for the attributes in `shared_attributes` (e.g. the text corpus).
+        """
+        for name in self.shared_attributes:
+            if name in self.__dict__:
+                value = self.__dict__[name]
+                memo[id(value)] = value
+        agent = self.__class__.__new__(self.__class__)
+        memo[id(self)] = agent
+        for name, value in self.__dict__.items():
+            agent.__dict__[name] = copy.deepcopy(value, memo)
+        return agent
+
+    def new_episode(self) -> "Agent":
+        """
+        Returns a copy of the agent in its initial state, e.g. to run the agent on another question.
+        The copy shares the resources of this agent (see `shared_attributes`) and only has its own state.
+        """
+        agent = copy.deepcopy(self)
+        agent.reset()
+        return agent
+
+    def _get_prompt_prefix(self) -> str:
+        """
+        Returns the beginning of the agent prompt that is the same for all questions, or "" if there is none.
+        """
+        return ""
+
+    def _build_agent_conversation(self, question: str) -> Conversation:
+        """
+        Builds a conversation with 1 user message containing the agent prompt for the given question.
+
+        The prompt prefix shared by all questions (see `_get_prompt_prefix`) is a separate content block
+        marked with `cache_control`, so that LLM providers can cache it across questions.
+        """
+        prompt = self._build_agent_prompt(question)
+        prefix = self._get_prompt_prefix()
+        if prefix and prompt.startswith(prefix):
+            content = [
+                ContentTextMessage(text=prefix, cache_control=True),
+                ContentTextMessage(text=prompt.removeprefix(prefix)),
+            ]
+        else:
+            content = [ContentTextMessage(text=prompt)]
+        return Conversation(messages=[Message(role="user", content=content)])
+
     def reset(self) -> None:
         """
         Reset the agent to its initial state.
@@ -331,6 +388,76 @@ class RAGMixin:
         return "\n================\n\n".join(docs)
 
 
+class CorpusIndex:
+    """
+    Index of the text corpus for the RetrieveArticle and Search actions of agentic methods (e.g. react).
+
+    Articles are retrieved from a hash map of the lowercase titles. A search finds the lowercase attribute
+    in the concatenation of the lowercase articles, which is one substring scan instead of lowercasing
+    and scanning each article for every action. The search results are memoized, since many agents
+    search for the same attributes.
+
+    The index is read-only, so copies of an agent (e.g. with `deepcopy`) share it.
+    """
+
+    # Separates the articles in the concatenated corpus, so that a match cannot span two articles
+    ARTICLE_SEP = "\x00"
+    # Searches for attributes with these characters fall back to regex matching, like `pd.Series.str.contains`
+    REGEX_METACHARACTERS = set(".^$*+?{}[]\\|()")
+
+    def __init__(self, text_corpus: pd.DataFrame):
+        """
+        Args:
+            text_corpus (pd.DataFrame): The text corpus to index.
+                Must contain two columns: 'title' and 'article'.
+        """
+        self.titles: list[str] = text_corpus["title"].tolist()
+        self.article_by_title: dict[str, str] = {}
+        for title, article in zip(self.titles, text_corpus["article"]):
+            # Keep the first article if several articles have the same title
+            self.article_by_title.setdefault(title.lower(), article)
+
+        self.lowercase_articles: list[str] = text_corpus["article"].str.lower().tolist()
+        self.corpus = self.ARTICLE_SEP.join(self.lowercase_articles)
+        # Offset of each article in the concatenated corpus
+        self.offsets: list[int] = list(
+            itertools.accumulate((len(article) + 1 for article in self.lowercase_articles[:-1]), initial=0)
+        )
+        self._search_results: dict[str, list[str]] = {}
+
+    def __deepcopy__(self, memo: dict) -> "CorpusIndex":
+        return self
+
+    def get_article(self, title: str) -> str | None:
+        """
+        Returns the article with the given title (case-insensitive), or None if there is no such article.
+        """
+        return self.article_by_title.get(title.lower())
+
+    def search(self, attribute: str) -> list[str]:
+        """
+        Returns the titles of all articles that contain the attribute (case-insensitive).
+        Like `pd.Series.str.contains`, the attribute is a regular expression.
+        """
+        query = attribute.lower()
+        if query not in self._search_results:
+            if self.REGEX_METACHARACTERS.intersection(query) or self.ARTICLE_SEP in query:
+                pattern = re.compile(query)
+                indices = [i for i, article in enumerate(self.lowercase_articles) if pattern.search(article)]
+            else:
+                indices = []
+                start = self.corpus.find(query) if self.titles else -1
+                while start != -1:
+                    i = bisect.bisect_right(self.offsets, start) - 1
+                    indices.append(i)
+                    if i + 1 == len(self.offsets):
+                        break
+                    # Continue with the next article
+                    start = self.corpus.find(query, self.offsets[i + 1])
+            self._search_results[query] = [self.titles[i] for i in indices]
+        return self._search_results[query]
+
+
 def get_all_evidence(text_corpus: pd.DataFrame) -> str:
     """
     Return all articles in the text corpus concatenated as a string.
@@ -338,6 +465,21 @@ def get_all_evidence(text_corpus: pd.DataFrame) -> str:
     return "\n================\n\n".join(text_corpus["article"])
 
 
+# Placeholder for the question when formatting a prompt, to split the prompt into the parts before and
+# after the question
+QUESTION_PLACEHOLDER = "<<<QUESTION>>>"
+
+
+def split_prompt_at_question(prompt: str) -> tuple[str, str]:
+    """
+    Split a prompt formatted with `QUESTION_PLACEHOLDER` as the question into the parts before and after
+    the question.
+    """
+    # NOTE: the question comes after the evidence, so split at the last occurrence of the placeholder
+    prefix, suffix = prompt.rsplit(QUESTION_PLACEHOLDER, 1)
+    return prefix, suffix
+
+
 def parse_prolog_query(pred: str) -> str:
     """
     Parse the prolog query from the prediction.
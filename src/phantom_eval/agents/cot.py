@@ -15,7 +15,15 @@ import pandas as pd
 
 import phantom_eval.constants as constants
 from phantom_eval._types import ContentTextMessage, Conversation, LLMChatResponse, Message
-from phantom_eval.agents.common import Agent, RAGMixin, SCMixin, get_all_evidence, parse_prolog_query
+from phantom_eval.agents.common import (
+    QUESTION_PLACEHOLDER,
+    Agent,
+    RAGMixin,
+    SCMixin,
+    get_all_evidence,
+    parse_prolog_query,
+    split_prompt_at_question,
+)
 from phantom_eval.llm import InferenceGenerationConfig, LLMChat
 from phantom_eval.prompts import LLMPrompt
 
@@ -47,15 +55,30 @@ class CoTAgent(Agent):
         super().__init__(text_corpus, llm_prompt)
         self.cot_examples = cot_examples
         self.prolog_query = prolog_query
+        self._prompt_parts: tuple[str, str] | None = None
 
     def combine_evidence_and_question(self, evidence: str, question: str) -> str:
         return self.llm_prompt.get_prompt(prolog_query=self.prolog_query).format(
             evidence=evidence, examples=self.cot_examples, question=question
         )
 
+    def _get_prompt_parts(self) -> tuple[str, str]:
+        """
+        Returns the parts of the agent prompt before and after the question.
+        The evidence is the whole text corpus, so the parts are built once and reused for all questions.
+        """
+        if self._prompt_parts is None:
+            evidence = get_all_evidence(self.text_corpus)
+            prompt = self.combine_evidence_and_question(evidence, QUESTION_PLACEHOLDER)
+            self._prompt_parts = split_prompt_at_question(prompt)
+        return self._prompt_parts
+
+    def _get_prompt_prefix(self) -> str:
+        return self._get_prompt_parts()[0]
+
     def _build_agent_prompt(self, question: str) -> str:
-        evidence = get_all_evidence(self.text_corpus)
-        return self.combine_evidence_and_question(evidence, question)
+        prefix, suffix = self._get_prompt_parts()
+        return prefix + question + suffix
 
     async def run(
         self,
@@ -68,8 +91,7 @@ class CoTAgent(Agent):
         logger.debug(f"\n\t>>> question: {question}\n")
 
         # Create a conversation with 1 user prompt and initialize agent interactions
-        prompt = self._build_agent_prompt(question)
-        conv = Conversation(messages=[Message(role="user", content=[ContentTextMessage(text=prompt)])])
+        conv = self._build_agent_conversation(question)
         self.agent_interactions = conv
 
         # Generate response
@@ -104,11 +126,7 @@ class CoTAgent(Agent):
         logger.debug(f"\n\t>>> questions: {questions}\n")
 
         # Create a conversation for each user prompt, and initialize agent interactions
-        prompts: list[str] = [self._build_agent_prompt(question) for question in questions]
-        convs = [
-            Conversation(messages=[Message(role="user", content=[ContentTextMessage(text=prompt)])])
-            for prompt in prompts
-        ]
+        convs: list[Conversation] = [self._build_agent_conversation(question) for question in questions]
         self.agent_interactions = convs
 
         # Generate response
@@ -268,6 +286,10 @@ class CoTRAGAgent(CoTAgent, RAGMixin):
             corpus_path,
         )
 
+    def _get_prompt_prefix(self) -> str:
+        # The retrieved evidence depends on the question, so the prompts do not share a prefix
+        return ""
+
     def _build_agent_prompt(self, question):
         evidence = self.get_RAG_evidence(question)
         return self.combine_evidence_and_question(evidence, question)
@@ -17,7 +17,7 @@ import pandas as pd
 
 import phantom_eval.constants as constants
 from phantom_eval._types import ContentTextMessage, Conversation, LLMChatResponse, Message
-from phantom_eval.agents.common import Agent
+from phantom_eval.agents.common import Agent, CorpusIndex
 from phantom_eval.agents.cot import CoTSCAgent
 from phantom_eval.llm import InferenceGenerationConfig, LLMChat, aggregate_usage
 from phantom_eval.prompts import LLMPrompt
@@ -25,6 +25,11 @@ from phantom_eval.prompts import LLMPrompt
 logger = logging.getLogger(__name__)
 
 
+# Placeholder for the scratchpad when formatting the react prompt, to split the prompt into the parts before
+# and after the scratchpad
+SCRATCHPAD_PLACEHOLDER = "<<<SCRATCHPAD>>>"
+
+
 def format_pred(pred: str) -> str:
     """
     Format the prediction by stripping newlines and spaces.
@@ -40,12 +45,15 @@ class ReactAgent(Agent):
     The agent then observes the result of the action and updates the conversation history.
     """
 
+    shared_attributes = Agent.shared_attributes + ("corpus_index",)
+
     def __init__(
         self,
         text_corpus: pd.DataFrame,
         llm_prompt: LLMPrompt,
         max_steps: int = 6,
         react_examples: str = "",
+        merge_thought_action: bool = False,
     ):
         """
         Args:
@@ -56,10 +64,15 @@ class ReactAgent(Agent):
                 Defaults to 6.
             react_examples (str): Prompt examples to include in agent prompt.
                 Defaults to "".
+            merge_thought_action (bool): Whether to generate the thought and action of each step
+                in one LLM call, which stops at "Observation". This halves the number of LLM calls.
+                Defaults to False.
         """
         super().__init__(text_corpus, llm_prompt)
         self.max_steps = max_steps
         self.react_examples = react_examples
+        self.merge_thought_action = merge_thought_action
+        self.corpus_index = CorpusIndex(text_corpus)
 
         self.reset()
 
@@ -67,13 +80,37 @@ class ReactAgent(Agent):
         self.step_round = 1
         self.finished = False
         self.scratchpad: str = ""
+        # The thoughts, actions and observations in the scratchpad
+        self.scratchpad_steps: list[str] = []
         self.agent_interactions: Conversation = Conversation(messages=[])
+        self._prompt_parts: tuple[str, str] | None = None
 
     def _build_agent_prompt(self, question: str) -> str:
         return self.llm_prompt.get_prompt().format(
             examples=self.react_examples, question=question, scratchpad=self.scratchpad
         )
 
+    def _get_prompt_parts(self, question: str) -> tuple[str, str]:
+        """
+        Returns the parts of the agent prompt before and after the scratchpad.
+        The parts only depend on the question, so they are built once.
+        """
+        if self._prompt_parts is None:
+            prompt = self.llm_prompt.get_prompt().format(
+                examples=self.react_examples, question=question, scratchpad=SCRATCHPAD_PLACEHOLDER
+            )
+            prefix, suffix = prompt.rsplit(SCRATCHPAD_PLACEHOLDER, 1)
+            self._prompt_parts = (prefix, suffix)
+        return self._prompt_parts
+
+    def _add_step(self, step: str, role: str) -> None:
+        """
+        Add a thought, action or observation to the scratchpad and the agent's conversation.
+        """
+        self.scratchpad += "\n" + step
+        self.scratchpad_steps.append(step)
+        self.agent_interactions.messages.append(Message(role=role, content=[ContentTextMessage(text=step)]))
+
     async def batch_run(
         self,
         llm_chat: LLMChat,
@@ -102,11 +139,15 @@ class ReactAgent(Agent):
         total_usage: dict = {}
         while (self.step_round <= self.max_steps) and (not self.finished):
             try:
-                response = await self._step_thought(llm_chat, question, inf_gen_config)
-                total_usage = aggregate_usage([total_usage, response.usage])
+                if self.merge_thought_action:
+                    response = await self._step_thought_action(llm_chat, question, inf_gen_config)
+                    total_usage = aggregate_usage([total_usage, response.usage])
+                else:
+                    response = await self._step_thought(llm_chat, question, inf_gen_config)
+                    total_usage = aggregate_usage([total_usage, response.usage])
 
-                response = await self._step_action(llm_chat, question, inf_gen_config)
-                total_usage = aggregate_usage([total_usage, response.usage])
+                    response = await self._step_action(llm_chat, question, inf_gen_config)
+                    total_usage = aggregate_usage([total_usage, response.usage])
 
                 response = await self._step_observation(response)
                 total_usage = aggregate_usage([total_usage, response.usage])
@@ -148,11 +189,7 @@ class ReactAgent(Agent):
         response.pred = leading_llm_prompt + format_pred(response.pred)
         logger.debug(f"\n\t>>> {response.pred}\n")
 
-        # Update scrachpad and agent's conversation
-        self.scratchpad += "\n" + response.pred
-        self.agent_interactions.messages.append(
-            Message(role="assistant", content=[ContentTextMessage(text=response.pred)])
-        )
+        self._add_step(response.pred, role="assistant")
         return response
 
     async def _step_action(
@@ -175,11 +212,44 @@ class ReactAgent(Agent):
         response.pred = leading_llm_prompt + format_pred(response.pred)
         logger.debug(f"\n\t>>> {response.pred}\n")
 
-        # Update scrachpad and agent's conversation
-        self.scratchpad += "\n" + response.pred
-        self.agent_interactions.messages.append(
-            Message(role="assistant", content=[ContentTextMessage(text=response.pred)])
+        self._add_step(response.pred, role="assistant")
+        return response
+
+    async def _step_thought_action(
+        self, llm_chat: LLMChat, question: str, inf_gen_config: InferenceGenerationConfig
+    ) -> LLMChatResponse:
+        """
+        Run the thought and action steps of the agent with one LLM call.
+        Stop generating when seeing "Observation" token from LLM (when action is complete).
+        If the LLM does not generate an action after the thought, run the action step separately.
+
+        Args:
+            llm_chat (LLMChat): The LLMChat object to use for generating responses.
+            question (str): The question to ask the agent.
+            inf_gen_config (InferenceGenerationConfig): The inference generation config to use
+                for generating responses.
+        """
+        # Stop generating when seeing "Observation" (when action is complete)
+        leading_llm_prompt = f"Thought {self.step_round}: "
+        thought_action_inf_gen_config = inf_gen_config.model_copy(
+            update=dict(stop_sequences=["Observation"]), deep=True
         )
+        response = await self._prompt_agent(
+            llm_chat, question, leading_llm_prompt, thought_action_inf_gen_config
+        )
+        thought, *action = re.split(r"Action(?: \d+)?:", response.pred, maxsplit=1)
+        thought = leading_llm_prompt + format_pred(thought)
+        logger.debug(f"\n\t>>> {thought}\n")
+        self._add_step(thought, role="assistant")
+
+        if not action:
+            response_action = await self._step_action(llm_chat, question, inf_gen_config)
+            response_action.usage = aggregate_usage([response.usage, response_action.usage])
+            return response_action
+
+        response.pred = f"Action {self.step_round}: " + format_pred(action[0])
+        logger.debug(f"\n\t>>> {response.pred}\n")
+        self._add_step(response.pred, role="assistant")
         return response
 
     async def _step_observation(self, response_action: LLMChatResponse) -> LLMChatResponse:
@@ -200,23 +270,18 @@ class ReactAgent(Agent):
                 self.finished = True
                 return LLMChatResponse(pred=action_arg, usage={})
             case "RetrieveArticle":
-                try:
-                    # Fetch the article for the requested entity by looking up the title
-                    # Indexing 0 raises IndexError if search is empty, i.e. no article found
-                    article: str = self.text_corpus.loc[
-                        self.text_corpus["title"].str.lower() == action_arg.lower(), "article"
-                    ].values[0]
+                # Fetch the article for the requested entity by looking up the title
+                article: str | None = self.corpus_index.get_article(action_arg)
+                if article is not None:
                     observation_str = format_pred(article)
-                except IndexError:
+                else:
                     observation_str = (
                         "No article exists for the requested entity. "
                         "Please try retrieving article for another entity."
                     )
             case "Search":
                 # Fetch all article titles that contain the requested attribute
-                article_titles: list[str] = self.text_corpus.loc[
-                    self.text_corpus["article"].str.lower().str.contains(action_arg.lower()), "title"
-                ].tolist()
+                article_titles: list[str] = self.corpus_index.search(action_arg)
                 if len(article_titles) == 0:
                     observation_str = (
                         "No articles contain the requested attribute. "
@@ -235,11 +300,7 @@ class ReactAgent(Agent):
         observation_for_round = f"Observation {self.step_round}: {observation_str}"
         logger.debug(f"\n\t>>> {observation_for_round}\n")
 
-        # Update scrachpad and agent's conversation
-        self.scratchpad += "\n" + observation_for_round
-        self.agent_interactions.messages.append(
-            Message(role="user", content=[ContentTextMessage(text=observation_for_round)])
-        )
+        self._add_step(observation_for_round, role="user")
 
         self.step_round += 1
         return LLMChatResponse(pred=observation_for_round, usage={})
@@ -264,15 +325,17 @@ class ReactAgent(Agent):
                 for generating responses.
         """
         # Put the full scratchpad in the prompt and ask the LLM to generate.
-        # All of the back and forth conversation so far becomes the user prompt.
-        user_message: str = self._build_agent_prompt(question)
-        conv: Conversation = Conversation(
-            messages=[
-                Message(
-                    role="user", content=[ContentTextMessage(text=user_message + "\n" + leading_llm_prompt)]
-                )
-            ]
-        )
+        # All of the back and forth conversation so far becomes the user prompt, i.e.
+        # `self._build_agent_prompt(question) + "\n" + leading_llm_prompt`.
+        # The prompt before the scratchpad and each step are separate content blocks, so the prompt of the
+        # previous step is a prefix of this prompt. The blocks up to the last step are marked with
+        # `cache_control`, so that LLM providers can reuse them in the next step.
+        prefix, suffix = self._get_prompt_parts(question)
+        content = [ContentTextMessage(text=prefix, cache_control=True)]
+        content.extend(ContentTextMessage(text="\n" + step) for step in self.scratchpad_steps)
+        content[-1].cache_control = True
+        content.append(ContentTextMessage(text=suffix + "\n" + leading_llm_prompt))
+        conv: Conversation = Conversation(messages=[Message(role="user", content=content)])
         response: LLMChatResponse = await llm_chat.generate_response(conv, inf_gen_config)
         return response
 
@@ -312,6 +375,8 @@ class ActAgent(Agent):
     The agent then observes the result of the action and updates the conversation history.
     """
 
+    shared_attributes = Agent.shared_attributes + ("corpus_index",)
+
     def __init__(
         self,
         text_corpus: pd.DataFrame,
@@ -332,6 +397,7 @@ class ActAgent(Agent):
         super().__init__(text_corpus, llm_prompt)
         self.max_steps = max_steps
         self.act_examples = act_examples
+        self.corpus_index = CorpusIndex(text_corpus)
 
         self.reset()
 
@@ -439,23 +505,18 @@ class ActAgent(Agent):
                 self.finished = True
                 return LLMChatResponse(pred=action_arg, usage={})
             case "RetrieveArticle":
-                try:
-                    # Fetch the article for the requested entity by looking up the title
-                    # Indexing 0 raises IndexError if search is empty, i.e. no article found
-                    article: str = self.text_corpus.loc[
-                        self.text_corpus["title"].str.lower() == action_arg.lower(), "article"
-                    ].values[0]
+                # Fetch the article for the requested entity by looking up the title
+                article: str | None = self.corpus_index.get_article(action_arg)
+                if article is not None:
                     observation_str = format_pred(article)
-                except IndexError:
+                else:
                     observation_str = (
                         "No article exists for the requested entity. "
                         "Please try retrieving article for another entity."
                     )
             case "Search":
                 # Fetch all article titles that contain the requested attribute
-                article_titles: list[str] = self.text_corpus.loc[
-                    self.text_corpus["article"].str.lower().str.contains(action_arg.lower()), "title"
-                ].tolist()
+                article_titles: list[str] = self.corpus_index.search(action_arg)
                 if len(article_titles) == 0:
                     observation_str = (
                         "No articles contain the requested attribute. "
@@ -528,6 +589,7 @@ class React_CoTSCAgent(Agent):
         react_llm_prompt: LLMPrompt,
         max_steps: int = 6,
         react_examples: str = "",
+        merge_thought_action: bool = False,
         cot_llm_prompt: LLMPrompt | None = None,
         cot_examples: str = "",
         num_votes: int = 3,
@@ -548,6 +610,9 @@ class React_CoTSCAgent(Agent):
                 Defaults to 6.
             react_examples (str): Prompt examples to include in agent prompt.
                 Defaults to "".
+            merge_thought_action (bool): Whether the React agent generates the thought and action of each
+                step in one LLM call.
+                Defaults to False.
             cot_llm_prompt (LLMPrompt): The prompt to be used by the CoTSC agent.
                 Must be provided.
             cot_examples (str): Prompt examples to include in agent prompt.
@@ -563,7 +628,9 @@ class React_CoTSCAgent(Agent):
         assert cot_llm_prompt is not None, "CoTSC agent prompt is required."
         super().__init__(text_corpus, react_llm_prompt)
         self.cotsc_inf_temperature = cotsc_inf_temperature
-        self.react_agent = ReactAgent(text_corpus, react_llm_prompt, max_steps, react_examples)
+        self.react_agent = ReactAgent(
+            text_corpus, react_llm_prompt, max_steps, react_examples, merge_thought_action
+        )
         self.cotsc_agent = CoTSCAgent(text_corpus, cot_llm_prompt, cot_examples, num_votes, sep)
 
         self.reset()
@@ -649,6 +716,7 @@ class CoTSC_ReactAgent(Agent):
         react_llm_prompt: LLMPrompt | None = None,
         max_steps: int = 6,
         react_examples: str = "",
+        merge_thought_action: bool = False,
     ):
         """
         Takes 2 LLM Prompts. The first prompt is passed to the CoTSC agent
@@ -675,12 +743,17 @@ class CoTSC_ReactAgent(Agent):
                 Defaults to 6.
             react_examples (str): Prompt examples to include in agent prompt.
                 Defaults to "".
+            merge_thought_action (bool): Whether the React agent generates the thought and action of each
+                step in one LLM call.
+                Defaults to False.
         """
         assert react_llm_prompt is not None, "React agent prompt is required."
         super().__init__(text_corpus, cot_llm_prompt)
         self.cotsc_inf_temperature = cotsc_inf_temperature
         self.cotsc_agent = CoTSCAgent(text_corpus, cot_llm_prompt, cot_examples, num_votes, sep)
-        self.react_agent = ReactAgent(text_corpus, react_llm_prompt, max_steps, react_examples)
+        self.react_agent = ReactAgent(
+            text_corpus, react_llm_prompt, max_steps, react_examples, merge_thought_action
+        )
 
         self.reset()
 
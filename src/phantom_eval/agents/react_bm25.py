@@ -10,11 +10,12 @@ Looks up the next occurrence of keyword in current article and returns
 sentence and surrounding context (if get_contextual_sentences is True).
 """
 
+import bisect
 import json
 import logging
 import re
 import traceback
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from pathlib import Path
 
 import nltk
@@ -41,6 +42,29 @@ def format_pred(pred: str) -> str:
     return pred.strip("\n").strip().replace("\n", " ")
 
 
+class ArticleSentences:
+    """
+    Sentences of an article for lookup operations, with lowercase copies of the sentences.
+    The indices of the sentences that contain a keyword are computed once per keyword.
+    """
+
+    def __init__(self, sentences: list[str]):
+        self.sentences = sentences
+        self.lowercase_sentences = [sentence.lower() for sentence in sentences]
+        self._keyword_matches: dict[str, list[int]] = {}  # lowercase keyword -> sentence indices
+
+    def find(self, keyword: str) -> list[int]:
+        """
+        Returns the indices of the sentences that contain the keyword (case insensitive), in increasing order.
+        """
+        keyword_lower = keyword.lower()
+        if keyword_lower not in self._keyword_matches:
+            self._keyword_matches[keyword_lower] = [
+                i for i, sentence in enumerate(self.lowercase_sentences) if keyword_lower in sentence
+            ]
+        return self._keyword_matches[keyword_lower]
+
+
 class TextCorpus:
     """Handles reading and searching JSONL corpus files.
 
@@ -50,6 +74,9 @@ class TextCorpus:
     _title_mappings = defaultdict(list)  # title -> list of ids
     _data = {}  # id -> data
     _retriever = None  # Static variable for BM25 retriever
+    # LRU cache of the sentences of the retrieved articles, shared by all instances
+    _article_sentences: OrderedDict[tuple[int, ...], ArticleSentences] = OrderedDict()  # ids -> sentences
+    MAX_CACHED_ARTICLES = 10_000
 
     def __init__(self, corpus_path: str, index_path: str):
         if not Path(corpus_path).exists():
@@ -66,6 +93,7 @@ class TextCorpus:
         self.sentence_tokenizer = PunktSentenceTokenizer()
 
         # State for lookup operations
+        self.current_article: ArticleSentences | None = None
         self.current_sentences = None
         self.lookup_state = {"keyword": None, "last_match_index": -1}  # Index of last matched sentence
 
@@ -171,6 +199,31 @@ class TextCorpus:
         # Clean up sentences
         return [s.strip() for s in sentences if s.strip()]
 
+    def _set_current_article(self, article_ids: list[int]) -> str:
+        """
+        Merges the chunks with the given ids into a single article, and makes it the current article
+        for lookup operations. The sentences of the article are cached, so each article is split once.
+        """
+        article_ids = tuple(article_id for article_id in article_ids if article_id in TextCorpus._data)
+        article = "\n".join(TextCorpus._data[article_id] for article_id in article_ids)
+
+        if article_ids in TextCorpus._article_sentences:
+            TextCorpus._article_sentences.move_to_end(article_ids)
+        else:
+            TextCorpus._article_sentences[article_ids] = ArticleSentences(self._split_into_sentences(article))
+            if len(TextCorpus._article_sentences) > TextCorpus.MAX_CACHED_ARTICLES:
+                # Evict the least recently used article
+                TextCorpus._article_sentences.popitem(last=False)
+        self.current_article = TextCorpus._article_sentences[article_ids]
+        self.current_sentences = self.current_article.sentences
+        self.lookup_state = {"keyword": None, "last_match_index": -1}
+        return article
+
+    def _reset_current_article(self) -> None:
+        self.current_article = None
+        self.current_sentences = None
+        self.lookup_state = {"keyword": None, "last_match_index": -1}
+
     def search_title_exact_match(self, title: str) -> str | None:
         """
         Retrieve article by exact title match (case insensitive).
@@ -181,37 +234,20 @@ class TextCorpus:
         title = title.strip().strip('"').lower()
         article_ids = TextCorpus._title_mappings.get(title)
         if article_ids:
-            # Use self.data for fast lookup
-            article_chunks = [
-                TextCorpus._data[article_id] for article_id in article_ids if article_id in TextCorpus._data
-            ]
-
             # Merge all chunks and update state
-            article = "\n".join(article_chunks)
-            self.current_sentences = self._split_into_sentences(article)
-            self.lookup_state = {"keyword": None, "last_match_index": -1}
-            return article
+            return self._set_current_article(article_ids)
         else:
-            self.current_sentences = None
-            self.lookup_state = {"keyword": None, "last_match_index": -1}
+            self._reset_current_article()
             return None
 
     def search_title_bm25(self, title: str, k: int = 2) -> str | None:
         results = TextCorpus._retriever.search(title, num=k)
         if len(results) > 0:
             article_ids = [result["id"] for result in results]
-            article_chunks = [
-                TextCorpus._data[article_id] for article_id in article_ids if article_id in TextCorpus._data
-            ]
-
             # Merge all chunks and update state
-            article = "\n".join(article_chunks)
-            self.current_sentences = self._split_into_sentences(article)
-            self.lookup_state = {"keyword": None, "last_match_index": -1}
-            return article
+            return self._set_current_article(article_ids)
         else:
-            self.current_sentences = None
-            self.lookup_state = {"keyword": None, "last_match_index": -1}
+            self._reset_current_article()
             return None
 
     def lookup_keyword(self, keyword: str, get_contextual_sentences: bool = True) -> tuple[str | None, str]:
@@ -239,24 +275,24 @@ class TextCorpus:
             self.lookup_state = {"keyword": keyword, "last_match_index": -1}
 
         # Find next sentence containing the keyword (case insensitive)
-        keyword_lower = keyword.lower()
-
-        for i in range(self.lookup_state["last_match_index"] + 1, len(self.current_sentences)):
-            if keyword_lower in self.current_sentences[i].lower():
-                self.lookup_state["last_match_index"] = i
-                if get_contextual_sentences:
-                    # Get context window (2 sentences before and after)
-                    start_idx = max(0, i - 2)
-                    end_idx = min(len(self.current_sentences), i + 3)
-                    context = " ".join(self.current_sentences[start_idx:end_idx])
-
-                    return context, f"Found match in sentence {i + 1} of {len(self.current_sentences)}"
-                else:
-                    # Return only the sentence containing the keyword
-                    return (
-                        self.current_sentences[i],
-                        f"Found match in sentence {i + 1} of {len(self.current_sentences)}",
-                    )
+        matches = self.current_article.find(keyword)
+        next_match = bisect.bisect_right(matches, self.lookup_state["last_match_index"])
+        if next_match < len(matches):
+            i = matches[next_match]
+            self.lookup_state["last_match_index"] = i
+            if get_contextual_sentences:
+                # Get context window (2 sentences before and after)
+                start_idx = max(0, i - 2)
+                end_idx = min(len(self.current_sentences), i + 3)
+                context = " ".join(self.current_sentences[start_idx:end_idx])
+
+                return context, f"Found match in sentence {i + 1} of {len(self.current_sentences)}"
+            else:
+                # Return only the sentence containing the keyword
+                return (
+                    self.current_sentences[i],
+                    f"Found match in sentence {i + 1} of {len(self.current_sentences)}",
+                )
         # If we get here, no more matches were found
         if self.lookup_state["last_match_index"] == -1:
             return None, f"No occurrences of '{keyword}' found in the current article."
@@ -278,6 +314,10 @@ class ReactBM25Agent(Agent):
     The agent then observes the result of the action and updates the conversation history.
     """
 
+    # NOTE: the text corpus holds the state of the Lookup action, so each copy of the agent has its own.
+    # The corpus data and retriever are class variables of `TextCorpus`, so they are shared anyway.
+    shared_attributes = ("llm_prompt",)
+
     def __init__(
         self,
         text_corpus: pd.DataFrame,
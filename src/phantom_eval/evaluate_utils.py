@@ -1,20 +1,38 @@
 """Utilities for computing evaluation metrics given prediction files
 """
+import datetime
 import logging
+import os
 import re
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
 
+import joblib
 import numpy as np
 import pandas as pd
-from joblib import Memory, expires_after
+from joblib import Memory
 
 memory = Memory("cachedir")
 
 from . import constants
-from .score import exact_match, f1, precision, recall
+from .pred_store import (
+    INTERACTIONS_DIR,
+    METADATA,
+    PREDS_PARQUET_DIR,
+    RUN_COLUMNS,
+    SAMPLING_PARAMS,
+    read_interactions,
+    read_preds_parquet,
+)
+from .score import batch_scores
 from .utils import load_data
 
+# Every change to the prediction files adds a cache entry (see `get_predictions_with_qa`), so the cache is
+# reduced to this size, and entries that have not been accessed for this long are removed
+CACHE_BYTES_LIMIT = "4G"
+CACHE_AGE_LIMIT = datetime.timedelta(days=7)
+
 # hard-code the order of the models for the plot
 # otherwise, the order will be alphabetical (and the model size will not be in order)
 MODELS = [
@@ -81,13 +99,61 @@ def pivot_mean_std(acc_mean_std, metric, independent_variable="_split", enforce_
 
 
 ################ Utils for getting evaluation data ################
-@memory.cache(cache_validation_callback=expires_after(hours=4))
-def _get_preds(output_dir, method):
+# pattern of the data generation parameters in the split names
+SPLIT_PATTERN = re.compile(r"depth_(\d+)_size_(\d+)_seed_(\d+)")
+
+
+def _get_file_stamps(*patterns: str) -> str:
+    """Get a hash of the files matching the glob patterns and their modification times
+
+    The stamps are passed to the cached functions below, so that the cached results are invalidated
+    when the files change (instead of expiring after a fixed time).
+    """
+    files = sorted({f for pattern in patterns for f in glob(pattern, recursive=True)})
+    return joblib.hash([(f, os.stat(f).st_mtime_ns) for f in files])
+
+
+def _get_pred_file_stamps(output_dir: str, method: str) -> str:
+    return _get_file_stamps(
+        f"{output_dir}/preds/{method}/*.json",
+        f"{output_dir}/{PREDS_PARQUET_DIR}/{method}/**/*.parquet",
+        f"{output_dir}/{INTERACTIONS_DIR}/{method}/**/*.jsonl.gz",
+    )
+
+
+def _get_dataset_file_stamps(dataset: str, from_local: bool) -> str:
+    # datasets on HF are versioned by name, so only local datasets can change
+    return _get_file_stamps(f"{dataset}/**/*") if from_local else ""
+
+
+def _read_pred_file(filename: str) -> pd.DataFrame:
+    """Read a JSON file of predictions and add the auxiliary columns that are useful for analysis"""
+    logging.info(f"Reading from {filename}...")
+    df = pd.read_json(filename, orient="index", dtype=False)
+    # add new columns corresponding to the metadata and the sampling parameters
+    metadata = pd.DataFrame(df["metadata"].tolist(), index=df.index, columns=METADATA)
+    sampling_params = pd.DataFrame(df["inference_params"].tolist(), index=df.index, columns=SAMPLING_PARAMS)
+    df = pd.concat(
+        [df.drop(columns=["metadata"]), metadata.add_prefix("_"), sampling_params.add_prefix("_")], axis=1
+    )
+    # assign the index to a new column called 'id'
+    return df.reset_index(names="id")
+
+
+def _get_preds(output_dir, method, include_interactions: bool = False):
     """Get predictions from the output directory corresponding to method `method`
 
+    Reads both the per-batch JSON files in `{output_dir}/preds/{method}/` and the Parquet dataset in
+    `{output_dir}/preds_parquet/{method}/` (see `phantom_eval.pred_store`).
+    The JSON files are read concurrently by a thread pool.
+
     Args:
         output_dir (str): path to the output directory
         method (str): method used for inference (e.g., zeroshot, fewshot, etc.)
+        include_interactions (bool): whether to add the agent interactions of predictions saved
+            in the Parquet dataset, which are stored separately.
+            Predictions saved as JSON files always include their interactions.
+            Default is False.
 
     Returns:
         pd.DataFrame: a dataframe containing the predictions
@@ -98,69 +164,73 @@ def _get_preds(output_dir, method):
     files = glob(f"{output_dir}/preds/{method}/*.json")
     # sort the files by the batch number
     files = sorted(files, key=lambda x: int(re.search(r"bn=(\d+)", x).group(1)))
+    with ThreadPoolExecutor() as executor:
+        df_list = list(executor.map(_read_pred_file, files))
+
+    # the Parquet dataset already has the auxiliary columns, so it is read in a single scan
+    df = read_preds_parquet(output_dir, method)
+    if not df.empty:
+        logging.info(f"Read {len(df)} predictions from {output_dir}/{PREDS_PARQUET_DIR}/{method}")
+        if include_interactions:
+            df = df.merge(read_interactions(output_dir, method), on=["id", *RUN_COLUMNS], how="left")
+            df["interaction"] = df["interaction"].apply(lambda x: x if isinstance(x, dict) else [])
+        df_list.append(df)
 
-    if len(files) == 0:
-        logging.warning(f"No files found in {output_dir}/preds/{method}/*.json")
+    if len(df_list) == 0:
+        logging.warning(f"No predictions found in {output_dir} for method {method}")
         return pd.DataFrame()
 
-    df_list = []
-    # keys to create auxiliary columns that are useful for analysis
-    METADATA = ["model", "dataset", "split", "batch_size", "batch_number", "type"]
-    SAMPLING_PARAMS = ["seed"]
-    for filename in files:
-        logging.info(f"Reading from {filename}...")
-        df = pd.read_json(filename, orient="index", dtype=False)
-        # add new columns corresponding to the metadata
-        for key in METADATA:
-            df["_" + key] = df["metadata"].apply(lambda x: x[key])
-        # add new columns corresponding to the sampling parameters
-        for key in SAMPLING_PARAMS:
-            df["_" + key] = df["inference_params"].apply(lambda x: x[key])
-        # drop the metadata column
-        df = df.drop(columns=["metadata"])
-        df_list.append(df)
-    # concatenate all dataframes
-    df_preds = pd.concat(df_list)
+    # concatenate all dataframes, sorted by the batch number
     # and add a new index from 0 to len(df_preds) so that we can save the dataframe to a json file
-    # assign the old index to a new column called 'id'
-    df_preds = df_preds.reset_index(names="id")
+    df_preds = pd.concat(df_list).sort_values("_batch_number", kind="stable", ignore_index=True)
     return df_preds
 
 
-@memory.cache(cache_validation_callback=expires_after(hours=4))
-def _get_qa_pairs(dataset: str, splits: list[str], from_local: bool = False):
-    df_list = []
-    for split in splits:
-        # NOTE: using Dataset.to_pandas() casts lists to numpy arrays
-        # which is not JSON serializable. Thus, we use pd.DataFrame() instead
-        df = pd.DataFrame(load_data(dataset, split, from_local)["qa_pairs"])
-        # # set index to id
-        # df = df.set_index('id')
-        # convert template column to string
-        df["template"] = df["template"].apply(lambda x: " ".join(x))
-        # compute the number of hops by taking the length of the prolog query
-        df["hops"] = df["prolog"].apply(lambda x: len(x["query"]))
-        # determine whether a question is an aggregation question or not
-        df["aggregation"] = df["prolog"].apply(lambda x: "aggregate_all" in " ".join(x["query"])).astype(int)
-        # determine the number of solutions to each question
-        df["solutions"] = df["answer"].apply(lambda x: len(x))
-        df_list.append(df)
+def _read_qa_pairs(dataset: str, split: str, from_local: bool) -> pd.DataFrame:
+    """Read the qa pairs of a split and add the auxiliary columns that are useful for analysis"""
+    # NOTE: the results are cached by `_get_qa_pairs`, so the cache of `load_data` is bypassed
+    # to not return stale local datasets
+    # NOTE: using Dataset.to_pandas() casts lists to numpy arrays
+    # which is not JSON serializable. Thus, we use pd.DataFrame() instead
+    df = pd.DataFrame(load_data.func(dataset, split, from_local)["qa_pairs"])
+    # convert template column to string
+    df["template"] = df["template"].apply(lambda x: " ".join(x))
+    # compute the number of hops by taking the length of the prolog query
+    df["hops"] = df["prolog"].apply(lambda x: len(x["query"]))
+    # determine whether a question is an aggregation question or not
+    df["aggregation"] = df["prolog"].apply(lambda x: "aggregate_all" in " ".join(x["query"])).astype(int)
+    # determine the number of solutions to each question
+    df["solutions"] = df["answer"].apply(lambda x: len(x))
+    return df
+
+
+@memory.cache
+def _get_qa_pairs(dataset: str, splits: list[str], from_local: bool, file_stamps: str):
+    """Get the qa pairs of the splits, loaded concurrently by a thread pool
+
+    NOTE: `file_stamps` (see `_get_dataset_file_stamps`) is only used as part of the cache key.
+    """
+    with ThreadPoolExecutor() as executor:
+        df_list = list(executor.map(lambda split: _read_qa_pairs(dataset, split, from_local), splits))
     # merge on the index
     df_qa_pairs = pd.concat(df_list)
     return df_qa_pairs
 
 
-@memory.cache(cache_validation_callback=expires_after(hours=4))
 def get_predictions_with_qa(
     output_dir: str,
     method: str,
     dataset: str,
     from_local: bool = False,
+    include_interactions: bool = False,
 ):
     """Get the predictions with the qa pairs
 
     First reads the predictions from the output directory, then joins with the qa pairs.
-    NOTE: The results are cached for 4 hours at `cachedir` (see `memory` object).
+    NOTE: The results are cached at `cachedir` (see `memory` object) until the prediction files
+    (or the files of a local dataset) are modified.
+    The cache is bounded by `CACHE_BYTES_LIMIT`, evicting the least recently used results, and results
+    that have not been used for `CACHE_AGE_LIMIT` are removed.
     To invalidate the cache, delete the `cachedir` folder.
     NOTE: to include the scores, use `get_evaluation_data`.
 
@@ -170,34 +240,59 @@ def get_predictions_with_qa(
         dataset (str): dataset name (e.g., "mlcore/phantom-wiki", "mlcore/phantom-wiki-v0.2")
         from_local (bool) : if loading the data from a local folder.
             Default is False.
+        include_interactions (bool): whether to include the agent interactions of predictions
+            saved in the Parquet dataset (see `_get_preds`).
+            Default is False.
 
     Returns:
         pd.DataFrame: a dataframe containing the evaluation data,
             including the predictions, the qa pairs (with auxiliary columns),
             and per-instance evaluation metrics
     """
+    df = _get_predictions_with_qa(
+        output_dir,
+        method,
+        dataset,
+        from_local,
+        include_interactions,
+        _get_pred_file_stamps(output_dir, method),
+        _get_dataset_file_stamps(dataset, from_local),
+    )
+    # remove the least recently used entries, e.g. merged frames of prediction files that have changed since
+    memory.reduce_size(bytes_limit=CACHE_BYTES_LIMIT, age_limit=CACHE_AGE_LIMIT)
+    return df
+
+
+@memory.cache
+def _get_predictions_with_qa(
+    output_dir: str,
+    method: str,
+    dataset: str,
+    from_local: bool,
+    include_interactions: bool,
+    pred_file_stamps: str,
+    dataset_file_stamps: str,
+):
+    """See `get_predictions_with_qa`. The file stamps are only used as part of the cache key."""
     # get the predictions
-    df_preds = _get_preds(output_dir, method)
+    df_preds = _get_preds(output_dir, method, include_interactions)
     if df_preds.empty:
         return df_preds
     # get unique splits
     splits = df_preds["_split"].unique().tolist()
     # get the qa pairs
-    df_qa_pairs = _get_qa_pairs(dataset, splits, from_local)
+    df_qa_pairs = _get_qa_pairs(dataset, splits, from_local, dataset_file_stamps)
     # join with original qa pairs to get additional information about
     # the prolog queries and the templates
     df = df_preds.merge(df_qa_pairs, on="id", how="left")
 
-    # add a column for data generation parameters
-    df["_depth"] = (
-        df["_split"].apply(lambda x: re.match(r"depth_(\d+)_size_(\d+)_seed_(\d+)", x).group(1)).astype(int)
-    )
-    df["_size"] = (
-        df["_split"].apply(lambda x: re.match(r"depth_(\d+)_size_(\d+)_seed_(\d+)", x).group(2)).astype(int)
-    )
-    df["_data_seed"] = (
-        df["_split"].apply(lambda x: re.match(r"depth_(\d+)_size_(\d+)_seed_(\d+)", x).group(3)).astype(int)
-    )
+    # add columns for data generation parameters, parsed once per split
+    split_params = pd.DataFrame(
+        [SPLIT_PATTERN.match(split).groups() for split in splits],
+        index=splits,
+        columns=["_depth", "_size", "_data_seed"],
+    ).astype(int)
+    df = df.join(split_params, on="_split")
     return df
 
 
@@ -216,32 +311,34 @@ def get_scores_for_predictions(df: pd.DataFrame, sep: str = constants.answer_sep
 
     """
 
-    def apply_score_function_to_df(df, score_func):
-        # join the true answers with the appropriate separator since the scoring functions expect strings
-        return df.apply(lambda x: score_func(x["pred"], sep.join(x["true"]), sep=sep), axis=1)
+    if df.empty:
+        return df
 
     try:
-        # compute the scores for each prediction
-        df["EM"] = apply_score_function_to_df(df, exact_match)
-        df["precision"] = apply_score_function_to_df(df, precision)
-        df["recall"] = apply_score_function_to_df(df, recall)
-        df["f1"] = apply_score_function_to_df(df, f1)
+        # compute all scores in a single pass over the predictions
+        # join the true answers with the appropriate separator since the scoring functions expect strings
+        scores = batch_scores(df["pred"], [sep.join(true) for true in df["true"]], sep=sep)
+        for metric in ["EM", "precision", "recall", "f1"]:
+            df[metric] = scores[metric]
         return df
     except ValueError:
         logging.warning(f"Error in computing scores for {traceback.format_exc()}, returning empty dataframe.")
         return pd.DataFrame()
 
 
-@memory.cache(cache_validation_callback=expires_after(hours=4))
 def get_evaluation_data(
     output_dir: str,
     method: str,
     dataset: str,
     from_local: bool = False,
     sep: str = constants.answer_sep,
+    include_interactions: bool = False,
 ):
     """Get the predictions with scores
 
+    NOTE: The predictions with the qa pairs are cached (see `get_predictions_with_qa`),
+    and the scores are computed in a single vectorized pass.
+
     Args:
         output_dir (str): path to the output directory
         method (str): method used for inference (e.g., zeroshot, fewshot, etc.)
@@ -250,11 +347,14 @@ def get_evaluation_data(
             Default is False.
         sep (str): separator when pre-processing pred/true strings.
             Default is `constants.answer_sep`.
+        include_interactions (bool): whether to include the agent interactions of predictions
+            saved in the Parquet dataset (see `_get_preds`).
+            Default is False.
 
     Returns:
         pd.DataFrame: a dataframe containing the predictions with scores
     """
-    df = get_predictions_with_qa(output_dir, method, dataset, from_local)
+    df = get_predictions_with_qa(output_dir, method, dataset, from_local, include_interactions)
     df = get_scores_for_predictions(df, sep)
     return df
 
@@ -2,7 +2,7 @@ import os
 
 import anthropic
 
-from phantom_eval._types import LLMChatResponse
+from phantom_eval._types import ContentTextMessage, Conversation, LLMChatResponse
 from phantom_eval.llm.common import CommonLLMChat, InferenceGenerationConfig
 
 
@@ -18,6 +18,25 @@ class AnthropicChat(CommonLLMChat):
         self.async_client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
         self._update_rate_limits("anthropic", model_name, usage_tier)
 
+    def _convert_conv_to_api_format(self, conv: Conversation) -> list[dict]:
+        """
+        Converts the conversation object to the common format, and marks the content blocks with
+        `cache_control` as cache breakpoints.
+
+        https://docs.anthropic.com/en/docs/build-with-claude/prompt-caching
+        """
+        formatted_messages = []
+        for message in conv.messages:
+            formatted_content = []
+            for content in message.content:
+                match content:
+                    case ContentTextMessage(text=text, cache_control=cache_control):
+                        formatted_content.append({"type": "text", "text": text})
+                        if cache_control:
+                            formatted_content[-1]["cache_control"] = {"type": "ephemeral"}
+            formatted_messages.append({"role": message.role, "content": formatted_content})
+        return formatted_messages
+
     def _call_api(
         self,
         messages_api_format: list[dict],
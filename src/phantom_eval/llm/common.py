@@ -1,16 +1,21 @@
 import abc
 import asyncio
 import logging
-import time
 from copy import deepcopy
 from pathlib import Path
 from typing import Any
 
 import yaml
 from pydantic import BaseModel
-from tenacity import retry, stop_after_attempt, wait_fixed
+from tenacity import retry, stop_after_attempt
 
 from phantom_eval._types import ContentTextMessage, Conversation, LLMChatResponse
+from phantom_eval.llm.concurrency import (
+    AdaptiveConcurrencyController,
+    ThroughputMonitor,
+    wait_retry_after_or_exponential_jitter,
+)
+from phantom_eval.llm.rate_limiter import TokenBucketRateLimiter
 
 logger = logging.getLogger(__name__)
 
@@ -57,6 +62,26 @@ def aggregate_usage(usage_list: list[dict]) -> dict:
     return result
 
 
+def get_total_tokens(usage: dict) -> int | None:
+    """
+    Get the total number of (input and output) tokens from the usage dict of a response.
+
+    Args:
+        usage (dict): The usage dict, whose schema depends on the LLM provider.
+
+    Returns:
+        int | None: The total number of tokens, or None if the usage dict does not report them.
+    """
+    for key in ["total_tokens", "total_token_count"]:
+        # OpenAI, Together, and Gemini
+        if usage.get(key) is not None:
+            return usage[key]
+    if usage.get("input_tokens") is not None:
+        # Anthropic
+        return usage["input_tokens"] + (usage.get("output_tokens") or 0)
+    return None
+
+
 # Default path to the LLM API config file
 DEFAULT_LLMS_RPM_TPM_CONFIG_FPATH = Path(__file__).parent / "llms_rpm_tpm_config.yaml"
 
@@ -190,6 +215,10 @@ class CommonLLMChat(LLMChat):
         model_name: str,
         enforce_rate_limits: bool = False,
         llms_rpm_tpm_config_fpath: str = DEFAULT_LLMS_RPM_TPM_CONFIG_FPATH,
+        max_concurrency: int = 32,
+        initial_concurrency: int = 4,
+        rate_limit_utilization: float = 1.0,
+        rate_limit_state_fpath: str | None = None,
     ):
         """
         Initialize the LLM chat object.
@@ -199,21 +228,37 @@ class CommonLLMChat(LLMChat):
                 Defaults to False.
             llms_rpm_tpm_config_fpath (str): Path to the LLM API config file.
                 Defaults to `DEFAULT_LLMS_RPM_TPM_CONFIG_FPATH`.
+            max_concurrency (int): Maximum number of concurrent API calls.
+                Defaults to 32.
+            initial_concurrency (int): Number of concurrent API calls to start with, which increases
+                up to `max_concurrency` while the latency is stable (see `AdaptiveConcurrencyController`).
+                Defaults to 4.
+            rate_limit_utilization (float): Fraction of the rate limits to use when enforcing them.
+                Defaults to 1.0.
+            rate_limit_state_fpath (str | None): Path to a file to share the rate limits across processes
+                using the same API key. If None, the rate limits are tracked per process.
+                Defaults to None.
         """
         super().__init__(model_name)
         self.client = None
+        self.async_client = None
+
+        # Adapts the number of in-flight API calls to the provider's throttling
+        self.max_concurrency = max_concurrency
+        self.concurrency_controller = AdaptiveConcurrencyController(
+            max_concurrency, initial_concurrency=initial_concurrency
+        )
+        self.throughput_monitor = ThroughputMonitor()
 
         # Functionality for enforcing rate limiting on the client side
         self.enforce_rate_limits = enforce_rate_limits
         self.llms_rpm_tpm_config_fpath = llms_rpm_tpm_config_fpath
 
-        # end_rpm is incremented every interval and represents the next time a request can be made
-        # end_tpm is incremented every minute and represents the next time a new minute starts
-        self.start_time = self.end_time_rpm = self.end_time_tpm = time.time()
-        # NOTE: we estimate the number of used tokens in the current minute
-        self.token_usage_per_minute = 0
-        # condition variable for rate limit
-        self.cond_lock = asyncio.Condition()
+        self.rate_limit_utilization = rate_limit_utilization
+        self.rate_limit_state_fpath = rate_limit_state_fpath
+        # NOTE: the rate limiter is created on first use, since subclasses load the rate limits
+        # after initialization (see `_update_rate_limits`)
+        self._rate_limiter: TokenBucketRateLimiter | None = None
 
     def _update_rate_limits(self, server: str, model_name: str, usage_tier: int) -> None:
         """
@@ -247,44 +292,16 @@ class CommonLLMChat(LLMChat):
             )
             self.enforce_rate_limits = False
 
-    def _increment_end_times(self):
-        """Increment the counter by interval = (60 / RPM) and reset token usage"""
-        now = time.time()
-        if now > self.end_time_rpm:
-            self.end_time_rpm = (
-                now + 60 / self.RPM_LIMIT
-            )  # set the next rpm deadline to be 1 interval from now
-        if now > self.end_time_tpm:
-            self.end_time_tpm = now + 60  # set the next tpm deadline to be 1 minute
-            self.token_usage_per_minute = 0
-
-    async def _sleep_rpm(self):
-        """Sleep if the RPM limit is exceeded"""
-        remaining = max(self.end_time_rpm - time.time(), 0)
-        logger.debug(f"Sleeping for {remaining} to satisfy RPM limit")
-        return await asyncio.sleep(remaining)
-
-    async def _sleep_tpm(self, input_tokens: int):
-        """Sleep if the input_tokens will exceed the TPM limit"""
-        if input_tokens + self.token_usage_per_minute > self.TPM_LIMIT:
-            remaining = max(self.end_time_tpm - time.time(), 0)
-            logger.debug(f"Sleeping for {remaining} to satisfy TPM limit")
-            await asyncio.sleep(remaining)
-            self.token_usage_per_minute = 0  # reset token_usage_per_minute if new minute has started
-
-    def _check(self, input_tokens: int) -> bool:
-        """Check that the condition is satisfied"""
-        now = time.time()
-        logger.debug(
-            f"checking: curr time={now-self.start_time}, rpm counter={self.end_time_rpm-self.start_time}, "
-            f"tpm counter={self.end_time_tpm-self.start_time}, "
-            f"token_usage_per_minute={self.token_usage_per_minute}"
-        )
-        return now >= self.end_time_rpm and input_tokens + self.token_usage_per_minute <= self.TPM_LIMIT
-
-    def _display_curr_time(self):
-        """Print the current time since start"""
-        return f"curr time={time.time() - self.start_time}, tokens used={self.token_usage_per_minute}"
+    @property
+    def rate_limiter(self) -> TokenBucketRateLimiter:
+        if self._rate_limiter is None:
+            self._rate_limiter = TokenBucketRateLimiter(
+                self.RPM_LIMIT,
+                self.TPM_LIMIT,
+                utilization=self.rate_limit_utilization,
+                state_fpath=self.rate_limit_state_fpath,
+            )
+        return self._rate_limiter
 
     @abc.abstractmethod
     def _call_api(
@@ -325,77 +342,64 @@ class CommonLLMChat(LLMChat):
         """
         formatted_messages = []
         for message in conv.messages:
+            formatted_content = []
             for content in message.content:
                 match content:
                     case ContentTextMessage(text=text):
-                        formatted_messages.append(
-                            {"role": message.role, "content": [{"type": "text", "text": text}]}
-                        )
+                        formatted_content.append({"type": "text", "text": text})
+            formatted_messages.append({"role": message.role, "content": formatted_content})
         return formatted_messages
 
-    async def generate_response_with_rate_limits(
-        self, conv: Conversation, inf_gen_config: InferenceGenerationConfig
-    ) -> LLMChatResponse:
-        """Async version of generate_response that respects rate limits"""
-        messages_api_format: list[dict] = self._convert_conv_to_api_format(conv)
-        input_tokens = self._count_tokens(messages_api_format)
-        logger.debug(f"Input tokens: {input_tokens}")
-        if input_tokens > self.TPM_LIMIT:
-            raise ValueError(f"Input tokens {input_tokens} exceed TPM limit {self.TPM_LIMIT}")
-
-        # acquire the lock for the counter
-        await self.cond_lock.acquire()
-        logger.debug(f"{self._display_curr_time()}: Acquired lock for {conv.uid}")
-        # ensure that counter.check(input_tokens) will be satisfied
-        await self._sleep_rpm()
-        await self._sleep_tpm(input_tokens)
-        try:
-            # yield to other threads until condition is true
-            await self.cond_lock.wait_for(lambda: self._check(input_tokens))
-            # schedule _call_api to run concurrently
-            logger.debug(f"{self._display_curr_time()}: Calling API for {conv.uid}")
-            t = asyncio.create_task(self._call_api(messages_api_format, inf_gen_config, use_async=True))
-            logger.debug(f"{self._display_curr_time()}: Done with {conv.uid}")
-            self._increment_end_times()
-            self.token_usage_per_minute += input_tokens
-            logger.debug(f"{self._display_curr_time()}: Updated counter")
-            # release underlying lock and wake up 1 waiting task
-            self.cond_lock.notify()
-            logger.debug(f"{self._display_curr_time()}: Notified 1")
-        finally:
-            self.cond_lock.release()
-            logger.debug(f"{self._display_curr_time()}: Released lock for {conv.uid}")
-        # wait for the task to complete
-        response = await t
-        parsed_response = self._parse_api_output(response, inf_gen_config)
-        return parsed_response
-
     async def generate_response(
         self, conv: Conversation, inf_gen_config: InferenceGenerationConfig
     ) -> LLMChatResponse:
         """Async version of generate_response that can be called concurrently to respect rate limits
 
-        If self.enforce_rate_limits is True, this function will enforce the rate limits
-        by acquiring a lock and waiting for the condition to be satisfied.
-        Otherwise, it will call the API directly.
+        If self.enforce_rate_limits is True, each API call first waits for the rate limits
+        (see `TokenBucketRateLimiter`).
+        The API calls then run concurrently, bounded by an adaptive limit that backs off when the provider
+        throttles (see `AdaptiveConcurrencyController`).
+        Failed calls are retried with exponential backoff and jitter, honoring Retry-After headers.
         """
+        self.throughput_monitor.start()
+        messages_api_format: list[dict] = self._convert_conv_to_api_format(conv)
         if self.enforce_rate_limits:
-            return await self.generate_response_with_rate_limits(conv, inf_gen_config)
-        else:
-            # max_retries and wait_seconds are object attributes, and cannot be written around the
-            # generate_response function
-            # So we need to wrap the _call_api function with the retry decorator
-            @retry(
-                stop=stop_after_attempt(inf_gen_config.max_retries),
-                wait=wait_fixed(inf_gen_config.wait_seconds),
-            )
-            def _call_api_wrapper() -> str:
-                messages_api_format: list[dict] = self._convert_conv_to_api_format(conv)
-                response = self._call_api(messages_api_format, inf_gen_config)
-                parsed_response = self._parse_api_output(response, inf_gen_config)
-                return parsed_response
-
-            return _call_api_wrapper()
+            input_tokens = self._count_tokens(messages_api_format)
+            logger.debug(f"Input tokens: {input_tokens}")
+            # NOTE: check before retrying, since a request that exceeds the token capacity can never be made
+            if input_tokens > self.rate_limiter.token_capacity:
+                raise ValueError(
+                    f"Input tokens {input_tokens} exceed token capacity {self.rate_limiter.token_capacity} "
+                    f"(TPM limit {self.TPM_LIMIT}, utilization {self.rate_limit_utilization})"
+                )
+
+        # max_retries and wait_seconds are object attributes, and cannot be written around the
+        # generate_response function
+        # So we need to wrap the _call_api function with the retry decorator
+        # NOTE: tenacity retries coroutine functions with asyncio.sleep, so waiting between
+        # tries does not block the event loop
+        @retry(
+            stop=stop_after_attempt(inf_gen_config.max_retries),
+            wait=wait_retry_after_or_exponential_jitter(inf_gen_config.wait_seconds),
+        )
+        async def _call_api_wrapper() -> LLMChatResponse:
+            if self.enforce_rate_limits:
+                # wait for the request and token buckets
+                await self.rate_limiter.acquire(input_tokens)
+            async with self.concurrency_controller.slot():
+                logger.debug(f"Calling API for {conv.uid}")
+                response = await self._call_api(messages_api_format, inf_gen_config, use_async=True)
+            parsed_response = self._parse_api_output(response, inf_gen_config)
+
+            total_tokens = get_total_tokens(parsed_response.usage)
+            self.throughput_monitor.record(total_tokens or 0)
+            if self.enforce_rate_limits and total_tokens is not None:
+                # the input tokens are an estimate (and exclude the output tokens),
+                # so correct the token bucket with the actual usage
+                self.rate_limiter.reconcile(input_tokens, total_tokens)
+            return parsed_response
+
+        return await _call_api_wrapper()
 
     async def batch_generate_response(
         self, convs: list[Conversation], inf_gen_config: InferenceGenerationConfig
@@ -404,3 +408,14 @@ class CommonLLMChat(LLMChat):
             *[self.generate_response(conv, inf_gen_config) for conv in convs]
         )
         return parsed_responses
+
+    def log_throughput(self) -> None:
+        """Log the achieved requests and tokens per minute, e.g. to tune the rate limits config file"""
+        stats = self.throughput_monitor.get_stats()
+        if stats["requests"] > 0:
+            logger.info(
+                f"Throughput for {self.model_name}: {stats['rpm']:.1f} RPM, {stats['tpm']:.0f} TPM "
+                f"over {stats['requests']} requests "
+                f"(rate limits: {self.RPM_LIMIT} RPM, {self.TPM_LIMIT} TPM, "
+                f"concurrency limit: {int(self.concurrency_controller.limit)})"
+            )
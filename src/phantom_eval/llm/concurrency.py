@@ -0,0 +1,184 @@
+"""Adaptive concurrency and retries for LLM APIs
+
+`AdaptiveConcurrencyController` bounds the number of in-flight API calls with an AIMD
+(additive-increase/multiplicative-decrease) policy:
+- While the latency of successful calls is stable, the limit grows by about 1 per `limit` calls.
+- When the provider throttles (HTTP 429) or is overloaded (HTTP 5xx), the limit is multiplied by
+  `backoff_factor`. Calls that started before the last decrease do not decrease it again, so a burst
+  of errors from the same window only backs off once.
+
+`wait_retry_after_or_exponential_jitter` is a tenacity wait strategy that honors the `Retry-After`
+header of the failed call, and otherwise backs off exponentially with jitter.
+
+`ThroughputMonitor` records the requests and tokens of successful calls to report the achieved
+RPM and TPM, e.g. to tune `llms_rpm_tpm_config.yaml`.
+"""
+
+import asyncio
+import email.utils
+import random
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from tenacity import RetryCallState
+
+# Maximum number of seconds to wait between tries, unless the provider asks for more with Retry-After
+MAX_BACKOFF_SECONDS = 60
+
+
+def get_status_code(exception: BaseException) -> int | None:
+    """Get the HTTP status code of an exception raised by an LLM client, if any"""
+    # openai and anthropic use `status_code`, google uses `code`, together uses `http_status`
+    for attr in ["status_code", "code", "http_status"]:
+        value = getattr(exception, attr, None)
+        if isinstance(value, int):
+            return int(value)
+    return getattr(getattr(exception, "response", None), "status_code", None)
+
+
+def is_throttling_error(exception: BaseException) -> bool:
+    """Whether the exception means that the provider is rate limiting (429) or overloaded (5xx)"""
+    status_code = get_status_code(exception)
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+
+def get_retry_after(exception: BaseException) -> float | None:
+    """Get the number of seconds to wait from the Retry-After headers of the exception's response, if any"""
+    headers = getattr(exception, "headers", None) or getattr(
+        getattr(exception, "response", None), "headers", None
+    )
+    if not headers:
+        return None
+    try:
+        if (value := headers.get("retry-after-ms")) is not None:
+            # OpenAI
+            return float(value) / 1000
+        if (value := headers.get("retry-after")) is not None:
+            try:
+                return float(value)
+            except ValueError:
+                # HTTP date
+                return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class wait_retry_after_or_exponential_jitter:
+    """Tenacity wait strategy that honors Retry-After and otherwise backs off exponentially with jitter
+
+    The n-th retry waits between `wait_seconds * 2 ** (n - 1) / 2` and `wait_seconds * 2 ** (n - 1)`
+    seconds (capped at `MAX_BACKOFF_SECONDS`), so concurrent calls that fail together spread out.
+    """
+
+    def __init__(self, wait_seconds: float):
+        self.wait_seconds = wait_seconds
+
+    def __call__(self, retry_state: RetryCallState) -> float:
+        exception = retry_state.outcome.exception() if retry_state.outcome else None
+        if exception is not None and (retry_after := get_retry_after(exception)) is not None:
+            return retry_after
+        backoff = min(self.wait_seconds * 2 ** (retry_state.attempt_number - 1), MAX_BACKOFF_SECONDS)
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+class AdaptiveConcurrencyController:
+    def __init__(
+        self,
+        max_concurrency: int,
+        initial_concurrency: int = 4,
+        backoff_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        latency_smoothing: float = 0.1,
+    ):
+        """
+        Initialize the concurrency controller.
+
+        Args:
+            max_concurrency (int): Maximum number of concurrent calls.
+            initial_concurrency (int): Number of concurrent calls to start with.
+                Defaults to 4.
+            backoff_factor (float): Factor to multiply the limit by when the provider throttles.
+                Defaults to 0.5.
+            latency_tolerance (float): The limit only increases if the latency of a call is at most
+                `latency_tolerance` times the average latency.
+                Defaults to 2.0.
+            latency_smoothing (float): Weight of the latest call in the exponential moving average
+                of the latency.
+                Defaults to 0.1.
+        """
+        self.max_concurrency = max_concurrency
+        self.limit = float(min(initial_concurrency, max_concurrency))
+        self.backoff_factor = backoff_factor
+        self.latency_tolerance = latency_tolerance
+        self.latency_smoothing = latency_smoothing
+
+        self.in_flight = 0
+        self.avg_latency: float | None = None
+        self.last_decrease_time = 0.0
+        self.cond = asyncio.Condition()
+
+    def _increase(self, latency: float) -> None:
+        if self.avg_latency is None:
+            self.avg_latency = latency
+        if latency <= self.latency_tolerance * self.avg_latency:
+            # additive increase: about 1 per `limit` successful calls
+            self.limit = min(self.limit + 1 / self.limit, self.max_concurrency)
+        self.avg_latency += self.latency_smoothing * (latency - self.avg_latency)
+
+    def _decrease(self, start_time: float) -> None:
+        # calls that started before the last decrease were made with a higher limit
+        if start_time >= self.last_decrease_time:
+            self.limit = max(self.limit * self.backoff_factor, 1.0)
+            self.last_decrease_time = time.monotonic()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Wait for a free slot, and adapt the limit to the outcome of the call made in the slot"""
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        start_time = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            if is_throttling_error(e):
+                self._decrease(start_time)
+            raise
+        else:
+            self._increase(time.monotonic() - start_time)
+        finally:
+            async with self.cond:
+                self.in_flight -= 1
+                self.cond.notify_all()
+
+
+class ThroughputMonitor:
+    """Records the successful calls to report the achieved requests and tokens per minute"""
+
+    def __init__(self):
+        self.start_time: float | None = None
+        self.num_requests = 0
+        self.num_tokens = 0
+
+    def start(self) -> None:
+        """Start measuring at the first call"""
+        if self.start_time is None:
+            self.start_time = time.monotonic()
+
+    def record(self, num_tokens: int) -> None:
+        self.start()
+        self.num_requests += 1
+        self.num_tokens += num_tokens
+
+    def get_stats(self) -> dict[str, float]:
+        """Get the number of requests and tokens, and their average rates per minute since the first call"""
+        # NOTE: at least 1 second, to avoid huge rates after the first call
+        minutes = max(time.monotonic() - self.start_time, 1) / 60 if self.start_time is not None else 1
+        return {
+            "requests": self.num_requests,
+            "tokens": self.num_tokens,
+            "rpm": self.num_requests / minutes,
+            "tpm": self.num_tokens / minutes,
+        }
@@ -35,11 +35,13 @@ class GeminiChat(CommonLLMChat):
         # https://github.com/google-gemini/generative-ai-python/blob/main/docs/api/google/generativeai/GenerativeModel.md
         formatted_messages = []
         for message in conv.messages:
+            texts = []
             for content in message.content:
                 match content:
                     case ContentTextMessage(text=text):
-                        role = "model" if message.role == "assistant" else message.role
-                        formatted_messages.append({"role": role, "parts": text})
+                        texts.append(text)
+            role = "model" if message.role == "assistant" else message.role
+            formatted_messages.append({"role": role, "parts": "".join(texts)})
         return formatted_messages
 
     def _call_api(
@@ -66,6 +66,6 @@ class LlamaChat(CommonLLMChat):
 
         https://cookbook.openai.com/examples/how_to_count_tokens_with_tiktoken
         """
-        texts = [msg["content"][0]["text"] for msg in messages_api_format]
+        texts = [content["text"] for msg in messages_api_format for content in msg["content"]]
         num_tokens = len(self.encoding.encode("\n".join(texts)))
         return num_tokens
@@ -0,0 +1,125 @@
+"""Client-side rate limiting for LLM APIs
+
+`TokenBucketRateLimiter` keeps two token buckets: one for requests (RPM) and one for tokens (TPM).
+Each bucket holds at most a minute's worth of its limit and refills continuously at limit / 60 per second,
+which matches how providers meter usage.
+
+Token counts are estimated before a call, so the token bucket is reconciled with the actual `usage` of
+the response afterwards (see `TokenBucketRateLimiter.reconcile`).
+
+By default the buckets live in memory. If `state_fpath` is given, the buckets are stored in that file and
+every update holds an exclusive `fcntl.flock` on it, so that several processes (e.g. parallel
+`phantom_eval` jobs using the same API key) share a single quota.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import time
+from collections.abc import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucketRateLimiter:
+    def __init__(
+        self,
+        rpm_limit: int,
+        tpm_limit: int,
+        utilization: float = 1.0,
+        state_fpath: str | None = None,
+    ):
+        """
+        Initialize the rate limiter.
+
+        Args:
+            rpm_limit (int): Maximum number of requests per minute.
+            tpm_limit (int): Maximum number of tokens per minute.
+            utilization (float): Fraction of the limits to use, e.g. 0.95 to leave some headroom.
+                Defaults to 1.0.
+            state_fpath (str | None): Path to the file that stores the buckets, to share them across
+                processes. If None, the buckets are stored in memory.
+                Defaults to None.
+        """
+        assert 0 < utilization <= 1, "Utilization must be in (0, 1]"
+        self.request_capacity = rpm_limit * utilization
+        self.token_capacity = tpm_limit * utilization
+        # refill rates per second
+        self.request_rate = self.request_capacity / 60
+        self.token_rate = self.token_capacity / 60
+        self.state_fpath = state_fpath
+        self.state = self._get_full_state()
+
+    def _get_full_state(self) -> dict[str, float]:
+        return {"requests": self.request_capacity, "tokens": self.token_capacity, "time": time.time()}
+
+    def _refill(self, state: dict[str, float]) -> None:
+        """Refill the buckets for the time elapsed since the last update"""
+        now = time.time()
+        elapsed = max(now - state["time"], 0)
+        state["requests"] = min(self.request_capacity, state["requests"] + elapsed * self.request_rate)
+        state["tokens"] = min(self.token_capacity, state["tokens"] + elapsed * self.token_rate)
+        state["time"] = now
+
+    def _transact(self, update: Callable[[dict[str, float]], float]) -> float:
+        """Apply `update` to the state of the buckets atomically and return its result"""
+        if self.state_fpath is None:
+            # NOTE: updates do not await, so they are atomic within the event loop
+            return update(self.state)
+
+        with open(self.state_fpath, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                state = json.loads(content) if content else self._get_full_state()
+                result = update(state)
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return result
+
+    def _try_acquire(self, state: dict[str, float], num_tokens: int) -> float:
+        """Take a request and `num_tokens` tokens from the buckets if both are available
+
+        Returns:
+            float: 0 if acquired, otherwise the number of seconds until both buckets are expected
+                to have enough capacity.
+        """
+        self._refill(state)
+        if state["requests"] >= 1 and state["tokens"] >= num_tokens:
+            state["requests"] -= 1
+            state["tokens"] -= num_tokens
+            return 0.0
+        return max(
+            (1 - state["requests"]) / self.request_rate,
+            (num_tokens - state["tokens"]) / self.token_rate,
+            # guard against waiting for 0 seconds due to floating point errors
+            1e-3,
+        )
+
+    async def acquire(self, num_tokens: int) -> None:
+        """Wait until a request with `num_tokens` (estimated) tokens can be made"""
+        if num_tokens > self.token_capacity:
+            raise ValueError(f"Input tokens {num_tokens} exceed token capacity {self.token_capacity}")
+        while (wait := self._transact(lambda state: self._try_acquire(state, num_tokens))) > 0:
+            logger.debug(f"Sleeping for {wait:.3f}s to satisfy rate limits")
+            await asyncio.sleep(wait)
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Correct the token bucket with the actual number of tokens used by a request
+
+        The token bucket may become negative, in which case new requests wait until it is refilled.
+        """
+
+        def update(state: dict[str, float]) -> float:
+            self._refill(state)
+            state["tokens"] -= actual_tokens - estimated_tokens
+            return state["tokens"]
+
+        tokens = self._transact(update)
+        logger.debug(f"Reconciled {estimated_tokens=} with {actual_tokens=}, {tokens=:.0f} tokens left")
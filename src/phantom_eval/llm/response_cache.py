@@ -0,0 +1,197 @@
+"""Persistent cache of LLM responses
+
+`LLMResponseCache` stores responses in a SQLite database, keyed on a SHA-256 hash of the model id,
+the messages of the conversation and the `InferenceGenerationConfig` (including the seed, but not the
+retry parameters).
+The model id identifies the weights that generate the responses, e.g. the server, the model name and the
+LoRA adapter, so that a fine-tuned adapter does not share responses with its base model.
+When the responses exceed `max_size_mb`, the least recently used responses are evicted.
+
+`CachedLLMChat` wraps an `LLMChat` so that only uncached conversations are sent to the model.
+Responses that come through the cache have a `cache_hit` entry (0 or 1) in their `usage`, so the hits
+are counted when the usage is aggregated. By default, responses sampled with a nonzero temperature are
+not cached, since methods like self-consistency send the same conversation several times to get
+different responses.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+
+from phantom_eval._types import Conversation, LLMChatResponse
+from phantom_eval.llm.common import InferenceGenerationConfig, LLMChat
+
+logger = logging.getLogger(__name__)
+
+# fields of the InferenceGenerationConfig that do not affect the response
+RETRY_PARAMS = {"max_retries", "wait_seconds"}
+
+
+class LLMResponseCache:
+    def __init__(self, db_path: str, max_size_mb: float = 1024):
+        """
+        Initialize the response cache.
+
+        Args:
+            db_path (str): Path to the SQLite database, created if it does not exist.
+            max_size_mb (float): Maximum total size of the cached responses in MB.
+                Defaults to 1024.
+        """
+        self.db_path = db_path
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+
+        # NOTE: WAL mode lets several processes read the cache while one of them writes
+        self.conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, last_access REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    @staticmethod
+    def get_key(model_id: str, conv: Conversation, inf_gen_config: InferenceGenerationConfig) -> str:
+        """Get the content hash of a request.
+
+        The uid of the conversation and the retry parameters of the generation config, which do not affect
+        the response, are not part of the key.
+        """
+        content = json.dumps(
+            {
+                "model": model_id,
+                "messages": [message.model_dump() for message in conv.messages],
+                "inf_gen_config": inf_gen_config.model_dump(exclude=RETRY_PARAMS),
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def get(self, key: str) -> LLMChatResponse | None:
+        row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        return LLMChatResponse.model_validate_json(row[0])
+
+    def put(self, key: str, model_id: str, response: LLMChatResponse) -> None:
+        value = response.model_dump_json()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+            (key, model_id, value, len(value), time.time()),
+        )
+        self._evict()
+
+    def _evict(self) -> None:
+        """Evict the least recently used responses until the cache fits in `max_size`"""
+        (size,) = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if size <= self.max_size:
+            return
+        # evict down to 90% of the maximum size, so that eviction does not run after every insertion
+        excess = size - int(0.9 * self.max_size)
+        keys = []
+        for key, entry_size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            keys.append((key,))
+            excess -= entry_size
+            if excess <= 0:
+                break
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", keys)
+        logger.debug(f"Evicted {len(keys)} responses from the cache at {self.db_path}")
+
+    def get_stats(self) -> dict[str, int]:
+        (num_responses, size) = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "responses": num_responses, "size": size}
+
+
+class CachedLLMChat(LLMChat):
+    """Wraps an `LLMChat` to reuse cached responses. Other attributes are delegated to the wrapped object."""
+
+    def __init__(
+        self,
+        llm_chat: LLMChat,
+        cache: LLMResponseCache,
+        cache_nonzero_temperature: bool = False,
+        model_id: str | None = None,
+    ):
+        """
+        Initialize the cached LLM chat object.
+
+        Args:
+            llm_chat (LLMChat): The LLM chat object to wrap.
+            cache (LLMResponseCache): The response cache.
+            cache_nonzero_temperature (bool): Whether to cache responses sampled with a nonzero temperature.
+                Defaults to False.
+            model_id (str | None): The identity of the model in the cache keys, which should distinguish
+                models with the same name, e.g. LoRA adapters of the same base model.
+                Defaults to the model name.
+        """
+        super().__init__(llm_chat.model_name)
+        self.llm_chat = llm_chat
+        self.model_id = model_id if model_id is not None else llm_chat.model_name
+        self.cache = cache
+        self.cache_nonzero_temperature = cache_nonzero_temperature
+
+    def __getattr__(self, name: str):
+        # NOTE: guard against infinite recursion before `llm_chat` is set, e.g. when unpickling
+        if name == "llm_chat":
+            raise AttributeError(name)
+        return getattr(self.llm_chat, name)
+
+    def _is_cacheable(self, inf_gen_config: InferenceGenerationConfig) -> bool:
+        return self.cache_nonzero_temperature or inf_gen_config.temperature == 0
+
+    def _put(self, key: str, response: LLMChatResponse) -> LLMChatResponse:
+        # responses with errors are not cached, so that they are retried
+        if response.error is None:
+            self.cache.put(key, self.model_id, response)
+        return response.model_copy(update=dict(usage={**response.usage, "cache_hit": 0}))
+
+    @staticmethod
+    def _hit(response: LLMChatResponse) -> LLMChatResponse:
+        return response.model_copy(update=dict(usage={**response.usage, "cache_hit": 1}))
+
+    async def generate_response(
+        self, conv: Conversation, inf_gen_config: InferenceGenerationConfig
+    ) -> LLMChatResponse:
+        if not self._is_cacheable(inf_gen_config):
+            return await self.llm_chat.generate_response(conv, inf_gen_config)
+
+        key = self.cache.get_key(self.model_id, conv, inf_gen_config)
+        if (response := self.cache.get(key)) is not None:
+            return self._hit(response)
+        return self._put(key, await self.llm_chat.generate_response(conv, inf_gen_config))
+
+    async def batch_generate_response(
+        self, convs: list[Conversation], inf_gen_config: InferenceGenerationConfig
+    ) -> list[LLMChatResponse]:
+        if not self._is_cacheable(inf_gen_config):
+            return await self.llm_chat.batch_generate_response(convs, inf_gen_config)
+
+        keys = [self.cache.get_key(self.model_id, conv, inf_gen_config) for conv in convs]
+        responses = [self.cache.get(key) for key in keys]
+        # only generate responses for the conversations that are not cached
+        misses = [i for i, response in enumerate(responses) if response is None]
+        responses = [self._hit(response) if response is not None else None for response in responses]
+        if misses:
+            generated = await self.llm_chat.batch_generate_response(
+                [convs[i] for i in misses], inf_gen_config
+            )
+            for i, response in zip(misses, generated):
+                responses[i] = self._put(keys[i], response)
+        return responses
+
+    def log_throughput(self) -> None:
+        stats = self.cache.get_stats()
+        logger.info(
+            f"Response cache at {self.cache.db_path}: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['responses']} responses ({stats['size'] / 1024 / 1024:.1f} MB)"
+        )
+        if hasattr(self.llm_chat, "log_throughput"):
+            self.llm_chat.log_throughput()
@@ -32,10 +32,12 @@ class TogetherChat(CommonLLMChat):
         """
         formatted_messages = []
         for message in conv.messages:
+            texts = []
             for content in message.content:
                 match content:
                     case ContentTextMessage(text=text):
-                        formatted_messages.append({"role": message.role, "content": text})
+                        texts.append(text)
+            formatted_messages.append({"role": message.role, "content": "".join(texts)})
         return formatted_messages
 
     def _update_rate_limits(self, server: str, model_name: str, usage_tier: int) -> None:
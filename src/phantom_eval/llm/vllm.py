@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import uuid
 
@@ -34,8 +35,8 @@ class VLLMChat(CommonLLMChat):
                 Defaults to None.
             use_api (bool): Whether to use the vllm server or offline inference
                 Defaults to False.
-                NOTE: offline inference only works for batch_generate_response
-                To maximize performance, set `use_api=False` when running Nshot and CoT agents
+                NOTE: with offline inference, concurrent calls to generate_response are generated together
+                in one batch, e.g. the next step of all ReAct agents that run with asyncio.gather
             port (int): Port number for the vllm server.
                 Defaults to 8000.
         """
@@ -64,7 +65,8 @@ class VLLMChat(CommonLLMChat):
             except openai.APIConnectionError as e:
                 logger.error(
                     "Make sure to launch the vllm server using "
-                    "vllm serve MODEL_NAME_OR_PATH --api-key token-abc123 --tensor_parallel_size NUM_GPUS"
+                    "vllm serve MODEL_NAME_OR_PATH --api-key token-abc123 --tensor_parallel_size NUM_GPUS "
+                    "--enable-prefix-caching"
                 )
                 raise e
         else:
@@ -86,17 +88,25 @@ class VLLMChat(CommonLLMChat):
                 max_model_len=self.max_model_len,
                 tensor_parallel_size=self.tensor_parallel_size,
                 enable_lora=self.lora_path is not None,
+                # Reuse the KV cache of prompt prefixes shared across requests, e.g. the evidence
+                enable_prefix_caching=True,
             )
             # get tokenizer for constructing prompt
             self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, trust_remote_code=True)
 
+            # Calls to generate_response that wait for the next offline batch
+            self._offline_requests: list[tuple[Conversation, InferenceGenerationConfig, asyncio.Future]] = []
+            self._offline_batch_task: asyncio.Task | None = None
+
     def _convert_conv_to_api_format(self, conv: Conversation) -> list[dict]:
         formatted_messages = []
         for message in conv.messages:
+            texts = []
             for content in message.content:
                 match content:
                     case ContentTextMessage(text=text):
-                        formatted_messages.append({"role": message.role, "content": text})
+                        texts.append(text)
+            formatted_messages.append({"role": message.role, "content": "".join(texts)})
         return formatted_messages
 
     def _parse_api_output(
@@ -148,6 +158,9 @@ class VLLMChat(CommonLLMChat):
     async def generate_response(
         self, conv: Conversation, inf_gen_config: InferenceGenerationConfig
     ) -> LLMChatResponse:
+        if not self.use_api:
+            return await self._generate_offline_response(conv, inf_gen_config)
+
         assert self.client is not None, "Client is not initialized."
         messages_api_format: list[dict] = self._convert_conv_to_api_format(conv)
         response = await self._call_api(messages_api_format, inf_gen_config, use_async=True)
@@ -165,35 +178,98 @@ class VLLMChat(CommonLLMChat):
             )
             return parsed_responses
         else:
-            # Additional stop token for all models is <|eot_id|>
-            sampling_params = SamplingParams(
-                temperature=inf_gen_config.temperature,
-                top_p=inf_gen_config.top_p,
-                top_k=inf_gen_config.top_k,
-                repetition_penalty=inf_gen_config.repetition_penalty,
-                stop=inf_gen_config.stop_sequences + ["<|eot_id|>"],
-                max_tokens=inf_gen_config.max_tokens,
-                seed=inf_gen_config.seed,
+            return self._generate_offline(convs, self._get_sampling_params(inf_gen_config))
+
+    def _get_sampling_params(self, inf_gen_config: InferenceGenerationConfig) -> SamplingParams:
+        # Additional stop token for all models is <|eot_id|>
+        return SamplingParams(
+            temperature=inf_gen_config.temperature,
+            top_p=inf_gen_config.top_p,
+            top_k=inf_gen_config.top_k,
+            repetition_penalty=inf_gen_config.repetition_penalty,
+            stop=inf_gen_config.stop_sequences + ["<|eot_id|>"],
+            max_tokens=inf_gen_config.max_tokens,
+            seed=inf_gen_config.seed,
+        )
+
+    def _generate_offline(
+        self, convs: list[Conversation], sampling_params: SamplingParams | list[SamplingParams]
+    ) -> list[LLMChatResponse]:
+        """
+        Generate responses for the conversations with vllm batched offline inference.
+
+        Args:
+            convs (list[Conversation]): The conversations to generate responses for.
+            sampling_params (SamplingParams | list[SamplingParams]): The sampling params for all
+                conversations, or for each conversation.
+        """
+        prompts = [
+            self.tokenizer.apply_chat_template(
+                self._convert_conv_to_api_format(conv), tokenize=False, add_generation_prompt=True
             )
-            prompts = [
-                self.tokenizer.apply_chat_template(
-                    self._convert_conv_to_api_format(conv), tokenize=False, add_generation_prompt=True
-                )
-                for conv in convs
-            ]
+            for conv in convs
+        ]
 
-            if self.lora_path is None:
-                lora_request = None
-            else:
-                # https://docs.vllm.ai/en/latest/features/lora.html
-                # Arguments to LoRARequest are: (a human-identifiable name, a unique id for LoRA module,
-                # and the path to the LoRA weights)
-                unique_id = uuid.uuid4().int % (2**32)  # Unique 32-bit integer
-                lora_request = LoRARequest("lora", unique_id, self.lora_path)
-
-            responses = self.llm.generate(prompts, sampling_params, lora_request=lora_request)
-            parsed_responses = [self._parse_batch_vllm_output(response) for response in responses]
-            return parsed_responses
+        if self.lora_path is None:
+            lora_request = None
+        else:
+            # https://docs.vllm.ai/en/latest/features/lora.html
+            # Arguments to LoRARequest are: (a human-identifiable name, a unique id for LoRA module,
+            # and the path to the LoRA weights)
+            unique_id = uuid.uuid4().int % (2**32)  # Unique 32-bit integer
+            lora_request = LoRARequest("lora", unique_id, self.lora_path)
+
+        responses = self.llm.generate(prompts, sampling_params, lora_request=lora_request)
+        parsed_responses = [self._parse_batch_vllm_output(response) for response in responses]
+        return parsed_responses
+
+    async def _generate_offline_response(
+        self, conv: Conversation, inf_gen_config: InferenceGenerationConfig
+    ) -> LLMChatResponse:
+        """
+        Queue the conversation for the next offline batch, and wait for its response.
+
+        Multi-turn agents (e.g. ReAct) that run concurrently with asyncio.gather each wait here for the
+        response of their current step. So one batch advances all active agents by one step, and agents
+        that are finished no longer add requests to the batches.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._offline_requests.append((conv, inf_gen_config, future))
+        if self._offline_batch_task is None:
+            self._offline_batch_task = asyncio.create_task(self._run_offline_batches())
+        return await future
+
+    async def _run_offline_batches(self) -> None:
+        """Generate the queued requests in batches until no requests are left"""
+        try:
+            while self._offline_requests:
+                # Yield to the event loop until no more requests are queued, so that all agents
+                # that are ready for their next step are in the batch
+                num_requests = 0
+                while num_requests != len(self._offline_requests):
+                    num_requests = len(self._offline_requests)
+                    await asyncio.sleep(0)
+
+                requests, self._offline_requests = self._offline_requests, []
+                convs = [conv for conv, _, _ in requests]
+                # NOTE: the steps of an agent have different stop sequences, so each request gets its
+                # own sampling params
+                sampling_params = [
+                    self._get_sampling_params(inf_gen_config) for _, inf_gen_config, _ in requests
+                ]
+                logger.debug(f"Generating {len(requests)} queued requests in one offline batch")
+                try:
+                    responses = self._generate_offline(convs, sampling_params)
+                except Exception as e:
+                    for _, _, future in requests:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, _, future), response in zip(requests, responses):
+                    if not future.done():
+                        future.set_result(response)
+        finally:
+            self._offline_batch_task = None
 
     def _count_tokens(self, messages_api_format: list[dict]) -> int:
         """No need to count tokens for vLLM models"""
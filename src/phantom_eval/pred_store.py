@@ -0,0 +1,164 @@
+"""Columnar storage for predictions
+
+Predictions are stored in an append-only Parquet dataset with one file per batch, partitioned by
+method, model, split and seed:
+
+    {output_dir}/preds_parquet/{method}/model={model}/split={split}/seed={seed}/{batch}.parquet
+
+Nested fields (e.g. `usage`, `inference_params`) are stored as JSON strings, and the `metadata` fields are
+stored as flat columns prefixed with "_" (e.g. `_model`, `_split`), which is the layout used for analysis
+in `phantom_eval.evaluate_utils`. Reading all predictions of a method is a single columnar scan.
+
+Agent interactions are large and rarely needed for analysis, so they are stored separately as
+gzip-compressed JSON lines with the same partitioning:
+
+    {output_dir}/interactions/{method}/model={model}/split={split}/seed={seed}/{batch}.jsonl.gz
+"""
+
+import gzip
+import json
+import os
+from glob import glob
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+PREDS_PARQUET_DIR = "preds_parquet"
+INTERACTIONS_DIR = "interactions"
+# keys of the prediction metadata that become columns prefixed with "_"
+METADATA = ["model", "dataset", "split", "batch_size", "batch_number", "type"]
+# keys of the inference parameters that become columns prefixed with "_"
+SAMPLING_PARAMS = ["seed"]
+# fields that are stored as JSON strings
+JSON_COLUMNS = ["prolog_query_results", "inference_params", "model_kwargs", "agent_kwargs", "usage"]
+# columns that identify the predictions of a run
+RUN_COLUMNS = ["_model", "_split", "_seed"]
+# schema of the Parquet files, so that columns with only null values in a batch (e.g. `error`) have the same
+# type in every file
+PREDS_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("true", pa.list_(pa.string())),
+        ("pred", pa.string()),
+        ("prolog_query", pa.string()),
+        ("error", pa.string()),
+        ("_model", pa.string()),
+        ("_dataset", pa.string()),
+        ("_split", pa.string()),
+        ("_batch_size", pa.int64()),
+        ("_batch_number", pa.int64()),
+        ("_type", pa.int64()),
+        ("_seed", pa.int64()),
+        *[(key, pa.string()) for key in JSON_COLUMNS],
+    ]
+)
+
+
+def get_pred_parquet_path(
+    output_dir: str, method: str, model_name: str, split: str, seed: int, batch_name: str
+) -> Path:
+    """Gets the path of the Parquet file with the predictions of a batch.
+
+    Args:
+        output_dir: path to the output directory
+        method: method used for inference
+        model_name: model name, "/" is replaced by "--"
+        split: dataset split
+        seed: inference seed
+        batch_name: name of the file within the partition, e.g. "bs=10__bn=1"
+    """
+    return (
+        Path(output_dir)
+        / PREDS_PARQUET_DIR
+        / method
+        / f"model={model_name.replace('/', '--')}"
+        / f"split={split}"
+        / f"seed={seed}"
+        / f"{batch_name}.parquet"
+    )
+
+
+def get_interactions_path(pred_path: Path) -> Path:
+    """Gets the path of the interactions file that belongs to a Parquet file of predictions."""
+    parts = list(pred_path.parts)
+    parts[len(parts) - 1 - parts[::-1].index(PREDS_PARQUET_DIR)] = INTERACTIONS_DIR
+    return Path(*parts).with_suffix(".jsonl.gz")
+
+
+def write_preds_parquet(preds: dict[str, dict], pred_path: Path) -> None:
+    """Writes the predictions of a batch to a Parquet file, and their interactions to a separate file.
+
+    Args:
+        preds: dictionary from question id to prediction, as built by `phantom_eval.__main__.save_preds`
+        pred_path: path of the Parquet file, see `get_pred_parquet_path`
+    """
+    rows = []
+    interactions = []
+    for uid, pred in preds.items():
+        row = {
+            "id": uid,
+            "true": list(pred["true"]),
+            "pred": pred["pred"],
+            "prolog_query": pred["prolog_query"],
+            "error": pred["error"],
+        }
+        for key in METADATA:
+            row["_" + key] = pred["metadata"][key]
+        for key in SAMPLING_PARAMS:
+            row["_" + key] = pred["inference_params"][key]
+        for key in JSON_COLUMNS:
+            row[key] = json.dumps(pred[key])
+        rows.append(row)
+        if pred["interaction"]:
+            interactions.append(
+                {"id": uid, **{k: row[k] for k in RUN_COLUMNS}, "interaction": pred["interaction"]}
+            )
+
+    pred_path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first, so that readers never see a partially written file
+    tmp_path = pred_path.with_suffix(".parquet.tmp")
+    pq.write_table(pa.Table.from_pylist(rows, schema=PREDS_SCHEMA), tmp_path)
+    os.replace(tmp_path, pred_path)
+
+    if interactions:
+        interactions_path = get_interactions_path(pred_path)
+        interactions_path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(interactions_path, "wt") as f:
+            for interaction in interactions:
+                f.write(json.dumps(interaction) + "\n")
+
+
+def read_preds_parquet(output_dir: str, method: str) -> pd.DataFrame:
+    """Reads all predictions of a method from the Parquet dataset.
+
+    Returns:
+        pd.DataFrame: one row per prediction, with the JSON fields decoded.
+            Empty if there are no predictions.
+    """
+    root = Path(output_dir) / PREDS_PARQUET_DIR / method
+    files = sorted(glob(str(root / "**" / "*.parquet"), recursive=True))
+    if len(files) == 0:
+        return pd.DataFrame()
+    df = ds.dataset(files, schema=PREDS_SCHEMA, format="parquet").to_table().to_pandas()
+    for key in JSON_COLUMNS:
+        df[key] = [json.loads(value) for value in df[key]]
+    return df
+
+
+def read_interactions(output_dir: str, method: str) -> pd.DataFrame:
+    """Reads all agent interactions of a method.
+
+    Returns:
+        pd.DataFrame: with columns "id", "_model", "_split", "_seed" and "interaction"
+    """
+    files = sorted(
+        glob(os.path.join(output_dir, INTERACTIONS_DIR, method, "**", "*.jsonl.gz"), recursive=True)
+    )
+    records = []
+    for filename in files:
+        with gzip.open(filename, "rt") as f:
+            records.extend(json.loads(line) for line in f)
+    return pd.DataFrame(records, columns=["id", *RUN_COLUMNS, "interaction"])
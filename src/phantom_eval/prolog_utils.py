@@ -1,94 +1,384 @@
+import asyncio
+import contextlib
 import logging
+import multiprocessing
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
 
 from phantom_eval import constants
 from phantom_eval.llm import LLMChatResponse
-from phantom_wiki.facts.database import Database
+from phantom_wiki.facts.database import QUERY_TOKEN_PATTERN, Database
 
+# Variable bound by call_with_inference_limit/3 in the worker processes
+INFERENCE_LIMIT_VARIABLE = "InferenceLimitResult__"
+# Dynamic predicate that stores the bindings after each step of an incremental evaluation
+STEP_BINDINGS_PREDICATE = "phantom_eval_step_bindings"
 
-def split_prolog_query(query: str) -> tuple[list[str], str | None]:
-    """Split a compound Prolog query into individual queries and get final variable.
-    This is a helper function for get_prolog_results that is used for debugging purposes.
+
+def _to_picklable(value):
+    """Converts a value in a pyswip result to a type that can be sent between processes."""
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    if isinstance(value, (str, int, float)):
+        return value
+    return str(value)
+
+
+def _prolog_worker(data_path: str, inference_limit: int, conn) -> None:
+    """Loop of a worker process in PrologQueryPool.
+
+    Loads the database, then answers queries received on `conn` until None is received or the pipe is
+    closed. Each reply is a tuple ("ok", results) or ("error", message).
+    """
+    db = Database.from_disk(data_path)
+    conn.send(("ok", None))
+    while True:
+        try:
+            query = conn.recv()
+        except EOFError:
+            break
+        if query is None:
+            break
+        try:
+            results = db.query(
+                f"call_with_inference_limit(({query}), {inference_limit}, {INFERENCE_LIMIT_VARIABLE})"
+            )
+            if any(_to_picklable(r[INFERENCE_LIMIT_VARIABLE]) == "inference_limit_exceeded" for r in results):
+                conn.send(("error", f"Inference limit of {inference_limit} exceeded"))
+                continue
+            results = [
+                {k: _to_picklable(v) for k, v in r.items() if k != INFERENCE_LIMIT_VARIABLE} for r in results
+            ]
+            conn.send(("ok", results))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+class PrologQueryPool:
+    """Executes Prolog queries in a pool of worker processes with an async API.
+
+    Each worker loads its own copy of the database, so queries do not block the event loop and
+    a runaway query can be stopped by killing its worker. Every query is run with an inference limit
+    (see `call_with_inference_limit/3`) and a timeout in seconds; when the timeout expires, the worker
+    is killed and replaced by a fresh one. At most `num_workers` queries run concurrently.
+
+    Example:
+    ```python
+    async with PrologQueryPool("facts.pl", num_workers=4, timeout=10) as pool:
+        results = await pool.query("hobby(X, 'bus spotting'), father(X, Y)")
+    ```
+    """
+
+    def __init__(
+        self,
+        data_path: str,
+        num_workers: int = 1,
+        timeout: float = 10.0,
+        inference_limit: int = 10_000_000,
+    ):
+        """
+        Args:
+            data_path: path to the Prolog database file
+            num_workers: number of worker processes, i.e. maximum number of concurrent queries
+            timeout: maximum number of seconds to wait for the results of a query
+            inference_limit: maximum number of logical inferences per query
+        """
+        assert num_workers >= 1, "num_workers must be >= 1"
+        self.data_path = data_path
+        self.num_workers = num_workers
+        self.timeout = timeout
+        self.inference_limit = inference_limit
+        # NOTE: spawn the workers so that each worker has its own Prolog engine
+        self._context = multiprocessing.get_context("spawn")
+        self._idle_workers: asyncio.Queue | None = None
+
+    def _start_worker(self) -> tuple:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_prolog_worker, args=(self.data_path, self.inference_limit, child_conn), daemon=True
+        )
+        process.start()
+        child_conn.close()
+        # Wait until the database is loaded
+        parent_conn.recv()
+        return process, parent_conn
+
+    @staticmethod
+    def _stop_worker(worker: tuple, kill: bool = False) -> None:
+        process, conn = worker
+        if kill:
+            process.kill()
+        else:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        process.join()
+        conn.close()
+
+    def _execute(self, worker: tuple, query: str) -> tuple[str, list[dict] | str]:
+        _, conn = worker
+        conn.send(query)
+        if not conn.poll(self.timeout):
+            raise TimeoutError(f"Query timed out after {self.timeout} seconds")
+        return conn.recv()
+
+    async def start(self) -> None:
+        """Starts the worker processes."""
+        self._idle_workers = asyncio.Queue()
+        workers = await asyncio.gather(
+            *[asyncio.to_thread(self._start_worker) for _ in range(self.num_workers)]
+        )
+        for worker in workers:
+            self._idle_workers.put_nowait(worker)
+
+    async def close(self) -> None:
+        """Stops the worker processes after their current queries have finished."""
+        for _ in range(self.num_workers):
+            worker = await self._idle_workers.get()
+            await asyncio.to_thread(self._stop_worker, worker)
+        self._idle_workers = None
+
+    async def __aenter__(self) -> "PrologQueryPool":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    @contextlib.asynccontextmanager
+    async def reserve(self) -> AsyncIterator[Callable[[str], Awaitable[list[dict]]]]:
+        """Reserves one worker, so that consecutive queries share the state of the worker's database
+        (e.g. facts asserted by a previous query).
+
+        Example:
+        ```python
+        async with pool.reserve() as query:
+            await query("assertz(seen(alice))")
+            results = await query("seen(X)")
+        ```
+
+        Yields:
+            Coroutine function with the same behavior as `query`, executed in the reserved worker
+        """
+        worker = await self._idle_workers.get()
+
+        async def query(query: str) -> list[dict]:
+            nonlocal worker
+            query = query.strip()
+            if query.startswith("?-"):
+                query = query[2:].strip()
+            if query.endswith("."):
+                query = query[:-1].strip()
+
+            try:
+                status, value = await asyncio.to_thread(self._execute, worker, query)
+            except (TimeoutError, EOFError, OSError) as e:
+                # Replace the stuck or crashed worker
+                self._stop_worker(worker, kill=True)
+                worker = await asyncio.to_thread(self._start_worker)
+                if isinstance(e, TimeoutError):
+                    raise
+                raise RuntimeError("Prolog worker exited unexpectedly") from e
+
+            if status == "error":
+                raise RuntimeError(value)
+            return value
+
+        try:
+            yield query
+        finally:
+            self._idle_workers.put_nowait(worker)
+
+    async def query(self, query: str) -> list[dict]:
+        """Queries the Prolog database in one of the workers.
+
+        Args:
+            query: Prolog query string, optionally starting with "?-" and ending with "."
+
+        Returns:
+            List of results, with atoms and strings decoded to str
+
+        Raises:
+            TimeoutError: if the query takes longer than `timeout` seconds
+            RuntimeError: if the query is invalid, raises an error or exceeds the inference limit
+        """
+        async with self.reserve() as query_worker:
+            return await query_worker(query)
+
+
+def parse_prolog_query(query: str) -> list[str]:
+    """Parses a compound Prolog query into the goals of its top-level conjunction.
+
+    The query is tokenized, so commas inside arguments, lists, braces and quoted atoms or strings
+    do not split goals. Unbalanced brackets (e.g. in a truncated LLM response) do not raise an error:
+    the remaining text is returned as the last goal, which fails when it is executed.
+
+    The disjunction (`;`, `|`) and if-then-else (`->`) operators bind more loosely than the comma,
+    e.g. `a, b ; c` is read as `(a, b) ; c`, so a query with one of them (or a negation `\\+`) at the top
+    level is not split, and is returned as a single goal.
+
+    Examples:
+    >>> parse_prolog_query("?- hobby(X, 'bus spotting, hiking'), member(Y, [X, Z]).")
+    ["hobby(X, 'bus spotting, hiking')", 'member(Y, [X, Z])']
 
     Args:
-        query: A Prolog query string like "?- hobby(X, 'bus spotting'), father(X, Y)."
+        query: A Prolog query string, optionally starting with "?-" and ending with "."
 
     Returns:
-        Tuple of (list of query strings, final variable letter or None)
-        Example: (["hobby(X, 'bus spotting')", "father(X, Y)"], "Y")
+        List of goal strings
     """
-
-    # First clean up the full query
     query = query.strip()
     if query.startswith("?-"):
         query = query[2:].strip()
     if query.endswith("."):
         query = query[:-1].strip()
 
-    # Split on comma but respect parentheses and quotes
-    queries = []
+    goals = []
     current = []
-    paren_count = 0
-    in_quotes = False
-
-    for char in query:
-        if char == "'" and not in_quotes:
-            in_quotes = True
-            current.append(char)
-        elif char == "'" and in_quotes:
-            in_quotes = False
-            current.append(char)
-        elif char == "(" and not in_quotes:
-            paren_count += 1
-            current.append(char)
-        elif char == ")" and not in_quotes:
-            paren_count -= 1
-            current.append(char)
-        elif char == "," and paren_count == 0 and not in_quotes:
-            queries.append("".join(current).strip())
-            current = []
-        else:
-            current.append(char)
+    depth = 0
+    prev_token = ""
+    for match in QUERY_TOKEN_PATTERN.finditer(query):
+        token = match.group()
+        if match.lastgroup == "other" and token in "([{":
+            depth += 1
+        elif match.lastgroup == "other" and token in ")]}":
+            depth = max(depth - 1, 0)
+        elif match.lastgroup == "other" and depth == 0:
+            if token in ";|" or prev_token + token in ("->", "\\+"):
+                # The top-level operator binds more loosely than the comma -> do not split
+                return [query] if query else []
+            if token == ",":
+                goals.append("".join(current).strip())
+                current = []
+                prev_token = token
+                continue
+        current.append(token)
+        prev_token = token
+    if "".join(current).strip():
+        goals.append("".join(current).strip())
+    return goals
+
 
-    if current:
-        queries.append("".join(current).strip())
+def get_prolog_variables(*goals: str) -> list[str]:
+    """Gets the named variables in Prolog goals, in order of first appearance.
+
+    Anonymous variables (`_`) are skipped, and variable-like text inside quotes is ignored.
+
+    Examples:
+    >>> get_prolog_variables("hobby(X, 'Bus spotting')", "father(X, Y_2)")
+    ['X', 'Y_2']
+    """
+    variables = {}
+    for goal in goals:
+        for match in QUERY_TOKEN_PATTERN.finditer(goal):
+            if match.lastgroup == "variable" and match.group() != "_":
+                variables[match.group()] = None
+    return list(variables)
+
+
+def split_prolog_query(query: str) -> tuple[list[str], str | None]:
+    """Split a compound Prolog query into individual queries and get final variable.
+    This is a helper function for get_prolog_results that is used for debugging purposes.
+
+    Args:
+        query: A Prolog query string like "?- hobby(X, 'bus spotting'), father(X, Y)."
+
+    Returns:
+        Tuple of (list of query strings, final variable or None)
+        Example: (["hobby(X, 'bus spotting')", "father(X, Y)"], "Y")
+    """
+    queries = parse_prolog_query(query)
 
     # Get final variable from last predicate
     final_variable = None
     if queries:
-        last_pred = queries[-1]
-        variables = [c for c in last_pred if c.isupper()]
+        variables = get_prolog_variables(queries[-1])
         if variables:
             final_variable = variables[-1]
 
     return queries, final_variable
 
 
-def get_prolog_results(
-    responses: list[LLMChatResponse], db: Database, logger: logging.Logger, debug: bool = False
+def get_step_query(step: int, sub_query: str, prev_variables: list[str], variables: list[str]) -> str:
+    """Gets the Prolog query for one step of an incremental evaluation of a compound query.
+
+    The bindings after step `step - 1` are stored as facts of STEP_BINDINGS_PREDICATE, so the sub-query
+    of step `step` is only evaluated against the previous result set instead of re-executing all
+    previous sub-queries. The query stores the new bindings and then enumerates them, so its results
+    are the same as the results of the compound query up to this step (including duplicates and
+    their order).
+
+    NOTE: a cut (!) in a sub-query only cuts within its step.
+
+    Args:
+        step: index of the step, starting from 0
+        sub_query: goal added at this step
+        prev_variables: named variables of the sub-queries before this step
+        variables: named variables of the sub-queries up to and including this step
+
+    Returns:
+        Prolog query string
+    """
+    bindings = f"{STEP_BINDINGS_PREDICATE}({step}, [{', '.join(variables)}])"
+    if step == 0:
+        # Remove the bindings of any previous evaluation
+        return (
+            f"retractall({STEP_BINDINGS_PREDICATE}(_, _)), "
+            f"forall(({sub_query}), assertz({bindings})), {bindings}"
+        )
+    prev_bindings = f"{STEP_BINDINGS_PREDICATE}({step - 1}, [{', '.join(prev_variables)}])"
+    return f"forall(({prev_bindings}, ({sub_query})), assertz({bindings})), {bindings}"
+
+
+@contextlib.asynccontextmanager
+async def _reserve_query(
+    db: Database | PrologQueryPool,
+) -> AsyncIterator[Callable[[str], Awaitable[list[dict]]]]:
+    """Yields a coroutine function that executes queries on the same database (or worker) in order."""
+    if isinstance(db, PrologQueryPool):
+        async with db.reserve() as query:
+            yield query
+    else:
+
+        async def query(query: str) -> list[dict]:
+            return db.query(query)
+
+        yield query
+
+
+async def aget_prolog_results(
+    responses: list[LLMChatResponse],
+    db: Database | PrologQueryPool,
+    logger: logging.Logger,
+    debug: bool = False,
 ) -> list[dict]:
     """Process a list of Prolog query responses and retrieve results from the database.
 
     This function takes a list of responses containing Prolog queries, executes them against
     the provided database, and returns the results along with any variable bindings. It handles
     errors gracefully, logging them and stopping execution if a query fails. The function can
-    operate in a debug mode, which executes the sub-queries as separate queries, allowing for
-    detailed tracking of each query's execution.
+    operate in a debug mode, which evaluates the sub-queries one at a time, allowing for
+    detailed tracking of each query's execution. Each sub-query is evaluated against the result set
+    of the previous ones (see `get_step_query`), so a k-hop query costs k joins instead of k^2.
 
     Args:
         responses: A list of LLMChatResponse objects, each containing a Prolog query string
                    to be executed.
-        db: An instance of the Database class used to execute the Prolog queries.
+        db: An instance of the Database class used to execute the Prolog queries, or a
+            PrologQueryPool to execute the queries of all responses concurrently in worker processes
+            with timeouts and inference limits.
         logger: A logging.Logger instance used to log errors and debug information.
         debug: A boolean flag indicating whether to run in debug mode. If set to True, the
-               function will execute all sub-queries as separate queries, allowing for
+               function will evaluate the sub-queries one step at a time, allowing for
                detailed tracking of each query's execution. If False, it will treat the
                entire query as a single compound query.
 
     Returns:
         A list of dictionaries, each containing the final value of the target variable,
         the original query string, and a list of query results. Each result includes the
-        executed query, any sub-queries added, the result of the query, and the variable
-        bindings at that point in execution.
+        executed query, any sub-queries added, the result of the query, the variable
+        bindings at that point in execution, the number of results and the time in seconds.
 
         Example:
         [
@@ -100,7 +390,9 @@ def get_prolog_results(
                         'query': "hobby(X, 'bus spotting')",
                         'sub_query_added': "hobby(X, 'bus spotting')",
                         'result': [{'X': 'John'}],
-                        'variables': {}
+                        'variables': {},
+                        'num_results': 1,
+                        'time': 0.001
                     },
                     ...
                 ]
@@ -109,8 +401,7 @@ def get_prolog_results(
         ]
     """
 
-    prolog_results = []
-    for response in responses:
+    async def get_prolog_result(response: LLMChatResponse) -> dict:
         query_results = []
         pred_query = response.pred
         sub_queries, target_variable = split_prolog_query(pred_query)
@@ -120,60 +411,74 @@ def get_prolog_results(
         # Build the compound query incrementally
         compound_query = ""
         variable_bindings = {}
+        prev_variables = []
 
-        for sub_query in sub_queries:
-            try:
-                # Add this sub_query to compound query
-                if compound_query:
-                    compound_query += f", {sub_query}"
-                else:
-                    compound_query = sub_query
-
-                # Execute the compound query up to this point
-                result = db.query(compound_query)
-
-                # Convert any bytes in the result to strings
-                decoded_result = []
-                if result:
-                    for binding in result:
-                        decoded_binding = {}
-                        for key, value in binding.items():
-                            if isinstance(value, bytes):
-                                decoded_binding[key] = value.decode("utf-8")
-                            else:
-                                # NOTE: the first if-statement doesn't seem to handle
-                                # the case when the value is a Variable
-                                # so I just convert everything else to a string
-                                decoded_binding[key] = str(value)
-                        decoded_result.append(decoded_binding)
-
-                # Store result and variable bindings
-                query_results.append(
-                    {
-                        "query": compound_query,
-                        "sub_query_added": sub_query,
-                        "result": decoded_result,
-                        "variables": variable_bindings.copy(),
-                    }
-                )
-
-                # Update variable bindings from result
-                if decoded_result:
-                    for binding in decoded_result:
-                        variable_bindings.update(binding)
-
-            except Exception as e:
-                logger.error(f"Query failed: {compound_query}")
-                logger.error(f"Error: {str(e)}")
-                query_results.append(
-                    {
-                        "query": compound_query,
-                        "sub_query_added": sub_query,
-                        "error": str(e),
-                        "variables": variable_bindings.copy(),
-                    }
-                )
-                break  # Stop if any part fails
+        async with _reserve_query(db) as run_query:
+            for step, sub_query in enumerate(sub_queries):
+                try:
+                    # Add this sub_query to compound query
+                    if compound_query:
+                        compound_query += f", {sub_query}"
+                    else:
+                        compound_query = sub_query
+
+                    if debug:
+                        # Evaluate the sub_query against the result set of the previous step,
+                        # which gives the same results as the compound query up to this point
+                        variables = get_prolog_variables(*sub_queries[: step + 1])
+                        executed_query = get_step_query(step, sub_query, prev_variables, variables)
+                        prev_variables = variables
+                    else:
+                        executed_query = compound_query
+
+                    start = time.time()
+                    result = await run_query(executed_query)
+                    elapsed = time.time() - start
+
+                    # Convert any bytes in the result to strings
+                    decoded_result = []
+                    if result:
+                        for binding in result:
+                            decoded_binding = {}
+                            for key, value in binding.items():
+                                if isinstance(value, bytes):
+                                    decoded_binding[key] = value.decode("utf-8")
+                                else:
+                                    # NOTE: the first if-statement doesn't seem to handle
+                                    # the case when the value is a Variable
+                                    # so I just convert everything else to a string
+                                    decoded_binding[key] = str(value)
+                            decoded_result.append(decoded_binding)
+
+                    # Store result and variable bindings
+                    query_results.append(
+                        {
+                            "query": compound_query,
+                            "sub_query_added": sub_query,
+                            "result": decoded_result,
+                            "variables": variable_bindings.copy(),
+                            "num_results": len(decoded_result),
+                            "time": elapsed,
+                        }
+                    )
+
+                    # Update variable bindings from result
+                    if decoded_result:
+                        for binding in decoded_result:
+                            variable_bindings.update(binding)
+
+                except Exception as e:
+                    logger.error(f"Query failed: {compound_query}")
+                    logger.error(f"Error: {str(e)}")
+                    query_results.append(
+                        {
+                            "query": compound_query,
+                            "sub_query_added": sub_query,
+                            "error": str(e),
+                            "variables": variable_bindings.copy(),
+                        }
+                    )
+                    break  # Stop if any part fails
 
         # Get final value for target variable
         final_value = set()
@@ -190,7 +495,13 @@ def get_prolog_results(
             # NOTE: the score functions expect a string, so we need to join the list using a separator
             final_value_str = constants.answer_sep.join([str(v) for v in list(final_value)])
 
-        prolog_results.append(
-            {"final_value": final_value_str, "query": pred_query, "query_results": query_results}
-        )
-    return prolog_results
+        return {"final_value": final_value_str, "query": pred_query, "query_results": query_results}
+
+    return await asyncio.gather(*[get_prolog_result(response) for response in responses])
+
+
+def get_prolog_results(
+    responses: list[LLMChatResponse], db: Database, logger: logging.Logger, debug: bool = False
+) -> list[dict]:
+    """Synchronous version of `aget_prolog_results`. Must not be called from a running event loop."""
+    return asyncio.run(aget_prolog_results(responses, db, logger, debug))
@@ -1,3 +1,8 @@
+from collections.abc import Iterable
+
+import numpy as np
+import pandas as pd
+
 from phantom_eval import constants
 from phantom_eval.utils import normalize_pred
 
@@ -56,9 +61,87 @@ def f1(
     true: str,
     sep: str = constants.answer_sep,
 ) -> float:
-    pres = precision(pred, true, sep)
-    rec = recall(pred, true, sep)
-    if pres + rec == 0:
-        return 0
+    return scores(pred, true, sep)["f1"]
+
+
+def scores(
+    pred: str,
+    true: str,
+    sep: str = constants.answer_sep,
+) -> dict[str, float]:
+    """
+    Computes exact match, precision, recall and f1 together, normalizing pred and true only once.
+
+    Returns:
+        dict with keys "EM", "precision", "recall", "f1"
+    """
+    normalized_preds: set[str] = normalize_pred(pred, sep)
+    normalized_trues: set[str] = normalize_pred(true, sep)
+    count = len(normalized_preds & normalized_trues)
+    pres = count / len(normalized_preds)
+    rec = count / len(normalized_trues)
+    return {
+        "EM": normalized_preds == normalized_trues,
+        "precision": pres,
+        "recall": rec,
+        "f1": 0 if pres + rec == 0 else 2 * pres * rec / (pres + rec),
+    }
+
+
+def _normalized_answer_pairs(answers: pd.Series, sep: str) -> pd.DataFrame:
+    """
+    Normalizes a column of answers like `normalize_pred`, in long format.
+
+    Returns:
+        pd.DataFrame with columns "row" and "answer" and one row per unique normalized answer of each row
+    """
+    exploded = answers.str.split(sep, regex=False).explode()
+    return pd.DataFrame(
+        {"row": exploded.index.to_numpy(), "answer": exploded.str.strip().str.lower().to_numpy()}
+    ).drop_duplicates()
+
+
+def batch_scores(
+    preds: Iterable[str],
+    trues: Iterable[str],
+    sep: str = constants.answer_sep,
+) -> dict[str, np.ndarray]:
+    """
+    Vectorized version of `scores` for columns of predictions and true answers.
+
+    Each pred/true is normalized once with vectorized string operations, and the four metrics are
+    computed from the per-row counts of normalized answers. The results are equal to calling
+    `exact_match`, `precision`, `recall` and `f1` on each row.
+
+    Args:
+        preds: column of predictions, e.g. a list, NumPy array, pandas Series or Arrow array
+        trues: column of true answers of the same length, each joined with `sep`
+        sep: separator of the answers
+
+    Returns:
+        dict with keys "EM", "precision", "recall", "f1" mapping to arrays with one value per row
+    """
+    preds = pd.Series(preds, dtype=object).reset_index(drop=True)
+    trues = pd.Series(trues, dtype=object).reset_index(drop=True)
+    assert len(preds) == len(trues), "preds and trues must have the same length"
+    num_rows = len(preds)
+    pred_pairs = _normalized_answer_pairs(preds, sep)
+    true_pairs = _normalized_answer_pairs(trues, sep)
+
+    # A normalized answer is correct if the same (row, answer) pair is also in the true answers
+    num_pred_pairs = len(pred_pairs)
+    is_common = pd.concat([pred_pairs, true_pairs]).duplicated().to_numpy()[num_pred_pairs:]
+    num_common = np.bincount(true_pairs["row"].to_numpy()[is_common], minlength=num_rows)
+    num_preds = np.bincount(pred_pairs["row"].to_numpy(), minlength=num_rows)
+    num_trues = np.bincount(true_pairs["row"].to_numpy(), minlength=num_rows)
 
-    return 2 * pres * rec / (pres + rec)
+    pres = num_common / num_preds
+    rec = num_common / num_trues
+    with np.errstate(invalid="ignore"):
+        f1_scores = np.where(pres + rec == 0, 0.0, 2 * pres * rec / (pres + rec))
+    return {
+        "EM": (num_common == num_preds) & (num_common == num_trues),
+        "precision": pres,
+        "recall": rec,
+        "f1": f1_scores,
+    }
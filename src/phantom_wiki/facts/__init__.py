@@ -9,16 +9,20 @@ from .family import FAMILY_RULES_BASE_PATH, FAMILY_RULES_DERIVED_PATH
 from .friends import FRIENDSHIP_RULES_PATH
 
 
-def get_database(*data_paths) -> Database:
+def get_database(*data_paths, tabled: bool = False, cache_size: int = 0) -> Database:
     """
     Get a Prolog database with built-in rules.
     Add facts to the database from data_paths if provided.
+    If tabled is true, all derived predicates in the rules are tabled (see Database).
+    If cache_size is positive, up to cache_size query results are memoized (see Database).
     """
     db = Database(
         FAMILY_RULES_BASE_PATH,
         FAMILY_RULES_DERIVED_PATH,
         FRIENDSHIP_RULES_PATH,
         ATTRIBUTE_RULES_PATH,
+        tabled=tabled,
+        cache_size=cache_size,
     )
 
     if data_paths:
@@ -1,5 +1,7 @@
 import logging
 import os
+import re
+from collections import OrderedDict, namedtuple
 from multiprocessing import Pool
 
 from pyswip import Prolog
@@ -18,15 +20,110 @@ SAVE_ALL_CLAUSES_TO_FILE = """
     close(Stream))
 """
 
+# Matches the head of a rule, e.g. "sibling(X, Y) :-"
+RULE_HEAD_PATTERN = re.compile(r"^([a-z]\w*)\(([^()]*)\)\s*:-", re.MULTILINE)
+
+
+def get_rule_predicates(*rules: str) -> list[str]:
+    """Gets the signatures of the predicates defined by rules in Prolog files.
+
+    Facts (clauses without a body) are ignored, so only derived predicates are returned.
+
+    Examples:
+    >>> get_rule_predicates(FAMILY_RULES_BASE_PATH)
+    ['female/1', 'male/1', 'nonbinary/1', 'sibling/2', ...]
+
+    Args:
+        rules: paths to Prolog files
+
+    Returns:
+        List of term signatures in the order of their first definition
+    """
+    predicates = {}
+    for rule in rules:
+        with open(rule) as f:
+            for name, args in RULE_HEAD_PATTERN.findall(f.read()):
+                predicates[f"{name}/{len(args.split(','))}"] = None
+    return list(predicates)
+
+
+# Tokens of a Prolog goal: quoted atoms/strings, atoms/numbers (incl. 0'c character codes), variables,
+# whitespace and single characters
+QUERY_TOKEN_PATTERN = re.compile(
+    r"(?P<quoted>\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*'|`(?:[^`\\]|\\.)*`)"
+    r"|(?P<atom>0'.|[a-z0-9]\w*)"
+    r"|(?P<variable>[A-Z_]\w*)"
+    r"|(?P<space>\s+)"
+    r"|(?P<other>.)",
+    re.DOTALL,
+)
+# Whitespace next to these characters is not significant, except before "(", which separates a prefix
+# operator from its argument (e.g. `\+ (a, b)` is not `\+(a, b)`)
+QUERY_PUNCTUATION = set("(),[]|")
+
+
+def canonicalize_query(query: str) -> tuple[str, dict[str, str]]:
+    """Canonicalizes a Prolog goal so that equivalent goals share a cache key.
+
+    Whitespace outside quotes is collapsed (and removed where it is not significant), the terminating
+    full stop is removed and named variables are renamed to V0, V1, ... in order of first appearance.
+    Anonymous variables (`_`) are kept.
+
+    Examples:
+    >>> canonicalize_query('sibling( "Alice" ,Y).')
+    ('sibling("Alice",V0)', {'Y': 'V0'})
+
+    Args:
+        query: Prolog query string
+
+    Returns:
+        Tuple of the canonical query and the mapping from original to canonical variable names
+    """
+    query = query.strip()
+    if query.endswith("."):
+        query = query[:-1].rstrip()
+
+    tokens = []
+    variables = {}
+    for match in QUERY_TOKEN_PATTERN.finditer(query):
+        token = match.group()
+        if match.lastgroup == "variable" and token != "_":
+            token = variables.setdefault(token, f"V{len(variables)}")
+        elif match.lastgroup == "space":
+            token = " "
+        tokens.append(token)
+
+    canonical = []
+    for i, token in enumerate(tokens):
+        if token == " " and (
+            (canonical and canonical[-1] in QUERY_PUNCTUATION)
+            or (i + 1 < len(tokens) and tokens[i + 1] in QUERY_PUNCTUATION and tokens[i + 1] != "(")
+        ):
+            continue
+        canonical.append(token)
+    return "".join(canonical), variables
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
 
 class Database:
-    def __init__(self, *rules: str, pack_dir: str = None):
+    def __init__(self, *rules: str, pack_dir: str = None, tabled: bool = False, cache_size: int = 0):
         """
         Initializes a Prolog database.
 
         Args:
             rules (list[str], optional): list of Prolog files to consult
             pack_dir (str, optional): path to a directory containing packs of Prolog files
+            tabled (bool, optional): whether to table all predicates derived by the rules. Tabled
+                predicates memoize their answers, so repeated queries (e.g. `sibling/2` inside
+                `cousin/2`) are evaluated once. Tabled answers have set semantics: duplicate
+                answers are removed and the order of answers may differ from the untabled rules.
+            cache_size (int, optional): maximum number of query results to memoize. Queries are
+                canonicalized (see `canonicalize_query`), so goals that only differ in whitespace or
+                variable names share an entry. The cache is cleared whenever facts are added, removed
+                or consulted. Only read-only queries should be sent through a cached database.
+                0 disables the cache.
 
         """
         self.prolog = Prolog()
@@ -37,6 +134,15 @@ class Database:
         # Add ability to save clauses to a file
         self.prolog.assertz(SAVE_ALL_CLAUSES_TO_FILE)
 
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+        self.tabled = tabled
+        if self.tabled:
+            self.table(*get_rule_predicates(*rules))
+
         self.pack_dir = pack_dir
         if self.pack_dir:
             for d in os.listdir(self.pack_dir):
@@ -50,13 +156,14 @@ class Database:
                     _ = list(self.prolog.query(f"use_module(library({d}))."))
 
     @classmethod
-    def from_disk(cls, file: str):
+    def from_disk(cls, file: str, cache_size: int = 0):
         """Loads a Prolog database from a file.
 
         Args:
             file: path to the file
+            cache_size: maximum number of query results to memoize (see `Database`)
         """
-        db = cls()
+        db = cls(cache_size=cache_size)
         db.consult(file)
         return db
 
@@ -66,7 +173,7 @@ class Database:
         Returns:
             List of people's names.
         """
-        people = [decode(result["X"]) for result in self.prolog.query(f"type(X, {PERSON_TYPE})")]
+        people = [decode(result["X"]) for result in self.query(f"type(X, {PERSON_TYPE})")]
         return people
 
     def get_attribute_values(self) -> list[str]:
@@ -80,7 +187,7 @@ class Database:
         # Defining the `attribute` predicate allows querying for attributes
         # even when none are defined in the database
         self.define("attribute/1")
-        attributes = [decode(result["X"]) for result in self.prolog.query("attribute(X)")]
+        attributes = [decode(result["X"]) for result in self.query("attribute(X)")]
         return attributes
 
     def batch_query(self, queries: list[str], multi_threading: bool = False) -> list[list[dict]]:
@@ -117,7 +224,38 @@ class Database:
         Returns:
             List of results
         """
-        return list(self.prolog.query(query))
+        if not self.cache_size:
+            return list(self.prolog.query(query))
+
+        key, variables = canonicalize_query(query)
+        if key in self._cache:
+            self._cache_hits += 1
+            self._cache.move_to_end(key)
+            results = self._cache[key]
+        else:
+            self._cache_misses += 1
+            results = [
+                {variables.get(k, k): v for k, v in result.items()} for result in self.prolog.query(query)
+            ]
+            self._cache[key] = results
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        # Return fresh dictionaries with the variable names of this query
+        original_names = {canonical: name for name, canonical in variables.items()}
+        return [{original_names.get(k, k): v for k, v in result.items()} for result in results]
+
+    def cache_info(self) -> CacheInfo:
+        """Gets the statistics of the query cache.
+
+        Returns:
+            CacheInfo with the number of hits and misses, the maximum size and the current size
+        """
+        return CacheInfo(self._cache_hits, self._cache_misses, self.cache_size, len(self._cache))
+
+    def clear_cache(self) -> None:
+        """Removes all memoized query results. The statistics are kept."""
+        self._cache.clear()
 
     def consult(self, *files: str) -> None:
         """Consults Prolog files.
@@ -129,6 +267,8 @@ class Database:
         for file in files:
             logger.debug(f"- {file}")
             self.prolog.consult(file)
+        self.abolish_tables()
+        self.clear_cache()
 
     def add(self, *facts: str) -> None:
         """Adds fact(s) to the Prolog database.
@@ -145,6 +285,8 @@ class Database:
         for fact in facts:
             logger.debug(f"- {fact}")
             self.prolog.assertz(fact)
+        self.abolish_tables()
+        self.clear_cache()
 
     def remove(self, *facts: str) -> None:
         """Removes a fact from the Prolog database.
@@ -161,6 +303,8 @@ class Database:
         for fact in facts:
             logger.debug(f"- {fact}")
             self.prolog.retractall(fact)
+        self.abolish_tables()
+        self.clear_cache()
 
     def define(self, *predicates: str) -> None:
         """Defines dynamic predicates in the Prolog database.
@@ -176,10 +320,35 @@ class Database:
             logger.debug(f"- {predicate}")
             self.prolog.dynamic(predicate)
 
+    def table(self, *predicates: str) -> None:
+        """Declares tabled predicates in the Prolog database.
+
+        Equivalent to a `:- table ...` directive in a Prolog file.
+
+        Examples:
+        >>> db.table("sibling/2", "cousin/2")
+
+        Args:
+            predicates: list of term signatures
+        """
+        logger.debug("Tabling rules:")
+        for predicate in predicates:
+            logger.debug(f"- {predicate}")
+            _ = list(self.prolog.query(f"table({predicate})"))
+
+    def abolish_tables(self) -> None:
+        """Removes all tabled answers from the Prolog database.
+
+        Tables are not updated when facts change, so they are abolished whenever facts are added,
+        removed or consulted. The next query to a tabled predicate recomputes its answers.
+        """
+        if self.tabled:
+            _ = list(self.prolog.query("abolish_all_tables"))
+
     def save_to_disk(self, file: str) -> None:
         """Saves all clauses in the database to a file.
 
         Args:
             file: path to the file
         """
-        self.query(f"save_all_clauses_to_file('{file}').")
+        _ = list(self.prolog.query(f"save_all_clauses_to_file('{file}')."))
@@ -53,6 +53,21 @@ fam_gen_parser.add_argument(
     default=False,
     help="Allow/prevent duplicate names in the generation. (Default value: False.)",
 )
+fam_gen_parser.add_argument(
+    "--family-tree-partitions",
+    type=int,
+    default=0,
+    help="Split the name pools into this many disjoint partitions and generate family trees in parallel, "
+    "with an independent random stream per tree. Output depends on the seed and the number of partitions. "
+    "(Default value: 0, i.e. sequential generation.)",
+)
+fam_gen_parser.add_argument(
+    "--frontier-sampling",
+    action="store_true",
+    help="Only sample persons that can still get parents or children when growing a family tree, "
+    "instead of sampling any person and retrying. Avoids wasted attempts for large family trees. "
+    "With --stop-prob > 0, the stop coin is only drawn after an expansion, so trees tend to be larger.",
+)
 
 # wrapper for family tree generation
 
@@ -74,6 +89,8 @@ def db_generate_family(
     max_family_tree_size: int,
     stop_prob: float,
     num_family_trees: int,
+    family_tree_partitions: int = 0,
+    frontier_sampling: bool = False,
 ) -> None:
     """Generates family facts for a database.
 
@@ -89,6 +106,9 @@ def db_generate_family(
         max_family_tree_size (int): The maximum number of people that may appear in a family tree.
         stop_prob (float): Probability of stopping to extend a family tree after a person has been added.
         num_family_trees (int): The number of family trees to generate.
+        family_tree_partitions (int): Number of disjoint name pools for parallel generation.
+            0 means sequential generation.
+        frontier_sampling (bool): Only sample persons that can still be expanded when growing a family tree.
 
     Returns:
         None, the function adds the generated family facts to the database.
@@ -108,6 +128,9 @@ def db_generate_family(
         num_family_trees,
         debug,
         output_dir,
+        num_partitions=family_tree_partitions,
+        seed=seed,
+        frontier_sampling=frontier_sampling,
     )
 
     for i, family_tree in enumerate(family_trees):
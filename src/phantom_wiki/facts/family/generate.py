@@ -13,23 +13,112 @@ import logging
 import os
 import random
 import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
 
+import numpy as np
 import pydot
 from tqdm import tqdm
 
 from phantom_wiki.facts.family.constants import PERSON_TYPE
-from phantom_wiki.facts.family.person_factory import Person, PersonFactory
+from phantom_wiki.facts.family.person_factory import FamilyTree, Person, PersonFactory
 
 # ============================================================================= #
 #                               CLASS  GENERATOR                                #
 # ============================================================================= #
 
 
+class _IndexedSet:
+    """A set of persons with O(1) insertion, removal, and access by index for uniform sampling."""
+
+    def __init__(self):
+        self._items: list[Person] = []
+        self._index: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, index: int) -> Person:
+        return self._items[index]
+
+    def add(self, person: Person) -> None:
+        if id(person) not in self._index:
+            self._index[id(person)] = len(self._items)
+            self._items.append(person)
+
+    def discard(self, person: Person) -> None:
+        index = self._index.pop(id(person), None)
+        if index is None:
+            return
+        # Move the last person into the freed slot
+        last = self._items.pop()
+        if index < len(self._items):
+            self._items[index] = last
+            self._index[id(last)] = index
+
+
 class Generator:
     """A generator for creating family tree datasets."""
 
-    def __init__(self, person_factory: PersonFactory):
+    def __init__(self, person_factory: PersonFactory, rng=None):
         self.person_factory = person_factory
+        self.rng = rng if rng is not None else random
+
+        # Number of sampling steps and number of steps that added persons to a family tree
+        self.num_attempts = 0
+        self.num_expansions = 0
+
+    def _add_child(self, current_person: Person) -> list[Person]:
+        """Adds a child to a person, marrying them first if needed.
+
+        Returns:
+            list[Person]: The new persons, i.e. the spouse (if any) followed by the child.
+        """
+        new_persons = []
+
+        # check whether the chosen person is married, if not -> add a partner
+        if current_person.married_to:
+            spouse = current_person.married_to
+        else:
+            spouse = self.person_factory.create_spouse(
+                current_person.tree_level, female=not current_person.female, spouse=current_person
+            )
+            spouse.married_to = current_person
+            current_person.married_to = spouse
+            new_persons.append(spouse)
+
+        # create child
+        child = self.person_factory.create_child(
+            current_person.tree_level + 1,
+            parents=[current_person, spouse],
+            siblings=current_person.children,
+        )
+        child.parents = [current_person, spouse]
+        new_persons.append(child)
+
+        # add child to current person and spouse
+        current_person.children.append(child)
+        spouse.children.append(child)
+
+        return new_persons
+
+    def _add_parents(self, current_person: Person) -> list[Person]:
+        """Adds parents to a person.
+
+        Returns:
+            list[Person]: The new persons, i.e. the mother and the father.
+        """
+        # Create parents
+        dad, mom = self.person_factory.create_parents(current_person.tree_level - 1, current_person)
+
+        # specify relationships
+        mom.married_to = dad
+        dad.married_to = mom
+        mom.children.append(current_person)
+        dad.children.append(current_person)
+        current_person.parents = [mom, dad]
+
+        return [mom, dad]
 
     def _sample_family_tree(
         self,
@@ -59,7 +148,7 @@ class Generator:
 
         while True:
             # randomly choose a person from the tree
-            current_person = random.choice(fam_tree)
+            current_person = self.rng.choice(fam_tree)
 
             # determine whether it is possible to add parents and children of the sampled person
             can_add_parents = not current_person.parents and (
@@ -72,71 +161,121 @@ class Generator:
             # decide what to do
             add_parents = add_child = False
             if can_add_parents and can_add_children:  # -> randomly add either a child or parents
-                add_parents = random.random() > 0.5
+                add_parents = self.rng.random() > 0.5
                 add_child = not add_parents
             else:
                 add_parents = can_add_parents
                 add_child = can_add_children
 
             if add_child:
-                # check whether the chosen person is married, if not -> add a partner
-                if current_person.married_to:
-                    spouse = current_person.married_to
-                else:
-                    spouse = self.person_factory.create_spouse(
-                        current_person.tree_level, female=not current_person.female, spouse=current_person
-                    )
-                    spouse.married_to = current_person
-                    current_person.married_to = spouse
-                    fam_tree.append(spouse)
-                    person_count += 1
-
-                # create child
-                child = self.person_factory.create_child(
-                    current_person.tree_level + 1,
-                    parents=[current_person, spouse],
-                    siblings=current_person.children,
-                )
-                child.parents = [current_person, spouse]
-                fam_tree.append(child)
-
-                # add child to current person and spouse
-                current_person.children.append(child)
-                spouse.children.append(child)
-
-                max_level = max(max_level, child.tree_level)
-                person_count += 1
+                new_persons = self._add_child(current_person)
+                fam_tree.extend(new_persons)
+                person_count += len(new_persons)
+                max_level = max(max_level, new_persons[-1].tree_level)
 
             elif add_parents:
-                # Create parents
-                dad, mom = self.person_factory.create_parents(current_person.tree_level - 1, current_person)
-
-                # specify relationships
-                mom.married_to = dad
-                dad.married_to = mom
-                mom.children.append(current_person)
-                dad.children.append(current_person)
-                current_person.parents = [mom, dad]
-
-                # Add to tree
-                fam_tree.extend([mom, dad])
-                person_count += 2
-                min_level = min(min_level, mom.tree_level)
+                new_persons = self._add_parents(current_person)
+                fam_tree.extend(new_persons)
+                person_count += len(new_persons)
+                min_level = min(min_level, new_persons[0].tree_level)
 
             # update bookkeeping variables
             total_attempts += 1
+            self.num_attempts += 1
+            self.num_expansions += add_child or add_parents
             tree_depth = max_level - min_level
 
             # Check stopping conditions
             if (
                 person_count >= max_family_tree_size
                 or total_attempts >= max_family_tree_size * 10
-                or (stop_prob > 0 and random.random() < stop_prob)
+                or (stop_prob > 0 and self.rng.random() < stop_prob)
             ):
                 break
 
         return fam_tree
 
+    def _sample_family_tree_frontier(
+        self,
+        max_family_tree_depth: int,
+        max_branching_factor: int,
+        max_family_tree_size: int,
+        stop_prob: float,
+    ) -> list[Person]:
+        """Creates a single family tree by only sampling persons that can still be expanded.
+
+        The frontier holds the persons that can get parents or children. Once the tree reaches the maximum
+        depth, its minimum and maximum levels are fixed, so a frontier person that cannot be expanded at
+        that point never can be, and is removed when sampled.
+        With `stop_prob == 0`, this samples from the same distribution as `_sample_family_tree`, which
+        retries on persons that cannot be expanded, but each person is rejected at most once and there is no
+        attempt cap. With `stop_prob > 0`, the distribution of tree sizes differs: `_sample_family_tree`
+        draws the stop coin after every attempt, including rejected ones, while this sampler only draws it
+        after an expansion, and so tends to generate larger trees.
+
+        Args:
+            max_family_tree_depth (int): The maximum depth that a family tree may have.
+            max_branching_factor (int): Maximum number of children that any person in a family tree may have.
+            max_family_tree_size (int): The maximum number of people that may appear in a family tree.
+            stop_prob (float): Probability of stopping to extend a family tree after a person has been added.
+
+        Returns:
+            list[Person]: A list of Person objects representing the generated family tree.
+        """
+        # add first person to the family tree
+        fam_tree = [self.person_factory.create_person(max_family_tree_depth)]
+        frontier = _IndexedSet()
+        frontier.add(fam_tree[0])
+
+        min_level = max_level = fam_tree[0].tree_level
+
+        def can_expand(person: Person) -> tuple[bool, bool]:
+            """Determines whether it is possible to add parents and children of a person."""
+            saturated = max_level - min_level >= max_family_tree_depth
+            can_add_parents = not person.parents and (person.tree_level > min_level or not saturated)
+            can_add_children = len(person.children) < max_branching_factor and (
+                person.tree_level < max_level or not saturated
+            )
+            return can_add_parents, can_add_children
+
+        while len(fam_tree) < max_family_tree_size and len(frontier) > 0:
+            # randomly choose a person from the frontier
+            current_person = frontier[self.rng.randrange(len(frontier))]
+            self.num_attempts += 1
+
+            can_add_parents, can_add_children = can_expand(current_person)
+            if not can_add_parents and not can_add_children:
+                # the tree depth is saturated and this person is at the boundary -> drop for good
+                frontier.discard(current_person)
+                continue
+
+            # decide what to do
+            if can_add_parents and can_add_children:  # -> randomly add either a child or parents
+                add_parents = self.rng.random() > 0.5
+            else:
+                add_parents = can_add_parents
+
+            if add_parents:
+                new_persons = self._add_parents(current_person)
+                min_level = min(min_level, new_persons[0].tree_level)
+            else:
+                new_persons = self._add_child(current_person)
+                max_level = max(max_level, new_persons[-1].tree_level)
+            fam_tree.extend(new_persons)
+            self.num_expansions += 1
+
+            # update the frontier with the persons whose relationships changed
+            for person in [current_person, current_person.married_to, *new_persons]:
+                if person is not None and any(can_expand(person)):
+                    frontier.add(person)
+                elif person is not None:
+                    frontier.discard(person)
+
+            if stop_prob > 0 and self.rng.random() < stop_prob:
+                break
+
+        return fam_tree
+
     def generate(
         self,
         max_family_tree_depth: int,
@@ -146,9 +285,18 @@ class Generator:
         num_family_trees: int,
         debug: bool,
         output_dir: str,
-    ) -> list[list[Person]]:
+        num_partitions: int = 0,
+        seed: int = 1,
+        frontier_sampling: bool = False,
+    ) -> list[FamilyTree]:
         """Generates a list family trees based on the provided configuration.
 
+        If num_partitions > 0, the last names are split into num_partitions disjoint pools and the trees
+        are sampled across a process pool, where each tree gets its own random stream spawned from
+        `np.random.SeedSequence(seed)`. The result only depends on seed and num_partitions, not on the
+        number of available CPUs. Otherwise, trees are sampled sequentially from the generator's
+        random stream.
+
         Args:
             max_family_tree_depth (int): The maximum depth that a family tree may have.
             max_branching_factor (int): Maximum number of children that any person in a family tree may have.
@@ -157,23 +305,42 @@ class Generator:
             num_family_trees (int): The number of family trees to generate.
             debug (bool): Whether to enable debug output.
             output_dir (str): Path to the output folder.
+            num_partitions (int): Number of disjoint name pools for parallel generation.
+                0 means sequential generation. (default=0)
+            seed (int): Seed for the per-tree random streams in parallel generation. (default=1)
+            frontier_sampling (bool): Only sample persons that can still be expanded, instead of
+                sampling any person and retrying. (default=False)
 
         Returns:
-            list[list[Person]]: A list of family trees, where family trees are lists of Person objects.
+            list[FamilyTree]: A list of family trees in columnar representation.
         """
-        # create list for storing graph representations of all created samples
-        family_trees = []
-
         all_time_start = time.time()
-        names = []
-        for sample_idx in tqdm(range(num_family_trees), desc="Generating family trees", leave=False):
-            # sample family tree
-            family_tree = self._sample_family_tree(
-                max_family_tree_depth, max_branching_factor, max_family_tree_size, stop_prob
+        sample_args = (max_family_tree_depth, max_branching_factor, max_family_tree_size, stop_prob)
+        if num_partitions > 0:
+            family_trees, num_attempts, num_expansions = _generate_partitioned(
+                sample_args,
+                num_family_trees,
+                num_partitions,
+                seed,
+                self.person_factory.last_names,
+                self.person_factory.duplicate_names,
+                frontier_sampling,
             )
-            family_trees.append(family_tree)
+        else:
+            sample_family_tree = (
+                self._sample_family_tree_frontier if frontier_sampling else self._sample_family_tree
+            )
+            num_attempts, num_expansions = self.num_attempts, self.num_expansions
+            family_trees = [
+                FamilyTree.from_persons(sample_family_tree(*sample_args))
+                for _ in tqdm(range(num_family_trees), desc="Generating family trees", leave=False)
+            ]
+            num_attempts = self.num_attempts - num_attempts
+            num_expansions = self.num_expansions - num_expansions
 
-            names += [p.get_full_name() for p in family_tree]
+        names = []
+        for sample_idx, family_tree in enumerate(family_trees):
+            names += family_tree.get_full_names()
 
             # save generated family tree as a graph
             if debug:
@@ -193,56 +360,143 @@ class Generator:
             f"{sum([len(tree) for tree in family_trees])} individuals in "
             f"{time.time()-all_time_start:.3f}s."
         )
+        logging.info(
+            f"Attempt efficiency: {num_expansions}/{num_attempts} sampling steps expanded a family tree "
+            f"({100 * num_expansions / max(num_attempts, 1):.1f}%)."
+        )
 
         return family_trees
 
 
-# Given a family tree in the form of a list -> generate the facts
-def family_tree_to_facts(family_tree):
-    # Outputs
-    people = []
-    genders = []
-    parent_relationships = []
-    dates_of_birth = []
-
-    # Add facts for each person in the family tree
-    for p in family_tree:
-        # add 1-ary clause indicating the person exists
-        people.append(f'type("{p.get_full_name()}", {PERSON_TYPE})')
-
-        # add 2-ary clause indicating gender
-        if p.female:
-            genders.append(f'gender("{p.get_full_name()}", "female")')
-        else:
-            genders.append(f'gender("{p.get_full_name()}", "male")')
-
-        # add 2-ary clause indicating parent relationship
-        for child in p.children:
-            parent_relationships.append(f'parent("{child.get_full_name()}", "{p.get_full_name()}")')
-
-        # add 2-ary clause indicating date of birth
-        dates_of_birth.append(f'dob("{p.get_full_name()}", "{p.date_of_birth}")')
+def _sample_partition(
+    sample_args: tuple,
+    last_names: list[str],
+    tree_seeds: list[np.random.SeedSequence],
+    duplicate_names: bool,
+    frontier_sampling: bool,
+) -> tuple[list[FamilyTree], int, int]:
+    """Samples family trees that draw names from a private pool of last names.
+
+    Each tree uses its own random stream, seeded from its spawned SeedSequence.
+
+    Returns:
+        The family trees, the number of sampling steps, and the number of steps that expanded a tree.
+    """
+    person_factory = PersonFactory(duplicate_names, last_names=last_names)
+    generator = Generator(person_factory)
+    sample_family_tree = (
+        generator._sample_family_tree_frontier if frontier_sampling else generator._sample_family_tree
+    )
+    family_trees = []
+    for tree_seed in tree_seeds:
+        rng = random.Random(tree_seed.generate_state(4).tobytes())
+        generator.rng = person_factory.rng = rng
+        family_trees.append(FamilyTree.from_persons(sample_family_tree(*sample_args)))
+    return family_trees, generator.num_attempts, generator.num_expansions
+
+
+def _generate_partitioned(
+    sample_args: tuple,
+    num_family_trees: int,
+    num_partitions: int,
+    seed: int,
+    all_last_names: list[str],
+    duplicate_names: bool,
+    frontier_sampling: bool = False,
+) -> tuple[list[FamilyTree], int, int]:
+    """Samples family trees across a process pool with disjoint name pools per partition.
+
+    Tree i is assigned to partition i % num_partitions, and partition p owns every
+    num_partitions-th last name starting from p, so that full names never collide across partitions.
+
+    Returns:
+        The family trees, the number of sampling steps, and the number of steps that expanded a tree.
+    """
+    num_partitions = max(1, min(num_partitions, num_family_trees, len(all_last_names)))
+    tree_seeds = np.random.SeedSequence(seed).spawn(num_family_trees)
+    partition_args = [
+        (
+            sample_args,
+            all_last_names[p::num_partitions],
+            tree_seeds[p::num_partitions],
+            duplicate_names,
+            frontier_sampling,
+        )
+        for p in range(num_partitions)
+    ]
+
+    num_workers = min(num_partitions, os.cpu_count() or 1)
+    logging.info(f"Generating family trees in {num_partitions} partitions with {num_workers} workers.")
+    if num_workers == 1:
+        partitions = [_sample_partition(*args) for args in partition_args]
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            partitions = list(executor.map(_sample_partition, *zip(*partition_args)))
+
+    # Interleave the partitions back into tree order
+    family_trees = [None] * num_family_trees
+    for p, (partition, _, _) in enumerate(partitions):
+        family_trees[p::num_partitions] = partition
+    num_attempts = sum(attempts for _, attempts, _ in partitions)
+    num_expansions = sum(expansions for _, _, expansions in partitions)
+    return family_trees, num_attempts, num_expansions
+
+
+# Given a family tree -> generate the facts
+def family_tree_to_facts(family_tree: FamilyTree | list[Person]) -> list[str]:
+    if not isinstance(family_tree, FamilyTree):
+        family_tree = FamilyTree.from_persons(family_tree)
+    full_names = family_tree.get_full_names()
+
+    # add 1-ary clause indicating the person exists
+    people = [f'type("{name}", {PERSON_TYPE})' for name in full_names]
+
+    # add 2-ary clause indicating gender
+    genders = [
+        f'gender("{name}", "{"female" if female else "male"}")'
+        for name, female in zip(full_names, family_tree.female.tolist())
+    ]
+
+    # add 2-ary clause indicating parent relationship
+    children, columns = np.nonzero(family_tree.parents >= 0)
+    parent_relationships = [
+        f'parent("{full_names[child]}", "{full_names[parent]}")'
+        for child, parent in zip(children.tolist(), family_tree.parents[children, columns].tolist())
+    ]
+
+    # add 2-ary clause indicating date of birth
+    dob_strings = {
+        ordinal: date.fromordinal(ordinal).isoformat() for ordinal in set(family_tree.dob.tolist())
+    }
+    dates_of_birth = [
+        f'dob("{name}", "{dob_strings[ordinal]}")'
+        for name, ordinal in zip(full_names, family_tree.dob.tolist())
+    ]
 
     # Returning outputs
     return sorted(people) + sorted(genders) + sorted(parent_relationships) + sorted(dates_of_birth)
 
 
 # Given a family tree, generate and save a graph plot
-def create_dot_graph(family_tree):
+def create_dot_graph(family_tree: FamilyTree | list[Person]):
+    if not isinstance(family_tree, FamilyTree):
+        family_tree = FamilyTree.from_persons(family_tree)
+    full_names = family_tree.get_full_names()
+
     graph = pydot.Dot(graph_type="digraph")  # Directed graph
 
     # Add the nodes
-    for p in family_tree:
-        if p.female:
+    for name, female in zip(full_names, family_tree.female.tolist()):
+        if female:
             color = "pink"
         else:
             color = "lightblue"
 
-        graph.add_node(pydot.Node(p.get_full_name(), style="filled", fillcolor=color))
+        graph.add_node(pydot.Node(name, style="filled", fillcolor=color))
 
     # Add the edges
-    for p in family_tree:
-        for c in p.children:
-            graph.add_edge(pydot.Edge(p.get_full_name(), c.get_full_name()))
+    for i, name in enumerate(full_names):
+        for c in family_tree.get_children(i):
+            graph.add_edge(pydot.Edge(name, full_names[c]))
 
     return graph
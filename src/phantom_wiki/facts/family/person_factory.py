@@ -10,10 +10,13 @@
 
 import json
 import random
+from array import array
 from dataclasses import dataclass, field
-from datetime import date, timedelta
+from datetime import MINYEAR, date, timedelta
 from typing import Optional
 
+import numpy as np
+
 # ============================================================================= #
 #                                CLASS  PERSON                                  #
 # ============================================================================= #
@@ -46,6 +49,202 @@ class Person:
         return f"{self.name} {self.surname}"
 
 
+# ============================================================================= #
+#                             CLASS  FAMILY TREE                                #
+# ============================================================================= #
+
+
+class FamilyTree:
+    """A compact, columnar representation of a family tree.
+
+    People are stored by position in NumPy arrays instead of as linked Person objects.
+    First names and surnames are references to the shared name lists, and relations are positions,
+    so a tree takes a fraction of the memory of the equivalent list of Person objects.
+    Iterating over the tree or indexing it yields PersonView objects with the attributes of Person.
+    """
+
+    def __init__(
+        self,
+        names: list[str],
+        surnames: list[str],
+        female: np.ndarray,
+        tree_level: np.ndarray,
+        dob: np.ndarray,
+        parents: np.ndarray,
+        spouse: np.ndarray,
+    ):
+        """
+        Args:
+            names: First name of each person.
+            surnames: Surname of each person.
+            female: Boolean array indicating whether each person is female.
+            tree_level: Level of each person in the family tree.
+            dob: Date of birth of each person as a proleptic Gregorian ordinal (see `date.toordinal`).
+            parents: Array of shape (n, 2) with the positions of the parents of each person, or -1.
+            spouse: Position of the spouse of each person, or -1.
+        """
+        self.names = names
+        self.surnames = surnames
+        self.female = female
+        self.tree_level = tree_level
+        self.dob = dob
+        self.parents = parents
+        self.spouse = spouse
+        self._children: list[list[int]] | None = None
+
+    @classmethod
+    def from_persons(cls, persons: list[Person]) -> "FamilyTree":
+        """Converts a family tree given as a list of Person objects."""
+        n = len(persons)
+        position = {id(p): i for i, p in enumerate(persons)}
+        parents = np.full((n, 2), -1, dtype=np.int32)
+        spouse = np.full(n, -1, dtype=np.int32)
+        for i, p in enumerate(persons):
+            for j, parent in enumerate(p.parents):
+                parents[i, j] = position[id(parent)]
+            if p.married_to is not None:
+                spouse[i] = position[id(p.married_to)]
+
+        return cls(
+            names=[p.name for p in persons],
+            surnames=[p.surname for p in persons],
+            female=np.fromiter((p.female for p in persons), dtype=bool, count=n),
+            tree_level=np.fromiter((p.tree_level for p in persons), dtype=np.int32, count=n),
+            dob=np.fromiter((p.date_of_birth.toordinal() for p in persons), dtype=np.int32, count=n),
+            parents=parents,
+            spouse=spouse,
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, i: int) -> "PersonView":
+        return PersonView(self, i)
+
+    def __iter__(self):
+        return (PersonView(self, i) for i in range(len(self)))
+
+    def get_full_names(self) -> list[str]:
+        """Returns the full name of each person."""
+        return [f"{name} {surname}" for name, surname in zip(self.names, self.surnames)]
+
+    def get_children(self, i: int) -> list[int]:
+        """Returns the positions of the children of the person at position i, in order of position."""
+        if self._children is None:
+            self._children = [[] for _ in range(len(self))]
+            for child, parent in zip(*np.nonzero(self.parents >= 0)):
+                self._children[self.parents[child, parent]].append(int(child))
+        return self._children[i]
+
+
+class PersonView:
+    """A read-only view of a person in a FamilyTree with the attributes of Person."""
+
+    __slots__ = ("_tree", "index")
+
+    def __init__(self, tree: FamilyTree, index: int):
+        self._tree = tree
+        self.index = index
+
+    @property
+    def name(self) -> str:
+        return self._tree.names[self.index]
+
+    @property
+    def surname(self) -> str:
+        return self._tree.surnames[self.index]
+
+    @property
+    def female(self) -> bool:
+        return bool(self._tree.female[self.index])
+
+    @property
+    def tree_level(self) -> int:
+        return int(self._tree.tree_level[self.index])
+
+    @property
+    def date_of_birth(self) -> date:
+        return date.fromordinal(int(self._tree.dob[self.index]))
+
+    @property
+    def parents(self) -> list["PersonView"]:
+        return [PersonView(self._tree, int(i)) for i in self._tree.parents[self.index] if i >= 0]
+
+    @property
+    def children(self) -> list["PersonView"]:
+        return [PersonView(self._tree, i) for i in self._tree.get_children(self.index)]
+
+    @property
+    def married_to(self) -> Optional["PersonView"]:
+        spouse = int(self._tree.spouse[self.index])
+        return PersonView(self._tree, spouse) if spouse >= 0 else None
+
+    def get_full_name(self) -> str:
+        return f"{self.name} {self.surname}"
+
+
+# ============================================================================= #
+#                              CLASS  NAME POOL                                 #
+# ============================================================================= #
+
+
+class NamePool:
+    """An order-preserving pool of names that behaves like a list with `pop(index)` and `append`.
+
+    Instead of copying the base list of names, the pool stores the positions of the available base names
+    in a compact array (2 bytes per name for up to 65536 names), so that removing a name only moves a few
+    kilobytes of memory. Names appended back to the pool are kept after the available base names, which
+    matches the order of the equivalent Python list.
+
+    NOTE: PersonFactory keeps one pool per (surname, gender), and a name is popped from its pool when it is
+    used. A used (first name, last name) combination can therefore never be drawn again, so no separate
+    bitset of used combinations is needed.
+    """
+
+    _position_templates: dict[int, array] = {}
+
+    def __init__(self, names: list[str]):
+        """
+        Args:
+            names: Base list of names. The list is shared, not copied, and must not be modified.
+        """
+        self._names = names
+        self._positions = self._get_position_template(len(names))[:]
+        self._appended: list[str] = []
+
+    @classmethod
+    def _get_position_template(cls, n: int) -> array:
+        """Returns the positions of a pool where all n names are available."""
+        if n not in cls._position_templates:
+            cls._position_templates[n] = array("H" if n <= 2**16 else "I", range(n))
+        return cls._position_templates[n]
+
+    def __len__(self) -> int:
+        return len(self._positions) + len(self._appended)
+
+    def __getitem__(self, index: int) -> str:
+        if index < len(self._positions):
+            return self._names[self._positions[index]]
+        return self._appended[index - len(self._positions)]
+
+    def pop(self, index: int) -> str:
+        """Removes and returns the name with the given index."""
+        if index < len(self._positions):
+            return self._names[self._positions.pop(index)]
+        return self._appended.pop(index - len(self._positions))
+
+    def append(self, name: str) -> None:
+        """Adds a name to the end of the pool."""
+        self._appended.append(name)
+
+    def discard(self, pos: int) -> None:
+        """Removes the name at the given position in the base list, if it is still available."""
+        try:
+            self._positions.remove(pos)
+        except ValueError:
+            pass
+
+
 # ============================================================================= #
 #                            CLASS PERSON FACTORY                               #
 # ============================================================================= #
@@ -54,19 +253,30 @@ class Person:
 class PersonFactory:
     """A factory class for creating Person instances."""
 
-    def __init__(self, duplicate_names):
+    def __init__(self, duplicate_names, last_names: list[str] | None = None, rng=None):
+        """
+        Args:
+            duplicate_names: Allow/prevent duplicate names in the generation.
+            last_names: Optional subset of last names to draw from, e.g. to give disjoint name pools
+                to family trees generated in parallel. Defaults to all last names.
+            rng: Random number generator with the interface of the `random` module.
+                Defaults to the global `random` module.
+        """
         self._person_counter = 0
         self.duplicate_names = duplicate_names
+        self.rng = rng if rng is not None else random
+        self._last_names_subset = last_names
 
         # Name datastructures
         self._female_names: list[str] = []
         self._male_names: list[str] = []
         self._last_names: list[str] = []
-        self._remaining_names = dict()
-        self._remaining_male_last_names: list[str] = []
-        self._remaining_female_last_names: list[str] = []
-        self._remaining_both_last_names: list[str] = []
-        self._remaining_either_last_names: list[str] = []
+        self._last_name_index: dict[str, int] = {}
+        # Pools of remaining first names per (last name, female), created when first needed
+        self._remaining_names: dict[tuple[str, bool], NamePool] = {}
+        self._remaining_male_last_names: NamePool = None
+        self._remaining_female_last_names: NamePool = None
+        self._remaining_both_last_names: NamePool = None
 
         # Birth date constraints
         self._min_parent_age = 18
@@ -97,17 +307,25 @@ class PersonFactory:
             self._male_names = json.load(f)
         with open(family_names_file) as f:
             self._last_names = json.load(f)
-
-        self._remaining_male_last_names = self._last_names.copy()
-        self._remaining_female_last_names = self._last_names.copy()
-        self._remaining_both_last_names = self._last_names.copy()
-        self._remaining_either_last_names = self._last_names.copy()
-
-        for last_name in self._last_names:
-            self._remaining_names[last_name] = {
-                True: self._female_names.copy(),
-                False: self._male_names.copy(),
-            }
+        if self._last_names_subset is not None:
+            self._last_names = list(self._last_names_subset)
+
+        self._last_name_index = {last_name: i for i, last_name in enumerate(self._last_names)}
+        self._remaining_male_last_names = NamePool(self._last_names)
+        self._remaining_female_last_names = NamePool(self._last_names)
+        self._remaining_both_last_names = NamePool(self._last_names)
+
+    def _get_name_pool(self, female: bool, surname: str) -> NamePool:
+        """Get the pool of remaining first names for a gender and surname."""
+        key = (surname, female)
+        if key not in self._remaining_names:
+            self._remaining_names[key] = NamePool(self._female_names if female else self._male_names)
+        return self._remaining_names[key]
+
+    @property
+    def last_names(self) -> list[str]:
+        """All last names this factory draws from."""
+        return self._last_names
 
     def _get_last_name(self, female: bool = None) -> str:
         """Get an available last name"""
@@ -116,26 +334,26 @@ class PersonFactory:
         else:  # Need to choose a last name that this has first names depending on female value
             last_name_pool = self._remaining_female_last_names if female else self._remaining_male_last_names
 
-        if last_name_pool == []:
+        if len(last_name_pool) == 0:
             raise NotImplementedError(
                 "Insufficient names: Generating a dataset of this size is not supported "
                 "(try reducing --num-family-trees)"
             )
 
-        last_name = random.choice(last_name_pool)
+        last_name = self.rng.choice(last_name_pool)
         return last_name
 
     def _get_first_name(self, female: bool, surname: str) -> str:
         """Get an available first name based on gender and surnmame"""
-        name_pool = self._remaining_names[surname][female]
+        name_pool = self._get_name_pool(female, surname)
 
-        if name_pool == []:
+        if len(name_pool) == 0:
             raise NotImplementedError(
                 "Insufficient names: Generating a dataset of this size is not supported "
                 "(try reducing --num-family-trees)"
             )
 
-        name_index = random.randrange(len(name_pool))
+        name_index = self.rng.randrange(len(name_pool))
 
         if not self.duplicate_names:
             name = name_pool.pop(name_index)
@@ -145,15 +363,9 @@ class PersonFactory:
         if len(name_pool) == 0:
             last_name_pool = self._remaining_female_last_names if female else self._remaining_male_last_names
 
-            last_name_pool.remove(surname)
+            last_name_pool.discard(self._last_name_index[surname])
 
-            self._remaining_both_last_names.remove(surname)
-
-            other_last_name_pool = (
-                self._remaining_male_last_names if female else self._remaining_female_last_names
-            )
-            if surname not in other_last_name_pool:
-                self._remaining_either_last_names.remove(surname)
+            self._remaining_both_last_names.discard(self._last_name_index[surname])
 
         return name
 
@@ -173,8 +385,8 @@ class PersonFactory:
         """
         # DOB of parents - related_person is the child
         yob_child = children.date_of_birth.year
-        parent_yob_1 = int(random.gauss(yob_child - self._avg_parent_age, self._parent_child_age_diff_std))
-        parent_yob_2 = int(random.gauss(parent_yob_1, self._spouse_age_diff_std))
+        parent_yob_1 = int(self.rng.gauss(yob_child - self._avg_parent_age, self._parent_child_age_diff_std))
+        parent_yob_2 = int(self.rng.gauss(parent_yob_1, self._spouse_age_diff_std))
 
         # Enforcing min-max age difference between parent and child
         parent_yob_1 = min(
@@ -190,8 +402,12 @@ class PersonFactory:
             parent_yob_1 + self._max_parent_age_diff,
         )
 
-        parent_dob_1 = date(parent_yob_1, random.randint(1, 12), random.randint(1, 28))
-        parent_dob_2 = date(parent_yob_2, random.randint(1, 12), random.randint(1, 28))
+        # Birth years drift back through chains of in-laws in large family trees -> keep them valid
+        parent_yob_1 = max(parent_yob_1, MINYEAR)
+        parent_yob_2 = max(parent_yob_2, MINYEAR)
+
+        parent_dob_1 = date(parent_yob_1, self.rng.randint(1, 12), self.rng.randint(1, 28))
+        parent_dob_2 = date(parent_yob_2, self.rng.randint(1, 12), self.rng.randint(1, 28))
 
         # Generate lastname
         if children.female and children.married_to:
@@ -217,10 +433,10 @@ class PersonFactory:
         min_parent_dob = min(parents[0].date_of_birth, parents[1].date_of_birth)
 
         # Generate DOB
-        if siblings and random.random() < self._twin_probability:
+        if siblings and self.rng.random() < self._twin_probability:
             # Generating a twin
-            existing_twin = random.choice(siblings)
-            delta_minutes = max(int(random.gauss(self._avg_twin_time_diff, self._std_twin_time_diff)), 1)
+            existing_twin = self.rng.choice(siblings)
+            delta_minutes = max(int(self.rng.gauss(self._avg_twin_time_diff, self._std_twin_time_diff)), 1)
 
             child_dob = existing_twin.date_of_birth + timedelta(minutes=delta_minutes)
 
@@ -249,13 +465,13 @@ class PersonFactory:
                     (sib_days - self._min_days_sibling_diff, sib_days + self._min_days_sibling_diff)
                 )
 
-            child_days = int(random.gauss(mean_days, 365 * self._parent_child_age_diff_std))
+            child_days = int(self.rng.gauss(mean_days, 365 * self._parent_child_age_diff_std))
             while True:
                 # Check whether generated day is invalid
                 for invalid_interval in invalid_day_intervals:
                     if child_days >= invalid_interval[0] and child_days <= invalid_interval[1]:
                         # Invalid birth day -> Re-draw
-                        child_days = int(random.gauss(mean_days, 365 * self._parent_child_age_diff_std))
+                        child_days = int(self.rng.gauss(mean_days, 365 * self._parent_child_age_diff_std))
                         continue
 
                 break
@@ -279,13 +495,14 @@ class PersonFactory:
 
         # Generating DOB of spouse
         parent_yob = spouse.date_of_birth.year
-        spouse_yob = int(random.gauss(parent_yob, self._spouse_age_diff_std))
+        spouse_yob = int(self.rng.gauss(parent_yob, self._spouse_age_diff_std))
 
         # Enforce max diff parent age
         spouse_yob = min(
             max(spouse_yob, parent_yob - self._max_parent_age_diff), parent_yob + self._max_parent_age_diff
         )
-        spouse_dob = date(spouse_yob, random.randint(1, 12), random.randint(1, 28))
+        spouse_yob = max(spouse_yob, MINYEAR)
+        spouse_dob = date(spouse_yob, self.rng.randint(1, 12), self.rng.randint(1, 28))
 
         # Generate surname
         if female:
@@ -295,7 +512,7 @@ class PersonFactory:
 
             # We're going to void spouse's current surname -> add it back to the pool
             if not self.duplicate_names:
-                self._remaining_names[spouse.surname][spouse.female].append(spouse.name)
+                self._get_name_pool(spouse.female, spouse.surname).append(spouse.name)
 
             # For spouse, find new name which works with new_surname
             spouse.surname = new_surname
@@ -320,13 +537,13 @@ class PersonFactory:
         """
         if dob is None:
             dob = date(
-                tree_level * (self._max_parent_age + 1) + random.randint(1, self._max_parent_age),
-                random.randint(1, 12),
-                random.randint(1, 28),
+                tree_level * (self._max_parent_age + 1) + self.rng.randint(1, self._max_parent_age),
+                self.rng.randint(1, 12),
+                self.rng.randint(1, 28),
             )
 
         if female is None:
-            female = random.random() > 0.5
+            female = self.rng.random() > 0.5
 
         if surname is None:
             surname = self._get_last_name(female)
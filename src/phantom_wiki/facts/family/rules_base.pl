@@ -5,11 +5,26 @@ male(X) :-
 nonbinary(X) :-
   gender(X, "nonbinary").
 
+% When only Y is bound, start from Y so that the first goal hits the
+% first-argument index of parent/2 instead of scanning all parent facts.
+% Other call modes fall through to the second clause unchanged.
+sibling(X, Y) :-
+  var(X), nonvar(Y), !,
+  parent(Y, A),
+  parent(X, A),
+  X \= Y.
 sibling(X, Y) :-
   parent(X, A),
   parent(Y, A),
   X \= Y.
 
+% When only Y is bound, start from Y so that the first goal hits the
+% (JIT) second-argument index of parent/2.
+married(X, Y) :-
+  var(X), nonvar(Y), !,
+  parent(Child, Y),
+  parent(Child, X),
+  X \= Y.
 married(X, Y) :-
   parent(Child, X),
   parent(Child, Y),
@@ -1,7 +1,9 @@
 from argparse import ArgumentParser
 
+from ...utils import decode
 from ..database import Database
-from .generate import create_friendship_graph
+from .constants import FRIENDSHIP_MODELS
+from .generate import create_friendship_graph, get_family_tree_labels
 
 #
 # Functionality to read the friendship facts for each person in the database.
@@ -19,13 +21,26 @@ friend_gen_parser.add_argument(
 friend_gen_parser.add_argument(
     "--friendship-seed", type=int, default=1, help="Seed for friendship generation."
 )
+friend_gen_parser.add_argument(
+    "--friendship-model",
+    type=str,
+    default="erdos-renyi",
+    choices=FRIENDSHIP_MODELS,
+    help="Random graph model for the friendship graph. "
+    "The stochastic-block model makes friendships within a family tree more likely.",
+)
 
 
 #
 # Functionality to add friendships for everyone in the database.
 #
 def db_generate_friendships(
-    db: Database, friendship_k: int, friendship_seed: int, visualize: bool, output_dir: str
+    db: Database,
+    friendship_k: int,
+    friendship_seed: int,
+    visualize: bool,
+    output_dir: str,
+    friendship_model: str = "erdos-renyi",
 ):
     """
     Generate friendship facts for each person in the database.
@@ -36,12 +51,20 @@ def db_generate_friendships(
         friendship_seed (int): Seed for friendship generation.
         visualize (bool): Whether or not to visualize the friendship graphs.
         output_dir (str): Path to the output folder.
+        friendship_model (str): Random graph model for the friendship graph, one of FRIENDSHIP_MODELS.
 
     Returns:
         None
     """
     names = db.get_person_names()
-    friendship_facts = create_friendship_graph(names, friendship_k, friendship_seed, visualize, output_dir)
+    blocks = None
+    if friendship_model == "stochastic-block":
+        # use the family trees as blocks
+        parent_pairs = [(decode(r["X"]), decode(r["Y"])) for r in db.query("parent(X, Y)")]
+        blocks = get_family_tree_labels(names, parent_pairs)
+    friendship_facts = create_friendship_graph(
+        names, friendship_k, friendship_seed, visualize, output_dir, model=friendship_model, blocks=blocks
+    )
     # import pdb; pdb.set_trace()
     db.add(*friendship_facts)
 
@@ -11,3 +11,5 @@ FRIENDSHIP_RELATION = ["friend"]
 FRIENDSHIP_RELATION_ALIAS = {"friend": "friend"}
 
 FRIENDSHIP_RELATION_PLURAL_ALIAS = {"friend": "friends"}
+
+FRIENDSHIP_MODELS = ["erdos-renyi", "barabasi-albert", "watts-strogatz", "stochastic-block"]
@@ -1,34 +1,312 @@
 import logging
+import random
 import time
 
-import networkx as nx
+import numpy as np
 
+from .constants import FRIENDSHIP_MODELS
 
-def create_friendship_graph(names, k: int, seed: int, visualize: bool = False, output_dir: str = None):
+
+def _python_random_generator(seed: int) -> np.random.Generator:
+    """Returns a numpy Generator that draws the same doubles as `random.Random(seed).random()`.
+
+    Both use MT19937 with 53-bit doubles, so copying the state of the Python generator into numpy
+    lets us sample in bulk while reproducing the stream that `networkx` used to consume.
+    """
+    state = random.Random(seed).getstate()[1]
+    bit_generator = np.random.MT19937()
+    bit_generator.state = {
+        "bit_generator": "MT19937",
+        "state": {"key": np.array(state[:-1], dtype=np.uint32), "pos": state[-1]},
+    }
+    return np.random.Generator(bit_generator)
+
+
+def _pair_index_to_edges(pair_index: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Maps linear indices over the pairs (v, w) with w < v, enumerated row by row, to edge arrays.
+
+    Returns:
+        (w, v) arrays with w < v.
     """
-    Given the names, this creates a friendship graph using the G(n,p) variant of Erdos-Renyi model.
+    v = ((1 + np.sqrt(1 + 8 * pair_index.astype(np.float64))) // 2).astype(np.int64)
+    # Correct for floating point error in the square root
+    v -= v * (v - 1) // 2 > pair_index
+    v += v * (v + 1) // 2 <= pair_index
+    w = pair_index - v * (v - 1) // 2
+    return w, v
+
+
+def _sample_gnp_pair_index(num_pairs: int, p: float, rng: np.random.Generator) -> np.ndarray:
+    """Samples the linear pair indices of the edges of a G(n,p) graph with geometric skipping.
+
+    Skips between consecutive edges are drawn in vectorized chunks, so the cost is O(n + E) time
+    and O(E) memory instead of building a graph object.
+    """
+    if num_pairs == 0 or p <= 0:
+        return np.empty(0, dtype=np.int64)
+    if p >= 1:
+        return np.arange(num_pairs, dtype=np.int64)
+
+    lp = np.log(1.0 - p)
+    # Draw slightly more skips than the expected number of edges, so that usually one chunk suffices
+    chunk_size = int(num_pairs * p + 4 * np.sqrt(num_pairs * p)) + 1024
+    chunks = []
+    last = -1
+    while True:
+        lr = np.log(1.0 - rng.random(chunk_size))
+        positions = last + np.cumsum(1 + (lr / lp).astype(np.int64))
+        if positions[-1] >= num_pairs:
+            chunks.append(positions[: np.searchsorted(positions, num_pairs)])
+            break
+        chunks.append(positions)
+        last = positions[-1]
+    return np.concatenate(chunks)
+
+
+def _canonical_edges(src: np.ndarray, dst: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Removes self-loops and duplicate edges, and returns (src, dst) with src < dst sorted by (src, dst)."""
+    src, dst = np.minimum(src, dst), np.maximum(src, dst)
+    keep = src != dst
+    src, dst = src[keep], dst[keep]
+    if len(src) == 0:
+        return src.astype(np.int64), dst.astype(np.int64)
+    # Encode each edge as a single integer, which np.unique sorts by (src, dst)
+    n = int(dst.max()) + 1
+    codes = np.unique(src.astype(np.int64) * n + dst)
+    return codes // n, codes % n
+
+
+def sample_gnp_edges(n: int, p: float, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """Samples the edges of a G(n,p) Erdős–Rényi graph.
+
+    The edges are identical to those of `nx.fast_gnp_random_graph(n, p, seed=seed)`.
+
+    Args:
+        n: Number of nodes.
+        p: Probability of an edge between any two nodes.
+        seed: Seed for the random number generator.
+
+    Returns:
+        (src, dst) arrays of node indices with src < dst, sorted by (src, dst).
+    """
+    pair_index = _sample_gnp_pair_index(n * (n - 1) // 2, p, _python_random_generator(seed))
+    src, dst = _pair_index_to_edges(pair_index)
+    order = np.lexsort((dst, src))
+    return src[order], dst[order]
+
+
+def sample_barabasi_albert_edges(n: int, m: float, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """Samples the edges of a Barabási–Albert preferential attachment graph.
+
+    Uses the linear-time algorithm of Batagelj and Brandes (2005): every new edge of node v copies
+    the endpoint of a uniformly chosen earlier edge slot, which picks targets proportionally to
+    their degree. The copy chains are resolved with vectorized pointer jumping.
+    Self-loops and multi-edges produced by the algorithm are dropped.
+
+    Args:
+        n: Number of nodes.
+        m: Number of edges added by each node. If m is not an integer, node v adds
+            floor((v + 1) * m) - floor(v * m) edges, so that the nodes add m edges on average
+            (e.g. alternately 1 and 2 edges for m = 1.5).
+        seed: Seed for the random number generator.
+
+    Returns:
+        (src, dst) arrays of node indices with src < dst, sorted by (src, dst).
+    """
+    if n < 2 or m <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+
+    # Edge t connects node src[t] to the node stored in slot ptr[t] of the flattened edge list,
+    # where even slots 2s hold the source of edge s and odd slots 2s + 1 hold its target
+    num_edges_per_node = np.diff(np.floor(np.arange(n + 1) * m).astype(np.int64))
+    src = np.repeat(np.arange(n, dtype=np.int64), num_edges_per_node)
+    t = np.arange(len(src), dtype=np.int64)
+    ptr = (rng.random(len(src)) * (2 * t + 1)).astype(np.int64)
+    unresolved = np.flatnonzero(ptr % 2 == 1)
+    while len(unresolved) > 0:
+        # An odd slot 2s + 1 points to the target of edge s, so follow the pointer of edge s
+        ptr[unresolved] = ptr[ptr[unresolved] // 2]
+        unresolved = unresolved[ptr[unresolved] % 2 == 1]
+    dst = src[ptr // 2]
+    return _canonical_edges(src, dst)
+
+
+def sample_watts_strogatz_edges(
+    n: int, k: int, seed: int, rewire_prob: float = 0.1
+) -> tuple[np.ndarray, np.ndarray]:
+    """Samples the edges of a Watts–Strogatz small-world graph.
+
+    Starts from a ring lattice where each node is connected to its k // 2 nearest neighbors on each
+    side, then rewires the far endpoint of each edge to a uniformly random node with probability
+    `rewire_prob`. Rewired edges that become self-loops or duplicates are dropped.
+    If k is odd, every other node is also connected to its (k // 2 + 1)-th neighbor on one side,
+    so that the average degree is k.
+
+    Args:
+        n: Number of nodes.
+        k: Average degree.
+        seed: Seed for the random number generator.
+        rewire_prob: Probability of rewiring each edge.
+
+    Returns:
+        (src, dst) arrays of node indices with src < dst, sorted by (src, dst).
+    """
+    half_k = min(k // 2, (n - 1) // 2)
+    add_extra_neighbor = k % 2 == 1 and half_k == k // 2 and half_k + 1 <= (n - 1) // 2
+    if n < 2 or (half_k < 1 and not add_extra_neighbor):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+
+    src = np.repeat(np.arange(n, dtype=np.int64), half_k)
+    dst = (src + np.tile(np.arange(1, half_k + 1, dtype=np.int64), n)) % n
+    if add_extra_neighbor:
+        extra_src = np.arange(0, n, 2, dtype=np.int64)
+        src = np.concatenate([src, extra_src])
+        dst = np.concatenate([dst, (extra_src + half_k + 1) % n])
+    rewire = rng.random(len(dst)) < rewire_prob
+    dst[rewire] = rng.integers(0, n, size=int(rewire.sum()))
+    return _canonical_edges(src, dst)
+
+
+def sample_stochastic_block_edges(
+    blocks: np.ndarray, k: int, seed: int, intra_block_frac: float = 0.5
+) -> tuple[np.ndarray, np.ndarray]:
+    """Samples the edges of a stochastic block model graph.
+
+    Edge probabilities are chosen so that the expected average degree is k and a fraction
+    `intra_block_frac` of the edges fall inside blocks (e.g. family trees).
+    Within each block and across blocks, edges are sampled with geometric skipping.
+
+    Args:
+        blocks: Block label of each node.
+        k: Average degree.
+        seed: Seed for the random number generator.
+        intra_block_frac: Expected fraction of edges between nodes of the same block.
+
+    Returns:
+        (src, dst) arrays of node indices with src < dst, sorted by (src, dst).
+    """
+    n = len(blocks)
+    if n < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+
+    _, block_index = np.unique(blocks, return_inverse=True)
+    members = np.argsort(block_index, kind="stable")
+    block_sizes = np.bincount(block_index)
+    block_starts = np.concatenate([[0], np.cumsum(block_sizes)[:-1]])
+
+    num_pairs = n * (n - 1) // 2
+    num_intra_pairs = int((block_sizes * (block_sizes - 1) // 2).sum())
+    num_edges = n * k / 2
+    p_in = min(1.0, intra_block_frac * num_edges / num_intra_pairs) if num_intra_pairs else 0.0
+    p_out = (
+        min(1.0, (1 - intra_block_frac) * num_edges / (num_pairs - num_intra_pairs))
+        if num_pairs > num_intra_pairs
+        else 0.0
+    )
+
+    src_list, dst_list = [], []
+    for start, size in zip(block_starts.tolist(), block_sizes.tolist()):
+        local_src, local_dst = _pair_index_to_edges(_sample_gnp_pair_index(size * (size - 1) // 2, p_in, rng))
+        src_list.append(members[start + local_src])
+        dst_list.append(members[start + local_dst])
+
+    # Sample across all pairs with p_out and keep only the pairs that cross blocks
+    src, dst = _pair_index_to_edges(_sample_gnp_pair_index(num_pairs, p_out, rng))
+    crossing = block_index[src] != block_index[dst]
+    src_list.append(src[crossing])
+    dst_list.append(dst[crossing])
+
+    return _canonical_edges(np.concatenate(src_list), np.concatenate(dst_list))
+
+
+def get_family_tree_labels(names: list[str], parent_pairs: list[tuple[str, str]]) -> np.ndarray:
+    """Labels each name with the family tree it belongs to.
+
+    Family trees are the connected components of the parent relation, found with union-find.
+
+    Args:
+        names: Names of all people.
+        parent_pairs: (child, parent) name pairs.
+
+    Returns:
+        Array with the index of the family tree of each name.
+    """
+    index = {name: i for i, name in enumerate(names)}
+    root = list(range(len(names)))
+
+    def find(i: int) -> int:
+        while root[i] != i:
+            root[i] = root[root[i]]
+            i = root[i]
+        return i
+
+    for child, parent in parent_pairs:
+        root[find(index[child])] = find(index[parent])
+    return np.array([find(i) for i in range(len(names))], dtype=np.int64)
+
+
+def create_friendship_graph(
+    names,
+    k: int,
+    seed: int,
+    visualize: bool = False,
+    output_dir: str = None,
+    model: str = "erdos-renyi",
+    blocks=None,
+):
+    """
+    Given the names, this creates a friendship graph with average degree k.
+
+    The graph model is one of FRIENDSHIP_MODELS:
+    - "erdos-renyi": the G(n,p) variant of the Erdős–Rényi model
+    - "barabasi-albert": preferential attachment with k / 2 edges per new person on average
+    - "watts-strogatz": small-world ring lattice with random rewiring
+    - "stochastic-block": block model where `blocks` (e.g. family tree labels per name)
+        make friendships within a block more likely
 
     Returns a list of facts and individual features.
     """
     start_time = time.time()
-    # Generate an G(n,p) Erdős–Rényi random graph
-    p = k / len(names)
-    G = nx.fast_gnp_random_graph(n=len(names), p=p, seed=seed)
+    if len(names) == 0:
+        return []
 
-    # Rename nodes with names from the list
-    mapping = {i: name for i, name in enumerate(names)}
-    G = nx.relabel_nodes(G, mapping)
+    n = len(names)
+    if model == "erdos-renyi":
+        p = k / n
+        src, dst = sample_gnp_edges(n, p, seed)
+        title = f"Erdős–Rényi Graph G(n={n}, p={p})"
+    elif model == "barabasi-albert":
+        src, dst = sample_barabasi_albert_edges(n, k / 2, seed)
+        title = f"Barabási–Albert Graph (n={n}, m={k / 2})"
+    elif model == "watts-strogatz":
+        src, dst = sample_watts_strogatz_edges(n, k, seed)
+        title = f"Watts–Strogatz Graph (n={n}, k={k})"
+    elif model == "stochastic-block":
+        if blocks is None or len(blocks) != n:
+            raise ValueError("The stochastic block model requires a block label for each name.")
+        src, dst = sample_stochastic_block_edges(np.asarray(blocks), k, seed)
+        title = f"Stochastic Block Model Graph (n={n}, k={k})"
+    else:
+        raise ValueError(f"Unknown friendship model: {model}. Must be one of {FRIENDSHIP_MODELS}.")
 
-    facts = []
     # if there is an edge between two nodes, they are friends
-    connected_edges = list(G.edges)
-    for i, j in connected_edges:
-        facts.append(f'friend_("{i}", "{j}")')
-    logging.info(f"Generated friendship tree of {len(names)} individuals in {time.time()-start_time:.3f}s.")
+    facts = [f'friend_("{names[i]}", "{names[j]}")' for i, j in zip(src.tolist(), dst.tolist())]
+    logging.info(
+        f"Generated {model} friendship graph of {n} individuals and {len(facts)} friendships "
+        f"in {time.time()-start_time:.3f}s."
+    )
 
     if visualize:
+        import networkx as nx
         from matplotlib import pyplot as plt
 
+        G = nx.Graph()
+        G.add_nodes_from(names)
+        G.add_edges_from((names[i], names[j]) for i, j in zip(src.tolist(), dst.tolist()))
+
         plt.figure(figsize=(8, 6))
         nx.draw(
             G,
@@ -40,7 +318,7 @@ def create_friendship_graph(names, k: int, seed: int, visualize: bool = False, o
         )
 
         # Save the plot to a file
-        plt.title(f"Erdős–Rényi Graph G(n={len(names)}, p={p})")
+        plt.title(title)
         plt.savefig(
             f"{output_dir}/friendship_graph.png", format="png", dpi=300
         )  # Save as PNG with high resolution
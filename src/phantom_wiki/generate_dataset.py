@@ -27,8 +27,11 @@ def generate_dataset(
     num_family_trees: int = 1,
     stop_prob: int = 0,
     duplicate_names: bool = False,
+    family_tree_partitions: int = 0,
+    frontier_sampling: bool = False,
     friendship_k: int = 3,
     friendship_seed: int = 1,
+    friendship_model: str = "erdos-renyi",
     num_questions_per_type: int = 10,
     num_sampling_attempts: int = 100,
     question_depth: int = 6,
@@ -38,6 +41,7 @@ def generate_dataset(
     quiet: bool = False,
     visualize: bool = False,
     use_multithreading: bool = False,
+    query_cache_size: int = 0,
     seed: int = 1,
     output_dir: str = "./out",
     article_format: str = "txt",
@@ -59,8 +63,15 @@ def generate_dataset(
             after a person has been added. (default=0)
         duplicate_names (bool): Allow/prevent duplicate names in the generation.
             (default=False)
+        family_tree_partitions (int): Number of disjoint name pools to generate family trees in
+            parallel, with an independent random stream per tree. 0 means sequential generation.
+            (default=0)
+        frontier_sampling (bool): Only sample persons that can still get parents or children when
+            growing a family tree, instead of sampling any person and retrying. (default=False)
         friendship_k (int): Average degree in friendship graph. (default=3)
         friendship_seed (int): Seed for friendship generation. (default=1)
+        friendship_model (str): Random graph model for the friendship graph. Options: 'erdos-renyi',
+            'barabasi-albert', 'watts-strogatz', 'stochastic-block'. (default="erdos-renyi")
         num_questions_per_type (int): Number of questions to generate per question type
             (i.e., template). (default=10)
         num_sampling_attempts (int): Number of attempts to sample a valid question.
@@ -77,6 +88,8 @@ def generate_dataset(
         use_multithreading (bool): Use multithreading for querying the database when
             generating questions/answers. Note: This flag works for Windows and Linux,
             but not for MacOS. Also very intensive for high universe size. (default=False)
+        query_cache_size (int): Maximum number of Prolog query results to memoize while generating
+            articles and questions. 0 disables the cache. (default=0)
         seed (int): Global seed for random number generator. (default=1)
         output_dir (str): Path to the output folder. (default="./out")
         article_format (str): Format to save the generated articles. Options: 'txt', 'json'.
@@ -113,7 +126,7 @@ def generate_dataset(
     #
     # Step 1. Generate facts
     #
-    db = get_database()
+    db = get_database(cache_size=query_cache_size)
 
     blue("Generating facts")
     start = time.time()
@@ -130,10 +143,12 @@ def generate_dataset(
         max_family_tree_size,
         stop_prob,
         num_family_trees,
+        family_tree_partitions,
+        frontier_sampling,
     )
 
     # generate friend relationships between people in the database
-    db_generate_friendships(db, friendship_k, friendship_seed, visualize, output_dir)
+    db_generate_friendships(db, friendship_k, friendship_seed, visualize, output_dir, friendship_model)
 
     # generate jobs, hobbies for each person in the database
     db_generate_attributes(db, seed)
@@ -309,6 +324,13 @@ def generate_dataset(
 
     timings["total"] = time.time() - global_start
 
+    if query_cache_size:
+        cache_info = db.cache_info()
+        logging.info(
+            f"Query cache: {cache_info.hits} hits, {cache_info.misses} misses, "
+            f"{cache_info.currsize}/{cache_info.maxsize} entries"
+        )
+
     logging.info("Benchmarking results:")
     df_timings = pd.DataFrame([timings])
     logging.info(df_timings.T.to_markdown())
@@ -63,6 +63,13 @@ def get_parser(parents: list) -> argparse.ArgumentParser:
             "Also very intensive for high universe size."
         ),
     )
+    parser.add_argument(
+        "--query-cache-size",
+        type=int,
+        default=0,
+        help="Maximum number of Prolog query results to memoize while generating articles and questions. "
+        "0 disables the cache.",
+    )
     parser.add_argument("--seed", "-s", default=1, type=int, help="Global seed for random number generator")
     parser.add_argument("--output-dir", "-od", type=str, default="./out", help="Path to the output folder")
     parser.add_argument(
@@ -0,0 +1,176 @@
+import asyncio
+from collections import OrderedDict
+
+import pandas as pd
+from nltk.tokenize import PunktSentenceTokenizer
+
+from phantom_eval.agents.react import React_CoTSCAgent, ReactAgent
+from phantom_eval.agents.react_bm25 import TextCorpus
+from phantom_eval.llm import Conversation, InferenceGenerationConfig, LLMChat, LLMChatResponse
+from phantom_eval.prompts import CoTLLMPrompt, ReactLLMPrompt
+
+TEXT_CORPUS = pd.DataFrame({"title": ["Aida Wang"], "article": ["# Aida Wang ## Family"]})
+QUESTION = "What is the job of Aida Wang?"
+
+
+class MockReactChat(LLMChat):
+    """Mock class that returns the given responses in order, and records the prompts of a ReactAgent"""
+
+    def __init__(self, agent: ReactAgent, responses: list[LLMChatResponse]):
+        super().__init__("mock_model")
+        self.agent = agent
+        self.responses = responses
+        self.calls = []
+
+    async def generate_response(
+        self, conv: Conversation, inf_gen_config: InferenceGenerationConfig
+    ) -> LLMChatResponse:
+        # record the content blocks, and the prompt that the agent would build with the whole scratchpad
+        self.calls.append(
+            {
+                "content": conv.messages[0].content,
+                "stop_sequences": inf_gen_config.stop_sequences,
+                "agent_prompt": self.agent._build_agent_prompt(QUESTION),
+                "step_round": self.agent.step_round,
+            }
+        )
+        return self.responses[len(self.calls) - 1].model_copy(deep=True)
+
+    async def batch_generate_response(
+        self, convs: list[Conversation], inf_gen_config: InferenceGenerationConfig
+    ) -> list[LLMChatResponse]:
+        return await asyncio.gather(*[self.generate_response(conv, inf_gen_config) for conv in convs])
+
+
+def test_new_episode():
+    agent = ReactAgent(TEXT_CORPUS, ReactLLMPrompt())
+    agent._add_step("Thought 1: I need to retrieve the article about Aida Wang.", role="assistant")
+
+    episode = agent.new_episode()
+    # the resources are shared, and the state is reset
+    assert episode.text_corpus is agent.text_corpus
+    assert episode.corpus_index is agent.corpus_index
+    assert episode.llm_prompt is agent.llm_prompt
+    assert episode.scratchpad == "" and episode.scratchpad_steps == []
+    assert episode.agent_interactions is not agent.agent_interactions
+
+    # the state of the episodes is independent
+    episode._add_step("Action 1: RetrieveArticle[Aida Wang].", role="assistant")
+    assert len(agent.scratchpad_steps) == 1
+    assert len(agent.new_episode().scratchpad_steps) == 0
+
+    # sub-agents share the resources as well
+    agent = React_CoTSCAgent(TEXT_CORPUS, ReactLLMPrompt(), cot_llm_prompt=CoTLLMPrompt())
+    episode = agent.new_episode()
+    assert episode.react_agent is not agent.react_agent
+    assert episode.react_agent.text_corpus is agent.react_agent.text_corpus
+    assert episode.cotsc_agent.text_corpus is agent.text_corpus
+    assert episode.cotsc_agent.llm_prompt is agent.cotsc_agent.llm_prompt
+
+
+def test_text_corpus_lookup(monkeypatch):
+    monkeypatch.setattr(
+        TextCorpus, "_data", {0: "Aida Wang likes tea. She is a nurse.", 1: "Aida Wang likes coffee."}
+    )
+    monkeypatch.setattr(TextCorpus, "_title_mappings", {"aida wang": [0, 1]})
+    monkeypatch.setattr(TextCorpus, "_article_sentences", OrderedDict())
+    # NOTE: skip loading the corpus and retriever from disk
+    text_corpus = TextCorpus.__new__(TextCorpus)
+    text_corpus.sentence_tokenizer = PunktSentenceTokenizer()
+    text_corpus._reset_current_article()
+    assert text_corpus.lookup_keyword("likes")[0] is None
+
+    assert (
+        text_corpus.search_title_exact_match("Aida Wang")
+        == "Aida Wang likes tea. She is a nurse.\nAida Wang likes coffee."
+    )
+    assert text_corpus.lookup_keyword("LIKES", get_contextual_sentences=False) == (
+        "Aida Wang likes tea.",
+        "Found match in sentence 1 of 3",
+    )
+    assert text_corpus.lookup_keyword("LIKES", get_contextual_sentences=False)[0] == "Aida Wang likes coffee."
+    assert text_corpus.lookup_keyword("LIKES")[0] is None
+    assert text_corpus.lookup_keyword("nurse")[0] == " ".join(text_corpus.current_sentences)
+
+    # the sentences are cached per article
+    sentences = text_corpus.current_article
+    text_corpus.search_title_exact_match("aida wang")
+    assert text_corpus.current_article is sentences
+    assert text_corpus.lookup_keyword("likes")[1] == "Found match in sentence 1 of 3"
+
+
+def test_react_prompt_content_blocks():
+    agent = ReactAgent(TEXT_CORPUS, ReactLLMPrompt())
+    preds = [
+        "I need to retrieve Aida Wang.",
+        "RetrieveArticle[Aida Wang]",
+        "I know the answer.",
+        "Finish[nurse]",
+    ]
+    llm_chat = MockReactChat(
+        agent, [LLMChatResponse(pred=pred, usage={"total_tokens": 10}) for pred in preds]
+    )
+    response = asyncio.run(agent.run(llm_chat, QUESTION, InferenceGenerationConfig()))
+    assert (response.pred, response.usage, response.error) == ("nurse", {"total_tokens": 40}, None)
+
+    assert [call["stop_sequences"] for call in llm_chat.calls] == [["Action"], ["Observation"]] * 2
+    for call in llm_chat.calls:
+        step = "Thought" if call["stop_sequences"] == ["Action"] else "Action"
+        leading_llm_prompt = f"{step} {call['step_round']}: "
+        # the content blocks make up the same prompt as before
+        content = call["content"]
+        assert "".join(block.text for block in content) == call["agent_prompt"] + "\n" + leading_llm_prompt
+        # the prompt before the scratchpad and the last step are marked as cache breakpoints
+        num_steps = len(content) - 2
+        assert [block.cache_control for block in content] == (
+            [True] + [i == num_steps - 1 for i in range(num_steps)] + [False]
+        )
+    # one block for the prompt before the scratchpad, one per step (thought, action, observation, thought),
+    # and one for the rest of the prompt
+    assert len(llm_chat.calls[-1]["content"]) == 1 + 4 + 1
+
+
+def test_react_merge_thought_action():
+    agent = ReactAgent(TEXT_CORPUS, ReactLLMPrompt(), merge_thought_action=True)
+    preds = [
+        "I need to retrieve Aida Wang.\nAction 1: RetrieveArticle[Aida Wang]",
+        "I know the answer.\nAction: Finish[nurse]",
+    ]
+    llm_chat = MockReactChat(
+        agent, [LLMChatResponse(pred=pred, usage={"total_tokens": 10}) for pred in preds]
+    )
+    response = asyncio.run(agent.run(llm_chat, QUESTION, InferenceGenerationConfig()))
+    assert (response.pred, response.usage, response.error) == ("nurse", {"total_tokens": 20}, None)
+
+    # the thought and action are generated in one call, and split into two steps
+    assert [call["stop_sequences"] for call in llm_chat.calls] == [["Observation"]] * 2
+    assert agent.scratchpad_steps[:2] == [
+        "Thought 1: I need to retrieve Aida Wang.",
+        "Action 1: RetrieveArticle[Aida Wang]",
+    ]
+    assert agent.scratchpad_steps[3:] == ["Thought 2: I know the answer.", "Action 2: Finish[nurse]"]
+    for call in llm_chat.calls:
+        leading_llm_prompt = f"Thought {call['step_round']}: "
+        assert (
+            "".join(block.text for block in call["content"])
+            == call["agent_prompt"] + "\n" + leading_llm_prompt
+        )
+
+
+def test_react_merge_thought_action_fallback():
+    agent = ReactAgent(TEXT_CORPUS, ReactLLMPrompt(), merge_thought_action=True)
+    responses = [
+        # no action after the thought -> the action is generated separately
+        LLMChatResponse(pred="I know the answer.", usage={"prompt_tokens": 8, "total_tokens": 10}),
+        LLMChatResponse(pred="Finish[nurse]", usage={"prompt_tokens": 4, "total_tokens": 5}),
+    ]
+    llm_chat = MockReactChat(agent, responses)
+    response = asyncio.run(agent.run(llm_chat, QUESTION, InferenceGenerationConfig()))
+    assert (response.pred, response.error) == ("nurse", None)
+    # the usage of both calls is aggregated
+    assert response.usage == {"prompt_tokens": 12, "total_tokens": 15}
+
+    assert [call["stop_sequences"] for call in llm_chat.calls] == [["Observation"]] * 2
+    assert agent.scratchpad_steps == ["Thought 1: I know the answer.", "Action 1: Finish[nurse]"]
+    last_call = llm_chat.calls[-1]
+    assert "".join(block.text for block in last_call["content"]) == last_call["agent_prompt"] + "\nAction 1: "
@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from tenacity import RetryCallState
+
+from phantom_eval.llm.concurrency import (
+    AdaptiveConcurrencyController,
+    ThroughputMonitor,
+    get_retry_after,
+    is_throttling_error,
+    wait_retry_after_or_exponential_jitter,
+)
+
+
+class MockAPIError(Exception):
+    def __init__(self, status_code: int, headers: dict | None = None):
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+
+
+def test_throttling_errors():
+    assert is_throttling_error(MockAPIError(429))
+    assert is_throttling_error(MockAPIError(503))
+    assert not is_throttling_error(MockAPIError(400))
+    assert not is_throttling_error(ValueError("not an API error"))
+
+    assert get_retry_after(MockAPIError(429, {"retry-after": "3"})) == 3
+    assert get_retry_after(MockAPIError(429, {"retry-after-ms": "1500", "retry-after": "2"})) == 1.5
+    assert get_retry_after(MockAPIError(429, {"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0
+    assert get_retry_after(MockAPIError(429)) is None
+
+
+def test_wait_retry_after_or_exponential_jitter():
+    wait = wait_retry_after_or_exponential_jitter(wait_seconds=2)
+
+    def get_wait(attempt_number: int, exception: Exception) -> float:
+        retry_state = RetryCallState(None, None, (), {})
+        retry_state.attempt_number = attempt_number
+        retry_state.set_exception((type(exception), exception, None))
+        return wait(retry_state)
+
+    assert get_wait(1, MockAPIError(429, {"retry-after": "7"})) == 7
+    for attempt_number, backoff in [(1, 2), (2, 4), (3, 8), (10, 60)]:
+        assert backoff / 2 <= get_wait(attempt_number, MockAPIError(500)) <= backoff
+
+
+def test_adaptive_concurrency_controller():
+    controller = AdaptiveConcurrencyController(max_concurrency=8, initial_concurrency=2)
+    max_in_flight = 0
+
+    async def call(latency: float, status_code: int | None = None):
+        nonlocal max_in_flight
+        async with controller.slot():
+            max_in_flight = max(max_in_flight, controller.in_flight)
+            await asyncio.sleep(latency)
+            if status_code is not None:
+                raise MockAPIError(status_code)
+
+    async def run():
+        # additive increase while the latency is stable
+        await asyncio.gather(*[call(0.01) for _ in range(40)])
+        assert controller.limit == 8
+        assert max_in_flight <= 8
+
+        # multiplicative decrease once for calls that fail together
+        results = await asyncio.gather(*[call(0.01, 429) for _ in range(8)], return_exceptions=True)
+        assert all(isinstance(r, MockAPIError) for r in results)
+        assert controller.limit == 4
+        with pytest.raises(MockAPIError):
+            await call(0.01, 429)
+        assert controller.limit == 2
+
+        # no increase when the latency is much larger than the average
+        await call(1.0)
+        assert controller.limit == 2
+        # errors that are not throttling do not change the limit
+        with pytest.raises(MockAPIError):
+            await call(0.01, 400)
+        assert controller.limit == 2
+
+    asyncio.run(run())
+
+
+def test_throughput_monitor():
+    monitor = ThroughputMonitor()
+    assert monitor.get_stats() == {"requests": 0, "tokens": 0, "rpm": 0, "tpm": 0}
+    for _ in range(3):
+        monitor.record(100)
+    # the rates are measured over at least 1 second
+    assert monitor.get_stats() == {"requests": 3, "tokens": 300, "rpm": 180, "tpm": 18000}
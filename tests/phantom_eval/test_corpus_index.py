@@ -0,0 +1,54 @@
+from copy import deepcopy
+
+import pandas as pd
+
+from phantom_eval.agents.common import CorpusIndex
+
+TEXT_CORPUS = pd.DataFrame(
+    {
+        "title": ["Aida Wang", "Alvaro Smock", "aida wang", "Ryan Wang"],
+        "article": [
+            "# Aida Wang ## Attributes The hobby of Aida Wang is meditation.",
+            "# Alvaro Smock ## Friends The friends of Alvaro Smock are Aida Wang.",
+            "# Aida Wang (duplicate)",
+            "# Ryan Wang ## Attributes The occupation of Ryan Wang is personal assistant.",
+        ],
+    }
+)
+
+
+def search_with_pandas(attribute: str) -> list[str]:
+    return TEXT_CORPUS.loc[
+        TEXT_CORPUS["article"].str.lower().str.contains(attribute.lower()), "title"
+    ].tolist()
+
+
+def test_get_article():
+    index = CorpusIndex(TEXT_CORPUS)
+    # the first article is returned for duplicate titles
+    assert index.get_article("AIDA WANG") == TEXT_CORPUS["article"][0]
+    assert index.get_article("ryan wang") == TEXT_CORPUS["article"][3]
+    assert index.get_article("vicki hackworth") is None
+
+
+def test_search():
+    index = CorpusIndex(TEXT_CORPUS)
+    for attribute in [
+        "aida wang",
+        "Meditation",
+        "personal assistant",
+        "wang ## attributes",
+        "#",
+        "",
+        "biology",
+        # regular expressions
+        "smock|ryan",
+        "m.ditation",
+    ]:
+        assert index.search(attribute) == search_with_pandas(attribute), attribute
+    # matches cannot span two articles
+    assert index.search("wang.# alvaro") == []
+    assert index.search("\x00# alvaro") == []
+
+    # copies of the index share the memoized results
+    assert deepcopy(index) is index
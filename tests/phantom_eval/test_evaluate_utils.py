@@ -0,0 +1,184 @@
+import datetime
+import json
+import os
+import re
+from glob import glob
+
+import pandas as pd
+from joblib import Memory
+
+from phantom_eval import evaluate_utils
+from phantom_eval.evaluate_utils import _get_pred_file_stamps, _get_preds, get_predictions_with_qa
+from phantom_eval.pred_store import METADATA, SAMPLING_PARAMS
+
+SPLITS = ["depth_20_size_50_seed_1", "depth_10_size_100_seed_3"]
+
+
+def write_pred_file(output_dir: str, split: str, batch_number: int, pred: str = "Alice") -> str:
+    preds = {
+        f"{split}-{batch_number}-{i}": {
+            "true": ["Alice"],
+            "pred": pred,
+            "prolog_query": None,
+            "prolog_query_results": None,
+            "error": None,
+            "interaction": [],
+            "metadata": {
+                "model": "org/model",
+                "dataset": "mlcore/phantom-wiki",
+                "split": split,
+                "batch_size": 2,
+                "batch_number": batch_number,
+                "type": i,
+                "difficulty": 1,
+            },
+            "inference_params": {"seed": 1, "temperature": 0.0},
+            "model_kwargs": {},
+            "agent_kwargs": {},
+            "usage": {"prompt_tokens": 10},
+        }
+        for i in range(2)
+    }
+    os.makedirs(f"{output_dir}/preds/zeroshot", exist_ok=True)
+    filename = (
+        f"{output_dir}/preds/zeroshot/split={split}__model_name=org--model__bs=2__bn={batch_number}.json"
+    )
+    with open(filename, "w") as f:
+        json.dump(preds, f)
+    return filename
+
+
+def load_data(dataset: str, split: str, from_local: bool = False) -> dict:
+    qa_pairs = [
+        {
+            "id": f"{split}-{batch_number}-{i}",
+            "template": ["Who", "is", "<A>", "?"],
+            "prolog": {"query": ["friend(X, Y)", "aggregate_all(count, Y, Count)"][: i + 1]},
+            "answer": ["Alice"],
+        }
+        for batch_number in range(1, 4)
+        for i in range(2)
+    ]
+    return {"qa_pairs": qa_pairs}
+
+
+def use_tmp_cache(monkeypatch, tmp_path):
+    """Cache the results in a temporary directory and use a mock `load_data`"""
+    memory = Memory(str(tmp_path / "cachedir"), verbose=0)
+    monkeypatch.setattr(evaluate_utils, "memory", memory)
+    for name in ["_get_predictions_with_qa", "_get_qa_pairs"]:
+        monkeypatch.setattr(evaluate_utils, name, memory.cache(getattr(evaluate_utils, name).func))
+    load_data.func = load_data
+    monkeypatch.setattr(evaluate_utils, "load_data", load_data)
+    return memory
+
+
+def test_pred_file_stamps(tmp_path):
+    output_dir = str(tmp_path)
+    stamps = _get_pred_file_stamps(output_dir, "zeroshot")
+    filename = write_pred_file(output_dir, SPLITS[0], 1)
+    assert _get_pred_file_stamps(output_dir, "zeroshot") != stamps
+
+    # new prediction files change the stamps
+    stamps = _get_pred_file_stamps(output_dir, "zeroshot")
+    assert _get_pred_file_stamps(output_dir, "zeroshot") == stamps
+    write_pred_file(output_dir, SPLITS[0], 2)
+    assert _get_pred_file_stamps(output_dir, "zeroshot") != stamps
+
+    # modified prediction files change the stamps
+    stamps = _get_pred_file_stamps(output_dir, "zeroshot")
+    os.utime(filename, ns=(os.stat(filename).st_atime_ns, os.stat(filename).st_mtime_ns + 10**9))
+    assert _get_pred_file_stamps(output_dir, "zeroshot") != stamps
+    # predictions of other methods do not
+    stamps = _get_pred_file_stamps(output_dir, "zeroshot")
+    os.makedirs(f"{output_dir}/preds/fewshot")
+    open(f"{output_dir}/preds/fewshot/bn=1.json", "w").close()
+    assert _get_pred_file_stamps(output_dir, "zeroshot") == stamps
+
+
+def test_get_predictions_with_qa_cache_invalidation(monkeypatch, tmp_path):
+    use_tmp_cache(monkeypatch, tmp_path)
+    output_dir = str(tmp_path / "out")
+    filename = write_pred_file(output_dir, SPLITS[0], 1)
+
+    df = get_predictions_with_qa(output_dir, "zeroshot", "mlcore/phantom-wiki")
+    assert len(df) == 2
+    # the merged frame is cached
+    assert get_predictions_with_qa(output_dir, "zeroshot", "mlcore/phantom-wiki").equals(df)
+
+    # new prediction files invalidate the cache
+    write_pred_file(output_dir, SPLITS[1], 2)
+    df = get_predictions_with_qa(output_dir, "zeroshot", "mlcore/phantom-wiki")
+    assert len(df) == 4
+
+    # modified prediction files invalidate the cache
+    write_pred_file(output_dir, SPLITS[0], 1, pred="Bob")
+    os.utime(filename, ns=(os.stat(filename).st_atime_ns, os.stat(filename).st_mtime_ns + 10**9))
+    df = get_predictions_with_qa(output_dir, "zeroshot", "mlcore/phantom-wiki")
+    assert df.loc[df["_split"] == SPLITS[0], "pred"].tolist() == ["Bob", "Bob"]
+
+
+def test_get_predictions_with_qa_cache_size(monkeypatch, tmp_path):
+    memory = use_tmp_cache(monkeypatch, tmp_path)
+    output_dir = str(tmp_path / "out")
+
+    def num_cached_frames() -> int:
+        return len(glob(f"{memory.location}/joblib/**/_get_predictions_with_qa/*/output.pkl", recursive=True))
+
+    # every new prediction file adds an entry
+    for batch_number in range(1, 4):
+        write_pred_file(output_dir, SPLITS[0], batch_number)
+        get_predictions_with_qa(output_dir, "zeroshot", "mlcore/phantom-wiki")
+    assert num_cached_frames() == 3
+
+    # entries that are too old are removed
+    monkeypatch.setattr(evaluate_utils, "CACHE_AGE_LIMIT", datetime.timedelta(0))
+    df = get_predictions_with_qa(output_dir, "zeroshot", "mlcore/phantom-wiki")
+    assert num_cached_frames() == 0
+    assert len(df) == 6
+
+    # the cache is reduced to the size limit
+    monkeypatch.setattr(evaluate_utils, "CACHE_AGE_LIMIT", datetime.timedelta(days=1))
+    monkeypatch.setattr(evaluate_utils, "CACHE_BYTES_LIMIT", 1)
+    write_pred_file(output_dir, SPLITS[1], 4)
+    assert len(get_predictions_with_qa(output_dir, "zeroshot", "mlcore/phantom-wiki")) == 8
+    assert num_cached_frames() == 0
+
+
+def test_get_preds_matches_sequential_reads(tmp_path):
+    output_dir = str(tmp_path)
+    for batch_number, split in [(3, SPLITS[0]), (1, SPLITS[1]), (2, SPLITS[0])]:
+        write_pred_file(output_dir, split, batch_number)
+
+    # read the files one at a time, adding the auxiliary columns with .apply
+    files = sorted(
+        glob(f"{output_dir}/preds/zeroshot/*.json"), key=lambda x: int(re.search(r"bn=(\d+)", x).group(1))
+    )
+    df_list = []
+    for filename in files:
+        df = pd.read_json(filename, orient="index", dtype=False)
+        for key in METADATA:
+            df["_" + key] = df["metadata"].apply(lambda x: x[key])
+        for key in SAMPLING_PARAMS:
+            df["_" + key] = df["inference_params"].apply(lambda x: x[key])
+        df = df.drop(columns=["metadata"])
+        df_list.append(df.reset_index(names="id"))
+    expected = pd.concat(df_list).sort_values("_batch_number", kind="stable", ignore_index=True)
+
+    pd.testing.assert_frame_equal(_get_preds(output_dir, "zeroshot"), expected)
+
+
+def test_get_predictions_with_qa_split_params(monkeypatch, tmp_path):
+    use_tmp_cache(monkeypatch, tmp_path)
+    output_dir = str(tmp_path / "out")
+    for batch_number, split in [(1, SPLITS[0]), (2, SPLITS[1]), (3, SPLITS[0])]:
+        write_pred_file(output_dir, split, batch_number)
+
+    df = get_predictions_with_qa(output_dir, "zeroshot", "mlcore/phantom-wiki")
+    pattern = r"depth_(\d+)_size_(\d+)_seed_(\d+)"
+    for column, group in [("_depth", 1), ("_size", 2), ("_data_seed", 3)]:
+        expected = df["_split"].apply(lambda x: re.match(pattern, x).group(group)).astype(int)
+        pd.testing.assert_series_equal(df[column], expected, check_names=False)
+    # the auxiliary columns of the qa pairs are joined
+    assert df["hops"].tolist() == [1, 2] * 3
+    assert df["aggregation"].tolist() == [0, 1] * 3
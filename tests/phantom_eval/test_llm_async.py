@@ -5,6 +5,8 @@ import asyncio
 import time
 from pathlib import Path
 
+import pytest
+
 from phantom_eval.llm import (
     ContentTextMessage,
     Conversation,
@@ -33,13 +35,22 @@ class MockChat(CommonLLMChat):
         model_name: str,
         usage_tier: int = 1,
         enforce_rate_limits: bool = True,
+        max_concurrency: int = 32,
+        initial_concurrency: int = 4,
+        rate_limit_utilization: float = 1.0,
     ):
         super().__init__(
             model_name,
             enforce_rate_limits=enforce_rate_limits,
             llms_rpm_tpm_config_fpath=MOCK_RPM_TPM_CONFIG_FPATH,
+            max_concurrency=max_concurrency,
+            initial_concurrency=initial_concurrency,
+            rate_limit_utilization=rate_limit_utilization,
         )
         self._update_rate_limits("mock", model_name, usage_tier)
+        # track the number of concurrent API calls
+        self.num_in_flight = 0
+        self.max_in_flight = 0
 
     def _count_tokens(self, messages_api_format: list[dict]) -> int:
         return len(messages_api_format[0]["content"][0]["text"])
@@ -55,7 +66,10 @@ class MockChat(CommonLLMChat):
         async def mock_api_call():
             # return the content of the message
             print("Begin mock API call")
+            self.num_in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.num_in_flight)
             await asyncio.sleep(0.1)
+            self.num_in_flight -= 1
             print("End mock API call")
             return messages_api_format[0]["content"][0]["text"]
 
@@ -68,6 +82,29 @@ class MockChat(CommonLLMChat):
         return LLMChatResponse(pred=response, usage={})
 
 
+class FlakyMockChat(MockChat):
+    """Mock class whose API calls fail on the first try"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num_calls = 0
+
+    def _call_api(
+        self,
+        messages_api_format: list[dict],
+        inf_gen_config: InferenceGenerationConfig,
+        use_async: bool = False,
+    ) -> object:
+        self.num_calls += 1
+        if self.num_calls == 1:
+
+            async def failing_api_call():
+                raise ConnectionError("Mock API call failed")
+
+            return failing_api_call()
+        return super()._call_api(messages_api_format, inf_gen_config, use_async)
+
+
 #
 # Tests
 #
@@ -101,8 +138,8 @@ def test_mock_batch_high_rpm_low_tpm():
     """
     Expected output:
     ```
-    Time taken for 300 calls: 2 minutes 1.7 seconds
-    Expected time taken for 300 calls: 2 minutes 1.2 seconds
+    Time taken for 300 calls: 1 minutes 8.1 seconds
+    Expected time taken for 300 calls: 1 minutes 8.6 seconds
     ```
     """
     n = 300
@@ -130,10 +167,12 @@ def test_mock_batch_high_rpm_low_tpm():
 
     # NOTE: for this test, the limiting factor is the tokens
     TRUE_RPM = llm_chat.TPM_LIMIT // len(LONG_EXAMPLE_PROMPT)
-    expected_minutes = int(n // TRUE_RPM)  # minutes
-    remainder_requests = n - expected_minutes * TRUE_RPM
-    expected_seconds = remainder_requests / llm_chat.RPM_LIMIT * 60  # seconds
+    # the first minute's worth of calls are made immediately, the rest at the rate limit
+    expected = max(n - TRUE_RPM, 0) / TRUE_RPM * 60  # seconds
+    expected_minutes = int(expected // 60)
+    expected_seconds = expected % 60
     print(f"Expected time taken for {n} calls: {expected_minutes} minutes {expected_seconds:.1f} seconds")
+    assert elapsed > expected - 1
 
     preds = [response.pred for response in responses]
     assert all(preds[i] == LONG_EXAMPLE_PROMPT for i in range(n))
@@ -142,8 +181,8 @@ def test_mock_batch_high_rpm_low_tpm():
 def test_mock_batch_low_rpm_high_tpm():
     """expected output:
     ```
-    Time taken for 50 calls: 2 minutes 30.0 seconds
-    Expected time taken for 50 calls: 2 minutes 30.0 seconds
+    Time taken for 50 calls: 1 minutes 30.0 seconds
+    Expected time taken for 50 calls: 1 minutes 30.0 seconds
     ```
     """
     llm_chat = MockChat(
@@ -172,10 +211,12 @@ def test_mock_batch_low_rpm_high_tpm():
 
     # NOTE: for this test, the limiting factor is the RPM
     TRUE_RPM = llm_chat.RPM_LIMIT
-    expected_minutes = n // TRUE_RPM  # minutes
-    remainder_requests = n - expected_minutes * TRUE_RPM
-    expected_seconds = remainder_requests / TRUE_RPM * 60  # seconds
+    # the first minute's worth of calls are made immediately, the rest at the rate limit
+    expected = max(n - TRUE_RPM, 0) / TRUE_RPM * 60  # seconds
+    expected_minutes = int(expected // 60)
+    expected_seconds = expected % 60
     print(f"Expected time taken for {n} calls: {expected_minutes} minutes {expected_seconds:.1f} seconds")
+    assert elapsed > expected - 1
 
     preds = [response.pred for response in responses]
     assert all(preds[i] == LONG_EXAMPLE_PROMPT for i in range(n))
@@ -184,8 +225,8 @@ def test_mock_batch_low_rpm_high_tpm():
 def test_mock_batch_high_rpm_high_tpm():
     """expected output:
     ```
-    Time taken for 300 calls: 0 minute 18 seconds
-    Expected time taken for 300 calls: 0 minute 18 seconds
+    Time taken for 300 calls: 0 minutes 0.1 seconds
+    Expected time taken for 300 calls: 0 minutes 0.0 seconds
     ```
     """
     llm_chat = MockChat(
@@ -213,10 +254,51 @@ def test_mock_batch_high_rpm_high_tpm():
 
     # NOTE: for this test, the limiting factor is the RPM
     TRUE_RPM = llm_chat.RPM_LIMIT
-    expected_minutes = n // TRUE_RPM  # minutes
-    remainder_requests = n - expected_minutes * TRUE_RPM
-    expected_seconds = remainder_requests / TRUE_RPM * 60  # seconds
+    # the first minute's worth of calls are made immediately, the rest at the rate limit
+    expected = max(n - TRUE_RPM, 0) / TRUE_RPM * 60  # seconds
+    expected_minutes = int(expected // 60)
+    expected_seconds = expected % 60
     print(f"Expected time taken for {n} calls: {expected_minutes} minutes {expected_seconds:.1f} seconds")
+    assert elapsed > expected - 1
 
     preds = [response.pred for response in responses]
     assert all(preds[i] == LONG_EXAMPLE_PROMPT for i in range(n))
+
+
+def test_mock_batch_no_rate_limits():
+    """Without rate limits, the API calls run concurrently up to max_concurrency"""
+    n = 50
+    llm_chat = MockChat(
+        model_name="mock_model",
+        enforce_rate_limits=False,
+        max_concurrency=10,
+        initial_concurrency=10,
+    )
+    start = time.time()
+    responses = asyncio.run(llm_chat.batch_generate_response([example_conv] * n, inf_gen_config))
+    elapsed = time.time() - start
+    print(f"Time taken for {n} calls: {elapsed:.1f} seconds")
+
+    assert llm_chat.max_in_flight == 10
+    # 5 rounds of 10 concurrent calls that take 0.1 seconds each
+    assert elapsed < 1.0
+    assert all(response.pred == EXAMPLE_PROMPT for response in responses)
+
+
+def test_mock_retry_no_rate_limits():
+    llm_chat = FlakyMockChat(model_name="mock_model", enforce_rate_limits=False)
+    config = InferenceGenerationConfig(max_retries=2, wait_seconds=0)
+    response = asyncio.run(llm_chat.generate_response(example_conv, config))
+    assert llm_chat.num_calls == 2
+    assert response.pred == EXAMPLE_PROMPT
+
+
+def test_mock_input_tokens_exceed_token_capacity():
+    """Requests that can never fit in the token bucket fail without retrying"""
+    # TPM limit 80000, token capacity 40000
+    llm_chat = FlakyMockChat(model_name="mock_model", usage_tier=1, rate_limit_utilization=0.5)
+    conv = Conversation(messages=[Message(role="user", content=[ContentTextMessage(text="1" * 50000)])])
+    config = InferenceGenerationConfig(max_retries=3, wait_seconds=0)
+    with pytest.raises(ValueError, match="exceed token capacity"):
+        asyncio.run(llm_chat.generate_response(conv, config))
+    assert llm_chat.num_calls == 0
@@ -0,0 +1,95 @@
+from phantom_eval.pred_store import (
+    get_interactions_path,
+    get_pred_parquet_path,
+    read_interactions,
+    read_preds_parquet,
+    write_preds_parquet,
+)
+
+
+def make_preds(
+    split: str, batch_number: int, with_interactions: bool, error: str | None = None
+) -> dict[str, dict]:
+    return {
+        f"{split}-{batch_number}-{i}": {
+            "true": ["Alice", "Bob"],
+            "pred": "Alice",
+            "prolog_query": None if error is None else "?- hobby(X, Y).",
+            "prolog_query_results": None,
+            "error": error,
+            "interaction": {"messages": [{"role": "user", "content": f"q{i}"}]} if with_interactions else [],
+            "metadata": {
+                "model": "org/model",
+                "dataset": "mlcore/phantom-wiki",
+                "split": split,
+                "batch_size": 2,
+                "batch_number": batch_number,
+                "type": i,
+                "difficulty": 1,
+            },
+            "inference_params": {"seed": 1, "temperature": 0.0},
+            "model_kwargs": {"model_path": "org/model"},
+            "agent_kwargs": {},
+            "usage": {"prompt_tokens": 10, "completion_tokens": 2},
+        }
+        for i in range(2)
+    }
+
+
+def test_get_pred_parquet_path(tmp_path):
+    pred_path = get_pred_parquet_path(
+        str(tmp_path), "zeroshot", "org/model", "depth_20_size_50_seed_1", 1, "bs=2__bn=1"
+    )
+    assert pred_path == (
+        tmp_path
+        / "preds_parquet/zeroshot/model=org--model/split=depth_20_size_50_seed_1/seed=1/bs=2__bn=1.parquet"
+    )
+    assert get_interactions_path(pred_path) == (
+        tmp_path
+        / "interactions/zeroshot/model=org--model/split=depth_20_size_50_seed_1/seed=1/bs=2__bn=1.jsonl.gz"
+    )
+
+
+def test_write_read_preds_parquet(tmp_path):
+    assert read_preds_parquet(str(tmp_path), "react").empty
+
+    for split, batch_number, with_interactions in [
+        ("split_b", 2, True),
+        ("split_a", 1, True),
+        ("split_a", 2, False),
+    ]:
+        pred_path = get_pred_parquet_path(
+            str(tmp_path), "react", "org/model", split, 1, f"bs=2__bn={batch_number}"
+        )
+        write_preds_parquet(make_preds(split, batch_number, with_interactions), pred_path)
+
+    # a batch with errors after batches without errors
+    pred_path = get_pred_parquet_path(str(tmp_path), "react", "org/model", "split_b", 1, "bs=2__bn=3")
+    write_preds_parquet(make_preds("split_b", 3, False, error="Rate limit exceeded"), pred_path)
+
+    df = read_preds_parquet(str(tmp_path), "react")
+    assert len(df) == 8
+    row = df[df["id"] == "split_b-3-0"].iloc[0]
+    assert (row["error"], row["prolog_query"]) == ("Rate limit exceeded", "?- hobby(X, Y).")
+    assert df["error"].isna().sum() == 6
+    df = df[~df["id"].str.startswith("split_b-3")]
+    assert sorted(df["id"]) == sorted(
+        f"{s}-{b}-{i}" for s, b in [("split_a", 1), ("split_a", 2), ("split_b", 2)] for i in range(2)
+    )
+    row = df[df["id"] == "split_b-2-1"].iloc[0]
+    assert list(row["true"]) == ["Alice", "Bob"]
+    assert (row["_model"], row["_split"], row["_batch_number"], row["_type"], row["_seed"]) == (
+        "org/model",
+        "split_b",
+        2,
+        1,
+        1,
+    )
+    # nested fields are decoded
+    assert row["usage"] == {"prompt_tokens": 10, "completion_tokens": 2}
+    assert row["prolog_query_results"] is None
+
+    # interactions are stored separately, and only for batches that have them
+    df_interactions = read_interactions(str(tmp_path), "react")
+    assert sorted(df_interactions["id"]) == ["split_a-1-0", "split_a-1-1", "split_b-2-0", "split_b-2-1"]
+    assert df_interactions.set_index("id").loc["split_b-2-1", "interaction"]["messages"][0]["content"] == "q1"
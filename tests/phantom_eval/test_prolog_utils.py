@@ -0,0 +1,137 @@
+import asyncio
+import logging
+
+import pytest
+
+from phantom_eval.llm import LLMChatResponse
+from phantom_eval.prolog_utils import (
+    PrologQueryPool,
+    aget_prolog_results,
+    get_prolog_results,
+    parse_prolog_query,
+    split_prolog_query,
+)
+from phantom_wiki.facts.database import Database
+from phantom_wiki.utils import decode
+from tests.phantom_wiki.facts import DATABASE_SMALL_PATH, DATABASE_TEST_PATH
+
+
+def test_prolog_query_pool():
+    async def run():
+        async with PrologQueryPool(str(DATABASE_SMALL_PATH), num_workers=2, timeout=5) as pool:
+            results = await asyncio.gather(
+                pool.query('?- parent("Dirk Donohue", X).'),
+                pool.query('sibling("Dirk Donohue", X)'),
+                pool.query("type(X, person)"),
+            )
+            assert {r["X"] for r in results[0]} == {"Mason Donohue", "Therese Donohue"}
+            assert {r["X"] for r in results[1]} == {"Pedro Donohue", "Ty Donohue", "Veronica Donohue"}
+            assert len(results[2]) == 27
+
+            with pytest.raises(RuntimeError):
+                await pool.query("parent(X")
+
+    asyncio.run(run())
+
+
+def test_prolog_query_pool_limits():
+    async def run():
+        async with PrologQueryPool(
+            str(DATABASE_SMALL_PATH), num_workers=1, timeout=1, inference_limit=1_000_000
+        ) as pool:
+            # runaway queries are stopped by the inference limit ...
+            with pytest.raises(RuntimeError, match="Inference limit"):
+                await pool.query("between(1, inf, _), fail")
+            # ... or by the timeout, e.g. when sleeping without inferences
+            with pytest.raises(TimeoutError):
+                await pool.query("sleep(10)")
+            # the killed worker is replaced
+            assert len(await pool.query('parent("Dirk Donohue", X)')) == 2
+
+    asyncio.run(run())
+
+
+def test_prolog_query_pools_are_isolated():
+    # each pool has its own Prolog engines, so databases of several splits can be queried at once
+    async def run():
+        async with PrologQueryPool(str(DATABASE_SMALL_PATH)) as pool1, PrologQueryPool(
+            str(DATABASE_TEST_PATH)
+        ) as pool2:
+            return await asyncio.gather(pool1.query("type(X, person)"), pool2.query("type(X, person)"))
+
+    results1, results2 = asyncio.run(run())
+    assert len(results1) == 27
+    assert results2 == [{"X": "alice"}]
+
+
+def test_aget_prolog_results():
+    responses = [
+        LLMChatResponse(pred='?- parent(X, "Mason Donohue"), sibling(X, Y).', usage={}),
+        LLMChatResponse(pred='?- parent(X, "Mason Donohue"), parent(X', usage={}),
+    ]
+
+    async def run():
+        async with PrologQueryPool(str(DATABASE_SMALL_PATH)) as pool:
+            return await aget_prolog_results(responses, pool, logging.getLogger(__name__), debug=True)
+
+    results = asyncio.run(run())
+    assert [len(r["query_results"]) for r in results] == [2, 2]
+    assert results[0]["final_value"]
+    assert "error" in results[1]["query_results"][-1]
+
+
+def test_split_prolog_query():
+    assert split_prolog_query("?- hobby(X, 'bus spotting, hiking'), member(Y, [X, Z]).") == (
+        ["hobby(X, 'bus spotting, hiking')", "member(Y, [X, Z])"],
+        "Z",
+    )
+    # variable-like text inside quotes is not a variable
+    assert split_prolog_query("hobby(Y_2, 'Bus Spotting')")[1] == "Y_2"
+    assert split_prolog_query('aggregate_all(count, distinct(friend("A, B", Y)), Count)') == (
+        ['aggregate_all(count, distinct(friend("A, B", Y)), Count)'],
+        "Count",
+    )
+    # truncated queries keep the remaining text as the last goal
+    assert parse_prolog_query('parent(X, "Mason Donohue"), parent(X') == [
+        'parent(X, "Mason Donohue")',
+        "parent(X",
+    ]
+    # operators that bind more loosely than the comma prevent splitting at the top level
+    for query in ["a(X), b(X) ; c(X)", "a(X) -> b(X), c(X) ; d(X)", "\\+ a(X), b(X)", "a(X), b(X) | c(X)"]:
+        assert parse_prolog_query(f"?- {query}.") == [query]
+    # but not inside brackets or quotes
+    assert parse_prolog_query("(a(X) ; b(X)), c(X, ';'), findall(Y, \\+ (d(Y) -> e(Y)), L)") == [
+        "(a(X) ; b(X))",
+        "c(X, ';')",
+        "findall(Y, \\+ (d(Y) -> e(Y)), L)",
+    ]
+
+
+def test_get_prolog_results_debug_matches_compound_query():
+    db = Database.from_disk(DATABASE_SMALL_PATH)
+    query = 'parent(X, "Mason Donohue"), sibling(X, Y), parent(Z, Y), hobby(Z, H)'
+    responses = [LLMChatResponse(pred=f"?- {query}.", usage={})]
+    results = get_prolog_results(responses, db, logging.getLogger(__name__), debug=True)
+
+    query_results = results[0]["query_results"]
+    assert [r["sub_query_added"] for r in query_results] == parse_prolog_query(query)
+    # each step has the same results as the compound query up to that step
+    for step in query_results:
+        expected = [{k: str(decode(v)) for k, v in r.items()} for r in db.query(step["query"])]
+        assert step["result"] == expected
+        assert step["num_results"] == len(expected)
+    assert results[0]["final_value"]
+
+
+def test_get_prolog_results_debug_top_level_disjunction():
+    db = Database.from_disk(DATABASE_SMALL_PATH)
+    # read as (parent(...), sibling(...)) ; parent(...), not as parent(...), (sibling(...) ; parent(...))
+    query = 'parent(X, "Mason Donohue"), sibling(X, Y) ; parent(Y, "Mason Donohue")'
+    responses = [LLMChatResponse(pred=f"?- {query}.", usage={})]
+    logger = logging.getLogger(__name__)
+    debug_results = get_prolog_results(responses, db, logger, debug=True)
+    results = get_prolog_results(responses, db, logger, debug=False)
+
+    assert [r["sub_query_added"] for r in debug_results[0]["query_results"]] == [query]
+    assert debug_results[0]["query_results"][0]["result"] == results[0]["query_results"][0]["result"]
+    assert set(debug_results[0]["final_value"].split(",")) == set(results[0]["final_value"].split(","))
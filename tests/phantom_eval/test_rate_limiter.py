@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+
+from phantom_eval.llm.common import get_total_tokens
+from phantom_eval.llm.rate_limiter import TokenBucketRateLimiter
+
+
+def test_rate_limiter_requests():
+    # 60 RPM: a burst of 60 requests, then 1 request per second
+    limiter = TokenBucketRateLimiter(rpm_limit=60, tpm_limit=1_000_000)
+
+    async def run():
+        start = time.time()
+        await asyncio.gather(*[limiter.acquire(1) for _ in range(60)])
+        assert time.time() - start < 0.1
+        await limiter.acquire(1)
+        return time.time() - start
+
+    assert 0.9 < asyncio.run(run()) < 1.5
+
+
+def test_rate_limiter_tokens():
+    # 600 TPM: 10 tokens per second
+    limiter = TokenBucketRateLimiter(rpm_limit=1000, tpm_limit=600)
+
+    async def run():
+        await limiter.acquire(600)
+        start = time.time()
+        await limiter.acquire(5)
+        return time.time() - start
+
+    assert 0.4 < asyncio.run(run()) < 1.0
+    with pytest.raises(ValueError):
+        asyncio.run(limiter.acquire(601))
+
+
+def test_rate_limiter_reconcile():
+    limiter = TokenBucketRateLimiter(rpm_limit=1000, tpm_limit=600, utilization=0.5)
+    assert limiter.token_capacity == 300
+    asyncio.run(limiter.acquire(100))
+    # the response used more tokens than estimated, so the bucket is overdrawn by ~100 tokens
+    limiter.reconcile(estimated_tokens=100, actual_tokens=400)
+    assert limiter.state["tokens"] == pytest.approx(-100, abs=1)
+    # 5 tokens per second, so 1 more token takes ~20 seconds
+    assert limiter._try_acquire(limiter.state, 1) == pytest.approx(20.2, abs=0.5)
+
+
+def test_rate_limiter_shared_state(tmp_path):
+    # limiters (e.g. in different processes) with the same state file share a quota
+    state_fpath = str(tmp_path / "rate_limits.json")
+    limiter1 = TokenBucketRateLimiter(rpm_limit=60, tpm_limit=1000, state_fpath=state_fpath)
+    limiter2 = TokenBucketRateLimiter(rpm_limit=60, tpm_limit=1000, state_fpath=state_fpath)
+
+    asyncio.run(limiter1.acquire(1000))
+    assert limiter2._transact(lambda state: limiter2._try_acquire(state, 1)) > 0
+    # the in-memory state is unused
+    assert limiter2.state["tokens"] == 1000
+
+
+def test_get_total_tokens():
+    assert get_total_tokens({"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}) == 15
+    assert get_total_tokens({"input_tokens": 10, "output_tokens": 5}) == 15
+    assert get_total_tokens({"prompt_token_count": 10, "total_token_count": 15}) == 15
+    assert get_total_tokens({}) is None
@@ -0,0 +1,110 @@
+import asyncio
+
+from phantom_eval.llm import (
+    ContentTextMessage,
+    Conversation,
+    InferenceGenerationConfig,
+    LLMChat,
+    LLMChatResponse,
+    Message,
+)
+from phantom_eval.llm.response_cache import CachedLLMChat, LLMResponseCache
+
+
+class CountingChat(LLMChat):
+    """Mock class that echoes the prompt and counts the generated responses"""
+
+    def __init__(self):
+        super().__init__("mock_model")
+        self.num_responses = 0
+
+    async def generate_response(
+        self, conv: Conversation, inf_gen_config: InferenceGenerationConfig
+    ) -> LLMChatResponse:
+        self.num_responses += 1
+        return LLMChatResponse(pred=conv.messages[0].content[0].text, usage={"total_tokens": 10})
+
+    async def batch_generate_response(
+        self, convs: list[Conversation], inf_gen_config: InferenceGenerationConfig
+    ) -> list[LLMChatResponse]:
+        return [await self.generate_response(conv, inf_gen_config) for conv in convs]
+
+
+def make_conv(text: str) -> Conversation:
+    return Conversation(messages=[Message(role="user", content=[ContentTextMessage(text=text)])])
+
+
+def test_response_cache(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    llm_chat = CountingChat()
+    cached_llm_chat = CachedLLMChat(llm_chat, LLMResponseCache(db_path))
+    inf_gen_config = InferenceGenerationConfig()
+
+    responses = asyncio.run(
+        cached_llm_chat.batch_generate_response([make_conv("a"), make_conv("b")], inf_gen_config)
+    )
+    assert [r.usage["cache_hit"] for r in responses] == [0, 0]
+
+    # the cache persists across objects, and the uid of the conversation is not part of the key
+    cached_llm_chat = CachedLLMChat(llm_chat, LLMResponseCache(db_path))
+    responses = asyncio.run(
+        cached_llm_chat.batch_generate_response([make_conv("a"), make_conv("c")], inf_gen_config)
+    )
+    assert [r.pred for r in responses] == ["a", "c"]
+    assert [r.usage for r in responses] == [{"total_tokens": 10, "cache_hit": 1}] + [
+        {"total_tokens": 10, "cache_hit": 0}
+    ]
+    assert llm_chat.num_responses == 3
+    assert cached_llm_chat.cache.get_stats()["hits"] == 1
+
+    # a different seed is a different request
+    asyncio.run(cached_llm_chat.generate_response(make_conv("a"), InferenceGenerationConfig(seed=1)))
+    assert llm_chat.num_responses == 4
+    # but the retry parameters are not part of the request
+    asyncio.run(
+        cached_llm_chat.generate_response(
+            make_conv("a"), InferenceGenerationConfig(seed=1, max_retries=10, wait_seconds=5)
+        )
+    )
+    assert llm_chat.num_responses == 4
+    # responses with a nonzero temperature are not cached by default
+    for _ in range(2):
+        asyncio.run(
+            cached_llm_chat.generate_response(make_conv("a"), InferenceGenerationConfig(temperature=1))
+        )
+    assert llm_chat.num_responses == 6
+    # other attributes are delegated to the wrapped object
+    assert cached_llm_chat.num_responses == 6
+
+
+def test_response_cache_model_id(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.db"))
+    inf_gen_config = InferenceGenerationConfig()
+    # same model name, but different LoRA adapters
+    base_llm_chat = CachedLLMChat(CountingChat(), cache, model_id="vllm:mock_model")
+    lora_llm_chat = CachedLLMChat(CountingChat(), cache, model_id="vllm:mock_model:lora_path=adapters/a")
+    assert base_llm_chat.model_name == lora_llm_chat.model_name
+
+    for llm_chat in [base_llm_chat, lora_llm_chat]:
+        response = asyncio.run(llm_chat.generate_response(make_conv("a"), inf_gen_config))
+        assert response.usage["cache_hit"] == 0
+        response = asyncio.run(llm_chat.batch_generate_response([make_conv("a")], inf_gen_config))[0]
+        assert response.usage["cache_hit"] == 1
+        assert llm_chat.num_responses == 1
+    assert cache.get_stats()["responses"] == 2
+
+    # the model id defaults to the model name
+    assert CachedLLMChat(CountingChat(), cache).model_id == "mock_model"
+
+
+def test_response_cache_eviction(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.db"), max_size_mb=1000 / 1024 / 1024)
+    response = LLMChatResponse(pred="x" * 200, usage={})
+    for i in range(10):
+        cache.put(str(i), "mock_model", response)
+        # access the first response, so that it is the most recently used
+        assert cache.get("0") is not None
+    assert cache.get_stats()["size"] <= 1000
+    assert cache.get("0") is not None
+    assert cache.get("9") is not None
+    assert cache.get("1") is None
@@ -0,0 +1,31 @@
+import itertools
+
+import numpy as np
+
+from phantom_eval.score import batch_scores, exact_match, f1, precision, recall, scores
+
+ANSWERS = ["Alice", " alice ", "Bob", "Alice,Bob", "bob, carol", "", "Carol,alice,Dave", "dave,,"]
+
+
+def test_scores():
+    assert scores("Alice, Bob", "bob,alice") == {"EM": True, "precision": 1.0, "recall": 1.0, "f1": 1.0}
+    assert scores("Alice,Eve", "Alice,Bob,Carol") == {
+        "EM": False,
+        "precision": 0.5,
+        "recall": 1 / 3,
+        "f1": 2 * 0.5 * (1 / 3) / (0.5 + 1 / 3),
+    }
+    assert scores("Eve", "Alice")["f1"] == 0
+
+
+def test_batch_scores_matches_scalar_scores():
+    preds, trues = zip(*itertools.product(ANSWERS, ANSWERS))
+    # columns can be lists, NumPy arrays or pandas Series
+    results = batch_scores(list(preds), np.array(trues, dtype=object))
+    for i, (pred, true) in enumerate(zip(preds, trues)):
+        assert results["EM"][i] == exact_match(pred, true)
+        assert results["precision"][i] == precision(pred, true)
+        assert results["recall"][i] == recall(pred, true)
+        assert results["f1"][i] == f1(pred, true)
+
+    assert len(batch_scores([], [])["f1"]) == 0
@@ -0,0 +1,91 @@
+"""Tests for batching concurrent calls in vLLM offline mode, without loading a model
+"""
+
+import asyncio
+
+from phantom_eval.llm import (
+    ContentTextMessage,
+    Conversation,
+    InferenceGenerationConfig,
+    LLMChatResponse,
+    Message,
+)
+from phantom_eval.llm.vllm import VLLMChat
+
+
+class MockVLLMChat(VLLMChat):
+    """Mock class that echoes the prompts of each offline batch instead of calling `llm.generate`"""
+
+    def __init__(self, error: Exception | None = None):
+        # NOTE: skip loading the model
+        self.use_api = False
+        self._offline_requests = []
+        self._offline_batch_task = None
+        self.error = error
+        self.batches = []
+
+    def _generate_offline(self, convs: list[Conversation], sampling_params: list) -> list[LLMChatResponse]:
+        self.batches.append([conv.messages[0].content[0].text for conv in convs])
+        assert len(sampling_params) == len(convs)
+        if self.error is not None:
+            raise self.error
+        return [
+            LLMChatResponse(pred=conv.messages[0].content[0].text, usage={"stop": params.stop})
+            for conv, params in zip(convs, sampling_params)
+        ]
+
+
+def make_conv(text: str) -> Conversation:
+    return Conversation(messages=[Message(role="user", content=[ContentTextMessage(text=text)])])
+
+
+async def run_agent(llm_chat: VLLMChat, agent_id: int, num_steps: int) -> list[LLMChatResponse]:
+    """Mock multi-turn agent that waits for the response of each step before the next one"""
+    responses = []
+    for step in range(num_steps):
+        config = InferenceGenerationConfig(stop_sequences=[f"Step {step + 1}"])
+        responses.append(await llm_chat.generate_response(make_conv(f"{agent_id}-{step}"), config))
+        # e.g. execute the action of the step
+        await asyncio.sleep(0)
+    return responses
+
+
+def test_offline_batches():
+    llm_chat = MockVLLMChat()
+    num_steps = [5, 5, 3, 2, 1]
+
+    async def run():
+        return await asyncio.gather(*[run_agent(llm_chat, i, n) for i, n in enumerate(num_steps)])
+
+    results = asyncio.run(run())
+
+    # one batch per step, with the agents that are not finished yet
+    assert [len(batch) for batch in llm_chat.batches] == [5, 4, 3, 2, 2]
+    assert llm_chat.batches[2] == ["0-2", "1-2", "2-2"]
+    # each agent gets its own responses, generated with its own sampling params
+    for i, responses in enumerate(results):
+        assert [r.pred for r in responses] == [f"{i}-{step}" for step in range(num_steps[i])]
+        assert [r.usage["stop"][0] for r in responses] == [f"Step {step + 1}" for step in range(num_steps[i])]
+    assert llm_chat._offline_batch_task is None
+
+
+def test_offline_batches_error():
+    llm_chat = MockVLLMChat(error=RuntimeError("CUDA out of memory"))
+
+    async def run():
+        return await asyncio.gather(
+            *[run_agent(llm_chat, i, 2) for i in range(3)],
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+
+    # the error of the batch reaches every agent waiting for it
+    assert len(llm_chat.batches) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert llm_chat._offline_batch_task is None
+
+    # later requests start a new batch
+    llm_chat.error = None
+    assert asyncio.run(run_agent(llm_chat, 0, 1))[0].pred == "0-0"
+    assert llm_chat.batches[-1] == ["0-0"]
@@ -0,0 +1,130 @@
+"""Benchmarks question sampling and answering with and without tabled rules.
+
+For each universe size, the untabled rules are run first. The tabled rules then answer the same queries,
+and the answers are checked to be equal (as sets) before the timings are reported.
+
+Usage:
+    python -m tests.phantom_wiki.facts.benchmark_tabling --sizes 500 5000
+"""
+import argparse
+import copy
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+from phantom_wiki.facts import get_database
+from phantom_wiki.facts.attributes import db_generate_attributes
+from phantom_wiki.facts.family import db_generate_family
+from phantom_wiki.facts.friends import db_generate_friendships
+from phantom_wiki.facts.sample import sample_question
+from phantom_wiki.facts.templates import generate_templates
+from phantom_wiki.utils.get_answer import get_answer
+
+
+def run(size: int, tabled: bool, seed: int, num_questions_per_type: int, queries: list = None) -> dict:
+    """Samples and answers questions on a universe with `size` people.
+
+    If queries are given, they are answered instead of the sampled ones.
+    """
+    db = get_database(tabled=tabled)
+    db_generate_family(
+        db,
+        seed=seed,
+        duplicate_names=False,
+        debug=False,
+        output_dir=None,
+        visualize=False,
+        max_family_tree_depth=20,
+        max_branching_factor=5,
+        max_family_tree_size=size,
+        stop_prob=0.0,
+        num_family_trees=1,
+    )
+    db_generate_friendships(db, friendship_k=5, friendship_seed=seed, visualize=False, output_dir=None)
+    db_generate_attributes(db, seed)
+
+    # Count the queries sent to the database
+    num_queries = 0
+    query = db.query
+
+    def counting_query(q: str) -> list[dict]:
+        nonlocal num_queries
+        num_queries += 1
+        return query(q)
+
+    db.query = counting_query
+
+    templates = generate_templates(depth=6)
+    person_name_bank = db.get_person_names()
+    attr_cache, relation_cache = {}, {}
+    start = time.time()
+    sampled_queries = []
+    for question_template, query_template, _ in templates:
+        rng = np.random.default_rng(seed)
+        sampled_queries.append(
+            [
+                sample_question(
+                    question_template,
+                    query_template,
+                    rng,
+                    db,
+                    person_name_bank,
+                    attr_cache,
+                    relation_cache,
+                    easy_mode=False,
+                    num_sampling_attempts=100,
+                )[1]
+                for _ in range(num_questions_per_type)
+            ]
+        )
+    sample_time = time.time() - start
+    sample_queries = num_queries
+
+    if queries is None:
+        queries = sampled_queries
+    num_queries = 0
+    start = time.time()
+    _, final_results = get_answer(
+        copy.deepcopy(queries), db, [t[2] for t in templates], skip_solution_traces=True
+    )
+    answer_time = time.time() - start
+
+    return {
+        "size": len(person_name_bank),
+        "tabled": tabled,
+        "sample_queries": sample_queries,
+        "sample_time": sample_time,
+        "answer_queries": num_queries,
+        "answer_time": answer_time,
+        "queries": queries,
+        "answers": [[sorted(set(r)) for r in results] for results in final_results],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 5000])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--num-questions-per-type", type=int, default=10)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        # pyswip uses a single Prolog engine per process, so each run gets a fresh process
+        kwargs = dict(size=size, seed=args.seed, num_questions_per_type=args.num_questions_per_type)
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            untabled = executor.submit(run, tabled=False, **kwargs).result()
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            tabled = executor.submit(run, tabled=True, queries=untabled["queries"], **kwargs).result()
+        assert untabled["answers"] == tabled["answers"], f"Tabled answers differ for size {size}"
+        for result in [untabled, tabled]:
+            rows.append({k: v for k, v in result.items() if k not in ["queries", "answers"]})
+
+    print(pd.DataFrame(rows).to_markdown(index=False, floatfmt=".3f"))
+
+
+if __name__ == "__main__":
+    main()
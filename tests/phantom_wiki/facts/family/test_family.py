@@ -1,5 +1,6 @@
 from pyswip import Prolog
 
+from phantom_wiki.facts.family import FAMILY_RULES_BASE_PATH
 from tests.phantom_wiki.facts import DATABASE_SMALL_107
 
 
@@ -189,3 +190,15 @@ def test_family_rules_inlaws():
     assert compare_prolog_dicts(
         list(prolog.query("sister_in_law('Aubrey Leibowitz', X)")), [{"X": "Adele Ervin"}]
     )
+
+
+def test_family_rules_base_reverse_mode():
+    # the rules take a different path when only the second argument is bound,
+    # which must give the same answers as the forward mode
+    prolog.consult(FAMILY_RULES_BASE_PATH)
+    people = {r["X"] for r in prolog.query("parent(X, _)")} | {r["Y"] for r in prolog.query("parent(_, Y)")}
+    for relation in ["sibling", "married", "sister", "brother", "wife", "husband"]:
+        pairs = prolog_result_set(list(prolog.query(f"{relation}(X, Y)")))
+        for person in people:
+            reverse = {r["X"] for r in prolog.query(f"{relation}(X, '{person}')")}
+            assert reverse == {x for (_, x), (_, y) in pairs if y == person}
@@ -0,0 +1,56 @@
+import random
+
+from phantom_wiki.facts.family.generate import Generator, PersonFactory, family_tree_to_facts
+
+GENERATE_KWARGS = dict(
+    max_family_tree_depth=5,
+    max_branching_factor=5,
+    max_family_tree_size=30,
+    stop_prob=0.0,
+    num_family_trees=20,
+    debug=False,
+    output_dir=None,
+)
+
+
+def _generate_facts(num_partitions: int, seed: int) -> list[str]:
+    family_trees = Generator(PersonFactory(False)).generate(
+        **GENERATE_KWARGS, num_partitions=num_partitions, seed=seed
+    )
+    return [fact for family_tree in family_trees for fact in family_tree_to_facts(family_tree)]
+
+
+def test_generate_partitioned():
+    facts = _generate_facts(num_partitions=4, seed=1)
+    assert len([fact for fact in facts if fact.startswith("type(")]) > 20
+
+    # reproducible given the seed and number of partitions
+    assert facts == _generate_facts(num_partitions=4, seed=1)
+    assert facts != _generate_facts(num_partitions=4, seed=2)
+
+
+def test_generate_partitioned_disjoint_last_names():
+    family_trees = Generator(PersonFactory(False)).generate(**GENERATE_KWARGS, num_partitions=4, seed=1)
+    # trees in different partitions draw from disjoint pools of last names
+    last_names = [{p.surname for p in family_tree} for family_tree in family_trees]
+    for i in range(len(family_trees)):
+        for j in range(len(family_trees)):
+            if i % 4 != j % 4:
+                assert last_names[i].isdisjoint(last_names[j])
+
+
+def test_sample_family_tree_frontier():
+    generator = Generator(PersonFactory(False), rng=random.Random(1))
+    generator.person_factory.rng = generator.rng
+    for _ in range(5):
+        family_tree = generator._sample_family_tree_frontier(
+            max_family_tree_depth=2, max_branching_factor=2, max_family_tree_size=300, stop_prob=0.0
+        )
+        # the tree respects the constraints
+        levels = [p.tree_level for p in family_tree]
+        assert max(levels) - min(levels) <= 2
+        assert all(len(p.children) <= 2 for p in family_tree)
+        assert 300 <= len(family_tree) <= 301
+
+    # every sampling step expands the tree, except for dropping persons at the boundary levels
+    assert generator.num_expansions / generator.num_attempts > 0.9
@@ -0,0 +1,59 @@
+import random
+
+from phantom_wiki.facts.family.generate import Generator, family_tree_to_facts
+from phantom_wiki.facts.family.person_factory import FamilyTree, NamePool, PersonFactory
+
+
+def test_name_pool_matches_list():
+    rng = random.Random(0)
+    for n in [1, 7, 954]:
+        names = [f"name{i}" for i in range(n)]
+        pool = NamePool(names)
+        reference = list(names)
+        for step in range(3 * n):
+            if rng.random() < 0.7 and reference:
+                index = rng.randrange(len(reference))
+                assert pool.pop(index) == reference.pop(index)
+            else:
+                pool.append(f"appended{step}")
+                reference.append(f"appended{step}")
+            assert len(pool) == len(reference)
+        assert [pool[i] for i in range(len(pool))] == reference
+        # the base list is shared, not modified
+        assert names == [f"name{i}" for i in range(n)]
+
+
+def test_name_pool_discard():
+    pool = NamePool(["a", "b", "c", "d"])
+    pool.discard(1)
+    pool.discard(1)
+    pool.discard(3)
+    assert [pool[i] for i in range(len(pool))] == ["a", "c"]
+    # random.choice only relies on len and indexing
+    assert random.Random(0).choice(pool) in ["a", "c"]
+
+
+def test_family_tree_from_persons():
+    person_factory = PersonFactory(False, rng=random.Random(1))
+    persons = Generator(person_factory, rng=person_factory.rng)._sample_family_tree(
+        max_family_tree_depth=5, max_branching_factor=5, max_family_tree_size=30, stop_prob=0.0
+    )
+    family_tree = FamilyTree.from_persons(persons)
+    assert len(family_tree) == len(persons)
+
+    def full_names(people) -> list[str]:
+        return [p.get_full_name() for p in people]
+
+    # the views have the same attributes as the persons
+    for person, view in zip(persons, family_tree):
+        assert view.get_full_name() == person.get_full_name()
+        assert view.female == person.female
+        assert view.tree_level == person.tree_level
+        assert view.date_of_birth == person.date_of_birth
+        assert full_names(view.parents) == full_names(person.parents)
+        assert full_names(view.children) == full_names(person.children)
+        assert (view.married_to is None) == (person.married_to is None)
+        if person.married_to is not None:
+            assert view.married_to.get_full_name() == person.married_to.get_full_name()
+
+    assert family_tree_to_facts(family_tree) == family_tree_to_facts(persons)
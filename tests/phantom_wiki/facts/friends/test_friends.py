@@ -0,0 +1,116 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from phantom_wiki.facts.friends.generate import (
+    create_friendship_graph,
+    get_family_tree_labels,
+    sample_barabasi_albert_edges,
+    sample_gnp_edges,
+    sample_stochastic_block_edges,
+    sample_watts_strogatz_edges,
+)
+
+
+def _assert_simple_graph(src, dst):
+    """Checks that the edges have no self-loops or duplicates, and are sorted with src < dst."""
+    assert np.all(src < dst)
+    edges = list(zip(src.tolist(), dst.tolist()))
+    assert edges == sorted(set(edges))
+
+
+def test_sample_gnp_edges_matches_networkx():
+    for n, p, seed in [(2, 0.5, 1), (27, 0.1, 1), (100, 0.03, 5), (500, 0.02, 3), (10, 1.0, 1), (10, 0.0, 1)]:
+        src, dst = sample_gnp_edges(n, p, seed)
+        G = nx.fast_gnp_random_graph(n=n, p=p, seed=seed)
+        assert list(zip(src.tolist(), dst.tolist())) == list(G.edges)
+
+
+def test_create_friendship_graph():
+    names = ["Alice", "Bob", "Carol", "Dave", "Eve", "Frank"]
+    facts = create_friendship_graph(names, k=3, seed=1)
+
+    # Reference: previous implementation based on networkx
+    G = nx.fast_gnp_random_graph(n=len(names), p=3 / len(names), seed=1)
+    G = nx.relabel_nodes(G, {i: name for i, name in enumerate(names)})
+    assert facts == [f'friend_("{i}", "{j}")' for i, j in G.edges]
+
+    assert create_friendship_graph([], k=3, seed=1) == []
+
+
+def test_sample_barabasi_albert_edges():
+    n, m = 2000, 2
+    src, dst = sample_barabasi_albert_edges(n, m, seed=1)
+    _assert_simple_graph(src, dst)
+    # each node only attaches to earlier nodes
+    assert dst.max() < n
+    assert 2 * len(src) / n == pytest.approx(2 * m, rel=0.1)
+    # preferential attachment produces hubs
+    degree = np.bincount(np.concatenate([src, dst]), minlength=n)
+    assert degree.max() > 10 * 2 * m
+
+    src2, dst2 = sample_barabasi_albert_edges(n, m, seed=1)
+    assert np.array_equal(src, src2) and np.array_equal(dst, dst2)
+
+
+def test_sample_watts_strogatz_edges():
+    n, k = 1000, 4
+    src, dst = sample_watts_strogatz_edges(n, k, seed=1, rewire_prob=0.0)
+    G = nx.watts_strogatz_graph(n, k, p=0.0)
+    assert sorted(zip(src.tolist(), dst.tolist())) == sorted(tuple(sorted(e)) for e in G.edges)
+
+    src, dst = sample_watts_strogatz_edges(n, k, seed=1, rewire_prob=0.2)
+    _assert_simple_graph(src, dst)
+    assert 2 * len(src) / n == pytest.approx(k, rel=0.05)
+
+
+def test_odd_k_average_degree():
+    n = 2000
+    for k in [1, 3, 5]:
+        src, dst = sample_barabasi_albert_edges(n, k / 2, seed=1)
+        _assert_simple_graph(src, dst)
+        assert 2 * len(src) / n == pytest.approx(k, rel=0.1)
+
+        src, dst = sample_watts_strogatz_edges(n, k, seed=1, rewire_prob=0.0)
+        _assert_simple_graph(src, dst)
+        assert 2 * len(src) / n == k
+
+        src, dst = sample_watts_strogatz_edges(n, k, seed=1, rewire_prob=0.2)
+        assert 2 * len(src) / n == pytest.approx(k, rel=0.05)
+
+    # the default --friendship-k is 3
+    names = [f"Person {i}" for i in range(n)]
+    for model in ["barabasi-albert", "watts-strogatz"]:
+        facts = create_friendship_graph(names, k=3, seed=1, model=model)
+        assert 2 * len(facts) / n == pytest.approx(3, rel=0.1), model
+
+
+def test_sample_stochastic_block_edges():
+    blocks = np.repeat(np.arange(100), 20)
+    k = 4
+    src, dst = sample_stochastic_block_edges(blocks, k, seed=1, intra_block_frac=0.5)
+    _assert_simple_graph(src, dst)
+    assert 2 * len(src) / len(blocks) == pytest.approx(k, rel=0.1)
+    assert np.mean(blocks[src] == blocks[dst]) == pytest.approx(0.5, abs=0.05)
+
+
+def test_get_family_tree_labels():
+    names = ["A", "B", "C", "D", "E"]
+    labels = get_family_tree_labels(names, [("B", "A"), ("C", "A"), ("E", "D")])
+    assert labels[0] == labels[1] == labels[2]
+    assert labels[3] == labels[4]
+    assert labels[0] != labels[3]
+
+
+def test_create_friendship_graph_models():
+    names = [f"Person {i}" for i in range(50)]
+    for model in ["barabasi-albert", "watts-strogatz"]:
+        facts = create_friendship_graph(names, k=4, seed=1, model=model)
+        assert len(facts) > 0
+    facts = create_friendship_graph(names, k=4, seed=1, model="stochastic-block", blocks=np.arange(50) // 10)
+    assert len(facts) > 0
+
+    with pytest.raises(ValueError):
+        create_friendship_graph(names, k=4, seed=1, model="stochastic-block")
+    with pytest.raises(ValueError):
+        create_friendship_graph(names, k=4, seed=1, model="unknown")
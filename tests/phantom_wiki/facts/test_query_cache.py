@@ -0,0 +1,50 @@
+from phantom_wiki.facts.database import Database, canonicalize_query
+from tests.phantom_wiki.facts import DATABASE_SMALL_PATH
+
+
+def test_canonicalize_query():
+    assert canonicalize_query('sibling( "Ty Donohue" ,Y).') == ('sibling("Ty Donohue",V0)', {"Y": "V0"})
+    # equivalent goals share a key
+    assert (
+        canonicalize_query("job(Y_4, 'early years teacher'), daughter(Y_4, Y_2)")[0]
+        == canonicalize_query("job(A,'early years teacher'),daughter(A,B)")[0]
+    )
+    # whitespace and variable-like text inside quotes is kept
+    assert canonicalize_query('hobby(X, "Bus  Spotting")')[0] == 'hobby(V0,"Bus  Spotting")'
+    assert canonicalize_query("X is 1 + 2, f(X, _)") == ("V0 is 1 + 2,f(V0,_)", {"X": "V0"})
+    # whitespace before "(" separates a prefix operator from its argument
+    assert canonicalize_query("\\+ (a, b)")[0] == "\\+ (a,b)"
+    assert canonicalize_query("\\+ (a, b)")[0] != canonicalize_query("\\+(a, b)")[0]
+    assert canonicalize_query("X is - (1)")[0] != canonicalize_query("X is -(1)")[0]
+    assert canonicalize_query("f( (a), b)")[0] == canonicalize_query("f((a),b)")[0]
+
+
+def test_query_cache():
+    db = Database.from_disk(DATABASE_SMALL_PATH, cache_size=2)
+    assert db.cache_info() == (0, 0, 2, 0)
+
+    names = set(db.get_person_names())
+    assert set(db.get_person_names()) == names
+    assert db.cache_info().hits == 1
+
+    # a cached equivalent query returns the variable names of the new query
+    siblings = db.query('sibling("Ty Donohue", X)')
+    assert db.query('sibling( "Ty Donohue" , Y ).') == [{"Y": r["X"]} for r in siblings]
+    assert db.cache_info() == (2, 2, 2, 2)
+
+    # results are copies, so mutating them does not change the cache
+    db.query('sibling("Ty Donohue", X)')[0]["X"] = "changed"
+    assert db.query('sibling("Ty Donohue", X)') == siblings
+
+    # least recently used entries are evicted
+    db.query("parent(X, Y)")
+    assert db.cache_info().currsize == 2
+    db.get_person_names()
+    assert db.cache_info().misses == 4
+
+    # the cache is cleared when facts change
+    db.add('type("New Person", person)')
+    assert db.cache_info().currsize == 0
+    assert set(db.get_person_names()) == names | {"New Person"}
+    db.remove('type("New Person", person)')
+    assert set(db.get_person_names()) == names
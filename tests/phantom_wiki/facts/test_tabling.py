@@ -0,0 +1,72 @@
+from phantom_wiki.facts import get_database
+from phantom_wiki.facts.database import get_rule_predicates
+from phantom_wiki.facts.family import FAMILY_RULES_BASE_PATH, FAMILY_RULES_DERIVED_PATH
+from phantom_wiki.facts.friends import FRIENDSHIP_RULES_PATH
+from phantom_wiki.utils import decode
+from tests.phantom_wiki.facts import DATABASE_SMALL_PATH
+
+QUERIES = [
+    "sibling(X, Y)",
+    "cousin(X, Y)",
+    "female_second_cousin(X, Y)",
+    "great_aunt(X, Y)",
+    "friend(X, Y)",
+    'cousin("Ty Donohue", Y)',
+    # only the second argument is bound -> guarded first clause of sibling/2 and married/2
+    'sibling(X, "Ty Donohue")',
+    'married(X, "Mason Donohue")',
+    'sister(X, "Ty Donohue")',
+    'wife(X, "Mason Donohue")',
+    'married("Therese Donohue", "Mason Donohue")',
+]
+# relations with a guarded cut in their first clause, or that call one
+GUARDED_RELATIONS = ["sibling", "married", "sister", "brother", "wife", "husband"]
+
+
+def siblings(db, name: str) -> set[str]:
+    return {decode(r["Y"]) for r in db.query(f'sibling("{name}", Y)')}
+
+
+def test_get_rule_predicates():
+    predicates = get_rule_predicates(FAMILY_RULES_BASE_PATH, FAMILY_RULES_DERIVED_PATH, FRIENDSHIP_RULES_PATH)
+    assert predicates[:4] == ["female/1", "male/1", "nonbinary/1", "sibling/2"]
+    assert {"cousin/2", "female_second_cousin/2", "friend/2"} <= set(predicates)
+    # predicates with several clauses are listed once
+    assert len(predicates) == len(set(predicates))
+
+
+def test_tabled_matches_untabled():
+    db = get_database(DATABASE_SMALL_PATH)
+    expected = [{tuple(sorted(r.items())) for r in db.query(q)} for q in QUERIES]
+    untabled_reverse = {
+        (relation, person): {decode(r["X"]) for r in db.query(f'{relation}(X, "{person}")')}
+        for relation in GUARDED_RELATIONS
+        for person in db.get_person_names()
+    }
+
+    db = get_database(DATABASE_SMALL_PATH, tabled=True)
+    try:
+        # query twice so that the second query is answered from the tables
+        for _ in range(2):
+            assert [{tuple(sorted(r.items())) for r in db.query(q)} for q in QUERIES] == expected
+
+        # the guarded cut selects the same clause in tabled mode, for every bound second argument
+        people = db.get_person_names()
+        for relation in GUARDED_RELATIONS:
+            for person in people:
+                assert {decode(r["X"]) for r in db.query(f'{relation}(X, "{person}")')} == untabled_reverse[
+                    relation, person
+                ], (relation, person)
+
+        # tables are invalidated when facts change
+        assert "New Child" not in siblings(db, "Adele Ervin")
+        db.add('parent("New Child", "Boris Ervin")')
+        assert "New Child" in siblings(db, "Adele Ervin")
+        db.remove('parent("New Child", "Boris Ervin")')
+        assert "New Child" not in siblings(db, "Adele Ervin")
+    finally:
+        # pyswip shares a single Prolog engine, so restore the untabled rules for other tests
+        for predicate in get_rule_predicates(
+            FAMILY_RULES_BASE_PATH, FAMILY_RULES_DERIVED_PATH, FRIENDSHIP_RULES_PATH
+        ):
+            db.query(f"untable({predicate})")